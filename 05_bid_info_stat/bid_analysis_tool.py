@@ -4,16 +4,1616 @@ import pandas as pd
 import numpy as np
 import os
 import threading
+import queue
+import logging
 import openpyxl
 from openpyxl.utils.dataframe import dataframe_to_rows
-from openpyxl.styles import Font, Border, Side, Alignment
+from openpyxl.styles import Font, Border, Side, Alignment, NamedStyle
 import re
 import difflib
 import traceback
+import math
+import itertools
+import hashlib
+import datetime
+import json
+import pathlib
+import sqlite3
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
 # @Time    : 2025/12/04/10:43
 # @Author  : talen
 # @File    : bid_analysis_tool.py
+
+class KeywordMatcher:
+    """
+    多模式关键词匹配器（Aho-Corasick自动机）
+    将 {类别: [关键词, ...]} 编译一次，之后对每段文本只需扫描一遍即可得到各类别命中的关键词个数。
+    计数口径与逐个 `kw in text` 一致：同一关键词在文本中出现多次只算一次；
+    同一类别下重复配置的关键词、以及被多个类别共用的关键词，按配置次数分别计数。
+    """
+    def __init__(self, keyword_map):
+        self.categories = list(keyword_map.keys()) # 保留配置顺序，用于并列时取第一个类别
+        self._goto = [{}] # 状态转移表，下标为状态号，0为根节点
+        self._fail = [0]  # 失配指针
+        self._out = [[]]  # 每个状态可输出的关键词编号（含失配链上的后缀关键词）
+        self._pattern_categories = [] # 关键词编号 -> 所属类别下标列表（按配置次数重复）
+
+        pattern_ids = {}
+        for cat_idx, kws in enumerate(keyword_map.values()):
+            for kw in kws:
+                if not kw:
+                    continue
+                if kw not in pattern_ids:
+                    pattern_ids[kw] = len(self._pattern_categories)
+                    self._pattern_categories.append([])
+                    self._insert(kw, pattern_ids[kw])
+                self._pattern_categories[pattern_ids[kw]].append(cat_idx)
+        self._build_fail_links()
+
+    def _insert(self, kw, pattern_id):
+        state = 0
+        for ch in kw:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._goto[state][ch] = nxt
+            state = nxt
+        self._out[state].append(pattern_id)
+
+    def _build_fail_links(self):
+        # 广度优先构建失配指针，并把失配链上的输出合并到当前状态，扫描时无需再沿链回溯
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                fail_to = self._goto[f].get(ch, 0)
+                self._fail[nxt] = fail_to if fail_to != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def count_hits(self, text):
+        """单遍扫描文本，返回与 categories 对齐的命中关键词个数列表"""
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found.update(out[state])
+        counts = [0] * len(self.categories)
+        for pattern_id in found:
+            for cat_idx in self._pattern_categories[pattern_id]:
+                counts[cat_idx] += 1
+        return counts
+
+    def best_match(self, text, default_val):
+        """返回命中关键词最多的类别，并列时取配置中靠前的类别；均未命中返回默认值"""
+        if not self.categories:
+            return default_val
+        counts = self.count_hits(text)
+        max_hits = max(counts)
+        if max_hits > 0:
+            return self.categories[counts.index(max_hits)]
+        return default_val
+
+class KeywordLabelCache:
+    """
+    分类结果缓存，保存在关键词配置文件同目录下（SQLite），用于每周导入中反复出现的文本（如中标单位的厂商类型）
+    项目所属行业的分类文本由项目名称等多列拼接而成，几乎不会重复出现，不做缓存
+    - labels表以(分类种类, 去除首尾空白的文本)为键，last_used记录最近一次使用的时间戳，
+      条目数超过MAX_ENTRIES时按最久未使用淘汰
+    - keyword_config表记录每个分类种类上次使用的关键词配置快照及其哈希，配置修改后只失效受影响的条目：
+      类别顺序或默认值变化时清空该种类；否则只删除包含增删关键词的缓存文本（其余文本各类别命中数不变）
+    """
+    FILE_NAME = "关键词分类缓存.sqlite"
+    SCHEMA_VERSION = 2
+    LOOKUP_BATCH_SIZE = 500 # 单条IN查询的参数个数上限
+    MAX_ENTRIES = 100000 # 缓存条目数上限
+
+    def __init__(self, config_path):
+        self.path = os.path.join(os.path.dirname(os.path.abspath(config_path)), self.FILE_NAME)
+        self.conn = sqlite3.connect(self.path)
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+            # 旧版本缓存（含项目所属行业、无使用时间）直接丢弃
+            self.conn.executescript("DROP TABLE IF EXISTS keyword_config; DROP TABLE IF EXISTS labels;")
+            self.conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS keyword_config (kind TEXT PRIMARY KEY, config_hash TEXT, snapshot TEXT);
+            CREATE TABLE IF NOT EXISTS labels (kind TEXT, text TEXT, label TEXT, last_used INTEGER, PRIMARY KEY (kind, text));
+            CREATE INDEX IF NOT EXISTS idx_labels_last_used ON labels (last_used);
+        """)
+        self.run_stamp = int(time.time()) # 本次运行中查到或写入的条目记为此时使用
+        self.stats = {} # 分类种类 -> [命中数, 未命中数]
+
+    @staticmethod
+    def _snapshot(keyword_map, default_val):
+        return {
+            "categories": [str(cat) for cat in keyword_map.keys()],
+            "default": default_val,
+            "pairs": sorted([str(cat), kw] for cat, kws in keyword_map.items() for kw in kws if kw),
+        }
+
+    def sync_config(self, kind, keyword_map, default_val):
+        """
+        登记本次使用的关键词配置，与上次不同时失效受影响的缓存条目
+        :return: 失效的条目数（-1表示首次使用该种类）
+        """
+        snapshot = self._snapshot(keyword_map, default_val)
+        snapshot_text = json.dumps(snapshot, ensure_ascii=False)
+        config_hash = hashlib.sha256(snapshot_text.encode("utf-8")).hexdigest()
+        row = self.conn.execute("SELECT config_hash, snapshot FROM keyword_config WHERE kind = ?", (kind,)).fetchone()
+        if row is not None and row[0] == config_hash:
+            return 0
+        invalidated = -1
+        if row is None:
+            self.conn.execute("DELETE FROM labels WHERE kind = ?", (kind,))
+        else:
+            old = json.loads(row[1])
+            if old["categories"] != snapshot["categories"] or old["default"] != snapshot["default"]:
+                invalidated = self.conn.execute("DELETE FROM labels WHERE kind = ?", (kind,)).rowcount
+            else:
+                # 增删（含在类别间移动）的关键词，只有包含它们的文本分类结果可能变化
+                old_pairs = {}
+                for cat, kw in old["pairs"]:
+                    old_pairs.setdefault(kw, []).append(cat)
+                new_pairs = {}
+                for cat, kw in snapshot["pairs"]:
+                    new_pairs.setdefault(kw, []).append(cat)
+                changed = [kw for kw in set(old_pairs) | set(new_pairs) if old_pairs.get(kw) != new_pairs.get(kw)]
+                matcher = KeywordMatcher({"changed": changed})
+                stale = [(kind, text) for (text,) in self.conn.execute("SELECT text FROM labels WHERE kind = ?", (kind,)) if matcher.count_hits(text)[0]]
+                self.conn.executemany("DELETE FROM labels WHERE kind = ? AND text = ?", stale)
+                invalidated = len(stale)
+        self.conn.execute("INSERT OR REPLACE INTO keyword_config (kind, config_hash, snapshot) VALUES (?, ?, ?)", (kind, config_hash, snapshot_text))
+        self.conn.commit()
+        return invalidated
+
+    def classify(self, kind, texts, classify_func):
+        """
+        返回与texts对齐的分类结果：缓存命中的直接取用，未命中的调用classify_func分类后写入缓存
+        文本去除首尾空白后作为键（关键词不含首尾空白，去除后命中结果不变）
+        """
+        keys = [text.strip() for text in texts]
+        cached = {}
+        distinct = list(dict.fromkeys(keys))
+        for start in range(0, len(distinct), self.LOOKUP_BATCH_SIZE):
+            batch = distinct[start:start + self.LOOKUP_BATCH_SIZE]
+            placeholders = ", ".join("?" * len(batch))
+            cached.update(self.conn.execute(f"SELECT text, label FROM labels WHERE kind = ? AND text IN ({placeholders})", [kind] + batch))
+            self.conn.execute(f"UPDATE labels SET last_used = ? WHERE kind = ? AND text IN ({placeholders})", [self.run_stamp, kind] + batch)
+        missed = {key: classify_func(key) for key in distinct if key not in cached}
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO labels (kind, text, label, last_used) VALUES (?, ?, ?, ?)",
+            [(kind, key, label, self.run_stamp) for key, label in missed.items()]
+        )
+        self.conn.commit()
+        stat = self.stats.setdefault(kind, [0, 0])
+        stat[0] += len(distinct) - len(missed)
+        stat[1] += len(missed)
+        cached.update(missed)
+        return [cached[key] for key in keys]
+
+    def prune(self):
+        """条目数超过上限时淘汰最久未使用的条目，返回淘汰的条目数"""
+        excess = self.conn.execute("SELECT COUNT(*) FROM labels").fetchone()[0] - self.MAX_ENTRIES
+        if excess <= 0:
+            return 0
+        self.conn.execute("DELETE FROM labels WHERE rowid IN (SELECT rowid FROM labels ORDER BY last_used LIMIT ?)", (excess,))
+        self.conn.commit()
+        return excess
+
+    def close(self):
+        try:
+            self.prune()
+        finally:
+            self.conn.close()
+
+# 项目名称清洗时去除的常见后缀和干扰词
+PROJECT_NAME_NOISE_WORDS = ["招标", "中标", "成交", "结果", "公告", "公示", "项目", "采购", "关于", "的"]
+
+def clean_project_name(text):
+    """项目名称预处理：去除干扰词、标点和特殊字符"""
+    text = str(text).strip()
+    for kw in PROJECT_NAME_NOISE_WORDS:
+        text = text.replace(kw, "")
+    text = re.sub(r'[^\w\u4e00-\u9fa5]', '', text)
+    return text
+
+def matching_block_ratio(cleaned_new, cleaned_exist):
+    """查重相似度：SequenceMatcher匹配块总长 / 短串长度"""
+    matcher = difflib.SequenceMatcher(None, cleaned_new, cleaned_exist)
+    match_size = sum(block.size for block in matcher.get_matching_blocks())
+    return match_size / min(len(cleaned_new), len(cleaned_exist))
+
+class DifflibSimilarity:
+    """逐对计算SequenceMatcher相似度，不做任何预筛（审计口径）"""
+    name = "difflib"
+
+    def __init__(self):
+        self.compared_count = 0    # 实际计算SequenceMatcher的次数
+        self.prefiltered_count = 0 # 被预筛排除的次数
+
+    def ratio_upper_bounds(self, text, candidates):
+        """各候选相似度的上界，上界未达到阈值的候选不必计算相似度；不做预筛时全部为1"""
+        return np.ones(len(candidates))
+
+    def duplicate_mask(self, cleaned_new, candidates, threshold):
+        """一次对一个新名称和整组候选名称打分，返回各候选是否判定重复"""
+        mask = np.zeros(len(candidates), dtype=bool)
+        survivors = np.flatnonzero(self.ratio_upper_bounds(cleaned_new, candidates) > threshold)
+        self.prefiltered_count += len(candidates) - len(survivors)
+        for j in survivors:
+            self.compared_count += 1
+            mask[j] = matching_block_ratio(cleaned_new, candidates[j]) > threshold
+        return mask
+
+class BitParallelLcsSimilarity(DifflibSimilarity):
+    """
+    位并行LCS预筛 + SequenceMatcher复核
+    匹配块是两串的公共子序列，匹配块总长不超过LCS长度，因此 LCS/短串长度 未超过阈值的候选不可能重复。
+    LCS按Hyyrö位向量算法计算：新名称各字符位置编码到uint64字（超过64字时多字进位），
+    所有候选名称按列对齐后逐字符同时推进，一次调用得到整组候选的LCS长度。
+    只有通过预筛的少数候选再用SequenceMatcher复核，判定结果与difflib口径完全一致。
+    """
+    name = "lcs"
+
+    def __init__(self, min_batch=4):
+        super().__init__()
+        self.min_batch = min_batch # 候选数少于该值时numpy开销大于收益，直接逐对复核
+
+    @staticmethod
+    def lcs_lengths(pattern, texts):
+        """返回pattern与texts中每个字符串的LCS长度"""
+        m, n = len(pattern), len(texts)
+        if m == 0 or n == 0:
+            return np.zeros(n, dtype=np.int64)
+        n_words = (m + 63) // 64
+        # 字符 -> 位掩码，编号0保留给pattern中不存在的字符（掩码全0）
+        char_codes = {}
+        for ch in pattern:
+            char_codes.setdefault(ch, len(char_codes) + 1)
+        peq = np.zeros((len(char_codes) + 1, n_words), dtype=np.uint64)
+        for i, ch in enumerate(pattern):
+            peq[char_codes[ch], i // 64] |= np.uint64(1) << np.uint64(i % 64)
+        # 候选名称按列对齐，短的用0补齐（补齐位不改变状态）
+        max_len = max(len(t) for t in texts)
+        codes = np.zeros((n, max_len), dtype=np.intp)
+        for j, t in enumerate(texts):
+            codes[j, :len(t)] = [char_codes.get(ch, 0) for ch in t]
+
+        top_bits = m - 64 * (n_words - 1)
+        top_mask = np.uint64((1 << top_bits) - 1)
+        v = np.full((n, n_words), 0xFFFFFFFFFFFFFFFF, dtype=np.uint64)
+        v[:, -1] &= top_mask
+        for i in range(max_len):
+            u = v & peq[codes[:, i]]
+            # V' = (V + U) | (V - U)，U是V的子集，V - U 等于 V ^ U；加法按字从低到高传递进位
+            total = np.empty_like(v)
+            carry = np.zeros(n, dtype=np.uint64)
+            for w in range(n_words):
+                t = v[:, w] + u[:, w]
+                s = t + carry
+                total[:, w] = s
+                carry = ((t < v[:, w]) | (s < t)).astype(np.uint64)
+            v = total | (v ^ u)
+            v[:, -1] &= top_mask
+        return m - np.bitwise_count(v).sum(axis=1).astype(np.int64)
+
+    def ratio_upper_bounds(self, text, candidates):
+        """LCS/短串长度；任一方为空串时为0"""
+        if len(candidates) < self.min_batch:
+            return super().ratio_upper_bounds(text, candidates)
+        shorter = np.minimum(len(text), np.array([len(c) for c in candidates]))
+        lcs = self.lcs_lengths(text, candidates)
+        return np.divide(lcs, shorter, out=np.zeros(len(candidates)), where=shorter > 0)
+
+# 查重相似度后端：lcs为默认（位并行预筛+复核），difflib为审计口径（逐对计算）
+SIMILARITY_BACKENDS = {
+    DifflibSimilarity.name: DifflibSimilarity,
+    BitParallelLcsSimilarity.name: BitParallelLcsSimilarity,
+}
+
+class ProjectDedupIndex:
+    """
+    项目查重索引，候选项目从项目清单索引库(ProjectLedgerDB)按索引查询
+    - 已有项目名称入库时预先清洗，只清洗一次
+    - 按(中标单位, 招标单位, 金额区间)走联合索引取候选，不再遍历整个中标单位的项目列表
+    - 候选名称整组交给相似度后端一次打分（见SIMILARITY_BACKENDS）
+    判定规则与逐条比对一致：
+    招标单位、中标单位相同，金额相差<0.001，清洗后名称(均不少于4个字)匹配块总长/短串长度>0.85
+    """
+    def __init__(self, ledger_db, threshold=0.85, min_len=4, amount_tol=0.001, backend="lcs"):
+        self.ledger_db = ledger_db
+        self.threshold = threshold
+        self.min_len = min_len
+        self.amount_tol = amount_tol
+        self.similarity = SIMILARITY_BACKENDS[backend]()
+
+    @property
+    def compared_count(self):
+        return self.similarity.compared_count
+
+    @property
+    def prefiltered_count(self):
+        return self.similarity.prefiltered_count
+
+    def cleaned_name(self, amount, project):
+        """满足查重条件时返回清洗后的项目名称；名称为空、金额不是有限数值、清洗后太短（避免误判）的不查重，返回None"""
+        if not project or pd.isna(project) or not math.isfinite(amount):
+            return None
+        cleaned = clean_project_name(project)
+        return cleaned if len(cleaned) >= self.min_len else None
+
+    def accepts_fingerprint(self, amount_value, project):
+        """
+        该行能否以项目指纹代替相似度查重：金额为有效数值且满足查重条件时，
+        索引库中指纹相同的项目（招标单位、中标单位、清洗后名称相同，金额相差不到0.0001）必然也被查重判定为重复
+        """
+        amount = ledger_amount(amount_value)
+        return amount is not None and self.cleaned_name(amount, project) is not None
+
+    def is_duplicate(self, tenderer, bidder, amount, project):
+        cleaned_new = self.cleaned_name(amount, project)
+        if cleaned_new is None:
+            return False
+        candidates = self.ledger_db.find_dedup_candidates(tenderer, bidder, amount, self.amount_tol, self.min_len)
+        if not candidates:
+            return False
+        return bool(self.similarity.duplicate_mask(cleaned_new, candidates, self.threshold).any())
+
+def ledger_key_text(value):
+    """索引库中招标单位/中标单位的规范化取值：空值为空串，其余去除首尾空白"""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ""
+    return str(value).strip()
+
+def ledger_amount(value):
+    """索引库中金额的规范化取值，无法转换为有限数值时为None（不参与查重）"""
+    try:
+        amount = float(value)
+    except (ValueError, TypeError):
+        return None
+    return amount if math.isfinite(amount) else None
+
+COMPANY_NAME_NOISE_PATTERN = re.compile(r"[\s()（）]|股份有限公司|有限责任公司|有限公司|分公司|公司|集团")
+
+def normalize_company_name(value):
+    """跨来源比较用的单位名称：去除空白、括号及常见公司后缀"""
+    return COMPANY_NAME_NOISE_PATTERN.sub("", ledger_key_text(value))
+
+def month_index(month_value, time_value=None):
+    """中标月份（如202501、"2025-01"）换算为连续月序号，缺失时由中标时间推算，无法识别返回None"""
+    digits = re.sub(r"\D", "", ledger_key_text(month_value))
+    if len(digits) >= 6 and 1 <= int(digits[4:6]) <= 12:
+        return int(digits[:4]) * 12 + int(digits[4:6]) - 1
+    # 常见的“2025-01-02”“2025/1/2”“2025年1月2日”格式直接取年月，其余格式才交给pd.to_datetime解析（逐条解析较慢）
+    time_text = ledger_key_text(time_value)
+    matched = re.match(r"(\d{4})[-/.年](\d{1,2})(?:[-/.月]\d{1,2}日?)?(?:$|[ T])", time_text)
+    if matched and 1 <= int(matched.group(2)) <= 12:
+        return int(matched.group(1)) * 12 + int(matched.group(2)) - 1
+    parsed = pd.to_datetime(time_text or None, errors="coerce")
+    if pd.isna(parsed):
+        return None
+    return parsed.year * 12 + parsed.month - 1
+
+def cross_source_keys(tenderer, bidder, project, month, bid_time):
+    """
+    跨来源消解的规范化键：(招标单位, 月序号, 中标单位, 去除招标单位后的清洗项目名称)
+    项目写入索引库时一并保存，消解时按招标单位和月序号直接查询；无招标单位或无法识别月份时返回None
+    """
+    tenderer = normalize_company_name(tenderer)
+    month_idx = month_index(month, bid_time)
+    if not tenderer or month_idx is None:
+        return None
+    # 项目名称中的招标单位前缀/后缀因来源而异，比较前去除
+    project = clean_project_name(ledger_key_text(project)).replace(tenderer, "")
+    return tenderer, month_idx, normalize_company_name(bidder), project
+
+class CrossSourceResolver:
+    """
+    跨来源实体消解：同一中标结果由ICT、省公司、数说123分别报送时，中标单位写法、金额单位（元/万元）、项目名称措辞都可能不同
+    - 分块：规范化招标单位 + 中标月份（前后month_window个月），分块键随项目保存在索引库中（见cross_source_keys），只比较块内记录
+    - 金额≥10000万元时同时按“元”折算为万元参与比较；项目名称去除招标单位后再比较
+    - 只比较不同来源的记录，中标单位、项目名称相似度的平均值不低于threshold且金额相差不超过amount_tol即视为同一项目
+    - 无招标单位、无法识别月份或无正金额的记录不参与消解
+    - 相似度计算前先用相似度后端（见SIMILARITY_BACKENDS）的上界预筛，两项上界的平均值未达到阈值的候选不再计算
+    """
+    def __init__(self, ledger_db, threshold=0.8, amount_tol=0.05, month_window=1, backend="lcs"):
+        self.ledger_db = ledger_db
+        self.threshold = threshold
+        self.amount_tol = amount_tol
+        self.month_window = month_window
+        self.similarity = SIMILARITY_BACKENDS[backend]()
+        self.compared_count = 0
+        self.prefiltered_count = 0
+        self.linked_count = 0
+
+    @staticmethod
+    def _amount_candidates(amount):
+        return (amount, amount / 10000) if amount >= 10000 else (amount,)
+
+    def make_record(self, source, tenderer, bidder, project, month, bid_time, amount):
+        """规范化一条待消解的记录；不满足消解条件时返回None"""
+        keys = cross_source_keys(tenderer, bidder, project, month, bid_time)
+        amount = ledger_amount(amount)
+        if keys is None or amount is None or amount <= 0:
+            return None
+        return (ledger_key_text(source),) + keys + (self._amount_candidates(amount),)
+
+    @staticmethod
+    def _similarity(a, b):
+        return matching_block_ratio(a, b) if a and b else 0.0
+
+    def _amount_close(self, amounts_a, amounts_b):
+        return any(abs(a - b) <= self.amount_tol * max(a, b) for a in amounts_a for b in amounts_b)
+
+    def find_match(self, made):
+        """在索引库中查找相邻月份内不同来源的同一项目，返回其Excel行号（row_id），made为make_record的返回值"""
+        if made is None:
+            return None
+        source, tenderer, month_idx, bidder, project, amounts = made
+        candidates = [
+            (row_id, other_bidder or "", other_project or "")
+            for row_id, other_source, other_bidder, other_project, other_amount
+            in self.ledger_db.find_cross_source_candidates(tenderer, month_idx - self.month_window, month_idx + self.month_window)
+            if ledger_key_text(other_source) != source and self._amount_close(amounts, self._amount_candidates(other_amount))
+        ]
+        if not candidates:
+            return None
+        # 相似度不超过上界，平均值的上界未达到阈值的候选不可能匹配
+        upper_bounds = (
+            self.similarity.ratio_upper_bounds(bidder, [c[1] for c in candidates])
+            + self.similarity.ratio_upper_bounds(project, [c[2] for c in candidates])
+        ) / 2
+        survivors = np.flatnonzero(upper_bounds >= self.threshold)
+        self.prefiltered_count += len(candidates) - len(survivors)
+        for j in survivors:
+            row_id, other_bidder, other_project = candidates[j]
+            self.compared_count += 1
+            score = (self._similarity(bidder, other_bidder) + self._similarity(project, other_project)) / 2
+            if score >= self.threshold:
+                self.linked_count += 1
+                return row_id
+        return None
+
+# 汇总文件另存时在文件名后追加的时间后缀（可能多次追加），如“项目汇总_更新项目_20250101_093000.xlsx”
+WORKBOOK_SAVE_SUFFIX_RE = re.compile(r"(?:_更新(?:项目|公司)_\d{8}_\d{6})+$")
+
+class ProjectLedgerDB:
+    """
+    项目清单的SQLite索引副本，保存在汇总文件同目录下（每个汇总文件一个，见sidecar_path）
+    - projects表逐行镜像[项目清单]Sheet（row_id为Excel行号），并附加查重用的规范化键、清洗后名称和项目指纹
+    - 在中标单位、招标单位、金额上建索引，查重候选、公司统计都从索引库查询，xlsx只作为导出目标
+    - meta表记录最近一次同步的汇总文件指纹(sha256)，文件被手动修改或换了文件时指纹不一致，需要重新同步
+    - bid_cube表为分析立方体（见BidCube），追加、同步项目时随之更新
+    - bid_edges、cowin_edges表为中标单位-招标单位、分包共同中标关系图（见BidGraph），同样随项目增量更新
+    """
+    FILE_NAME = "项目清单索引.sqlite"
+    KEY_COLUMNS = ["tenderer_key", "bidder_key", "amount_key", "cleaned_name", "fingerprint", "xs_tenderer", "xs_month", "xs_bidder", "xs_project"]
+
+    def __init__(self, workbook_path, columns):
+        self.path = self.sidecar_path(workbook_path)
+        self.columns = list(columns)
+        self.conn = sqlite3.connect(self.path)
+        self._create_schema()
+
+    @classmethod
+    def sidecar_path(cls, workbook_path):
+        """
+        汇总文件对应的索引库路径：同目录下的“<汇总文件名>_项目清单索引.sqlite”
+        每个汇总文件单独一个索引库，同目录下的项目汇总、公司汇总文件互不影响；
+        文件名去除各次另存追加的时间后缀后再取名，汇总文件与其各次另存的结果共用一个索引库，接着使用上次另存的文件时无需重新同步
+        """
+        directory, filename = os.path.split(os.path.abspath(workbook_path))
+        stem = WORKBOOK_SAVE_SUFFIX_RE.sub("", os.path.splitext(filename)[0])
+        return os.path.join(directory, f"{stem}_{cls.FILE_NAME}")
+
+    @classmethod
+    def connect_readonly(cls, workbook_path):
+        """以只读方式连接汇总文件对应的索引库（供BidCube、BidGraph等查询对象使用）"""
+        path = cls.sidecar_path(workbook_path)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"未找到项目清单索引库: {path}")
+        return sqlite3.connect(pathlib.Path(path).as_uri() + "?mode=ro", uri=True)
+
+    def _create_schema(self):
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        # 列配置（含附加键列）变化时重建projects表
+        if self.get_meta("columns") != json.dumps(self.columns + self.KEY_COLUMNS, ensure_ascii=False):
+            self.conn.execute("DROP TABLE IF EXISTS projects")
+            self.conn.execute("DROP TABLE IF EXISTS bid_cube")
+            self.conn.execute("DROP TABLE IF EXISTS bid_edges")
+            self.conn.execute("DROP TABLE IF EXISTS cowin_edges")
+            # 公司增量统计状态一并清除
+            self.conn.execute("DROP TABLE IF EXISTS company_stat_rows")
+            self.conn.execute("DROP TABLE IF EXISTS company_stats")
+            self.conn.execute("DELETE FROM meta")
+        # 数据列不声明类型，保证单元格原始值（文本/数值）原样存取
+        cols_sql = ", ".join(f'"{col}"' for col in self.columns)
+        cube_dims_sql = ", ".join(f'"{dim}"' for dim in BidCube.DIMENSIONS)
+        self.conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS projects (
+                row_id INTEGER PRIMARY KEY, {cols_sql},
+                tenderer_key TEXT, bidder_key TEXT, amount_key REAL, cleaned_name TEXT, fingerprint TEXT,
+                xs_tenderer TEXT, xs_month INTEGER, xs_bidder TEXT, xs_project TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_projects_bidder ON projects (bidder_key);
+            CREATE INDEX IF NOT EXISTS idx_projects_tenderer ON projects (tenderer_key);
+            CREATE INDEX IF NOT EXISTS idx_projects_amount ON projects (amount_key);
+            CREATE INDEX IF NOT EXISTS idx_projects_dedup ON projects (bidder_key, tenderer_key, amount_key);
+            CREATE INDEX IF NOT EXISTS idx_projects_project ON projects (tenderer_key, "项目名称");
+            CREATE INDEX IF NOT EXISTS idx_projects_fingerprint ON projects (fingerprint);
+            CREATE INDEX IF NOT EXISTS idx_projects_cross_source ON projects (xs_tenderer, xs_month);
+            CREATE TABLE IF NOT EXISTS bid_cube (
+                {", ".join(f'"{dim}" TEXT' for dim in BidCube.DIMENSIONS)},
+                cnt INTEGER, amount REAL,
+                PRIMARY KEY ({cube_dims_sql})
+            );
+            CREATE TABLE IF NOT EXISTS bid_edges (
+                bidder TEXT, tenderer TEXT, cnt INTEGER, amount REAL,
+                PRIMARY KEY (bidder, tenderer)
+            );
+            CREATE INDEX IF NOT EXISTS idx_bid_edges_tenderer ON bid_edges (tenderer);
+            CREATE TABLE IF NOT EXISTS cowin_edges (
+                bidder TEXT, partner TEXT, cnt INTEGER,
+                PRIMARY KEY (bidder, partner)
+            );
+        """)
+        self.set_meta("columns", json.dumps(self.columns + self.KEY_COLUMNS, ensure_ascii=False))
+        # 旧版本索引库没有立方体（或立方体计入了空行），由已有项目生成
+        if self.get_meta("cube_version") != "2":
+            self.conn.execute("DELETE FROM bid_cube")
+            self._add_to_cube(self.conn.execute("SELECT * FROM projects").fetchall())
+            self.set_meta("cube_version", "2")
+        # 旧版本索引库没有关系图，由已有项目生成
+        if self.get_meta("graph_version") != "1":
+            self.conn.execute("DELETE FROM bid_edges")
+            self.conn.execute("DELETE FROM cowin_edges")
+            self._add_to_graph(self.conn.execute("SELECT * FROM projects ORDER BY row_id").fetchall())
+            self.set_meta("graph_version", "1")
+        self.conn.commit()
+
+    def get_meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    @staticmethod
+    def file_signature(path):
+        """汇总文件内容指纹，只读文件字节、不解析Excel"""
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def is_synced_with(self, workbook_path):
+        """完整性校验：索引库是否与该汇总文件一致（文件未被手动修改过）"""
+        return self.get_meta("workbook_sha256") == self.file_signature(workbook_path)
+
+    def _to_db_value(self, value):
+        if isinstance(value, (datetime.date, datetime.datetime)):
+            return value.isoformat(sep=" ") if isinstance(value, datetime.datetime) else value.isoformat()
+        if isinstance(value, float) and math.isnan(value):
+            return None
+        if isinstance(value, np.generic): # numpy标量转为python原生类型
+            return value.item()
+        if value is not None and not isinstance(value, (str, int, float)) and pd.isna(value):
+            return None
+        return value
+
+    def _project_records(self, rows, start_row_id):
+        idx_tenderer = self.columns.index("招标单位")
+        idx_bidder = self.columns.index("中标单位")
+        idx_amount = self.columns.index("中标金额（万元）")
+        idx_project = self.columns.index("项目名称")
+        idx_time = self.columns.index("中标时间")
+        idx_month = self.columns.index("中标月份")
+        for row_id, values in enumerate(rows, start=start_row_id):
+            values = [self._to_db_value(v) for v in values]
+            project = ledger_key_text(values[idx_project])
+            cross_keys = cross_source_keys(values[idx_tenderer], values[idx_bidder], values[idx_project], values[idx_month], values[idx_time])
+            yield [row_id] + values + [
+                ledger_key_text(values[idx_tenderer]),
+                ledger_key_text(values[idx_bidder]),
+                ledger_amount(values[idx_amount]),
+                clean_project_name(project) if project else "",
+                project_fingerprint(values[idx_tenderer], values[idx_bidder], values[idx_amount], values[idx_project], values[idx_time]),
+            ] + list(cross_keys or (None, None, None, None))
+
+    def _add_to_cube(self, records):
+        """将项目记录（projects表的整行）累加到立方体；项目名称、招标单位、中标单位均为空的行（空行、带格式的尾部空行）不计入"""
+        dim_positions = [1 + self.columns.index(dim) for dim in BidCube.DIMENSIONS]
+        amount_position = 1 + len(self.columns) + self.KEY_COLUMNS.index("amount_key")
+        key_positions = [1 + len(self.columns) + self.KEY_COLUMNS.index(col) for col in ("cleaned_name", "tenderer_key", "bidder_key")]
+        cube_dims_sql = ", ".join(f'"{dim}"' for dim in BidCube.DIMENSIONS)
+        self.conn.executemany(
+            f"INSERT INTO bid_cube VALUES ({', '.join(['?'] * len(BidCube.DIMENSIONS))}, 1, ?) "
+            f"ON CONFLICT ({cube_dims_sql}) DO UPDATE SET cnt = cnt + 1, amount = amount + excluded.amount",
+            (
+                [BidCube.key_text(record[pos]) for pos in dim_positions] + [record[amount_position] or 0.0]
+                for record in records if any(record[pos] for pos in key_positions)
+            )
+        )
+
+    def _add_to_graph(self, records):
+        """
+        将项目记录（projects表的整行，须已写入projects表，且为按row_id排列的连续一段）累加到关系图
+        - bid_edges：中标单位 × 招标单位 的中标个数和金额
+        - cowin_edges：备注含“分包”且项目名称、招标单位、中标时间相同的行视为同一项目，其中标单位两两共同中标一次（双向存储）
+        """
+        key_base = 1 + len(self.columns)
+        pos_tenderer = key_base + self.KEY_COLUMNS.index("tenderer_key")
+        pos_bidder = key_base + self.KEY_COLUMNS.index("bidder_key")
+        pos_amount = key_base + self.KEY_COLUMNS.index("amount_key")
+        self.conn.executemany(
+            "INSERT INTO bid_edges VALUES (?, ?, 1, ?) "
+            "ON CONFLICT (bidder, tenderer) DO UPDATE SET cnt = cnt + 1, amount = amount + excluded.amount",
+            ((record[pos_bidder], record[pos_tenderer], record[pos_amount] or 0.0) for record in records if record[pos_bidder] and record[pos_tenderer])
+        )
+        if not records:
+            return
+        # 本批各分包行与同一项目中先录入的其他中标单位各组成一对（同一单位重复出现时不重复计数），
+        # 整批由一条语句联表计算并累加，不逐行查询
+        self.conn.execute(
+            """
+            WITH batch AS (
+                SELECT row_id, tenderer_key, "项目名称" AS name, "中标时间" AS bid_time, bidder_key AS bidder FROM projects
+                WHERE row_id BETWEEN ? AND ? AND bidder_key != '' AND "备注" LIKE '%分包%'
+            ), partners AS (
+                SELECT DISTINCT b.row_id, b.bidder, p.bidder_key AS partner FROM batch b JOIN projects p
+                ON p.tenderer_key = b.tenderer_key AND p."项目名称" IS b.name AND p."中标时间" IS b.bid_time AND p.row_id < b.row_id
+                WHERE p."备注" LIKE '%分包%'
+            ), pairs AS (
+                SELECT bidder, partner FROM partners
+                WHERE partner != '' AND row_id NOT IN (SELECT row_id FROM partners WHERE partner = bidder)
+            )
+            INSERT INTO cowin_edges
+            SELECT bidder, partner, COUNT(*) FROM (SELECT bidder, partner FROM pairs UNION ALL SELECT partner, bidder FROM pairs)
+            WHERE true GROUP BY bidder, partner
+            ON CONFLICT (bidder, partner) DO UPDATE SET cnt = cnt + excluded.cnt
+            """,
+            (records[0][0], records[-1][0])
+        )
+
+    def add_projects(self, rows, start_row_id):
+        """追加项目行并累加到立方体、关系图，rows中每行按columns顺序排列；需调用commit/mark_synced提交"""
+        placeholders = ", ".join(["?"] * (1 + len(self.columns) + len(self.KEY_COLUMNS)))
+        records = list(self._project_records(rows, start_row_id))
+        self.conn.executemany(f"INSERT OR REPLACE INTO projects VALUES ({placeholders})", records)
+        self._add_to_cube(records)
+        self._add_to_graph(records)
+
+    def rebuild(self, header, rows):
+        """
+        由[项目清单]Sheet的表头和数据行重建索引库
+        :param header: 表头单元格值列表
+        :param rows: 数据行迭代器（第2行起，values_only）
+        """
+        col_positions = [header.index(col) if col in header else None for col in self.columns]
+        def reorder(row):
+            return [row[pos] if pos is not None and pos < len(row) else None for pos in col_positions]
+        self.conn.execute("DELETE FROM projects")
+        self.conn.execute("DELETE FROM bid_cube")
+        self.conn.execute("DELETE FROM bid_edges")
+        self.conn.execute("DELETE FROM cowin_edges")
+        self.add_projects((reorder(row) for row in rows), start_row_id=2)
+
+    def max_row_id(self):
+        """最后一行数据的Excel行号，无数据时为表头行1"""
+        row = self.conn.execute("SELECT MAX(row_id) FROM projects").fetchone()
+        return row[0] if row[0] is not None else 1
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM projects").fetchone()[0]
+
+    def has_fingerprint(self, fingerprint):
+        """项目指纹是否已在项目清单中（指纹随项目行同步，文件被修改后重新同步时一并重建）"""
+        return self.conn.execute("SELECT 1 FROM projects WHERE fingerprint = ? LIMIT 1", (fingerprint,)).fetchone() is not None
+
+    def find_dedup_candidates(self, tenderer, bidder, amount, amount_tol, min_len):
+        """按联合索引取查重候选：招标单位、中标单位相同，金额在容差内，清洗后名称不少于min_len个字"""
+        rows = self.conn.execute(
+            "SELECT amount_key, cleaned_name FROM projects "
+            "WHERE bidder_key = ? AND tenderer_key = ? AND amount_key > ? AND amount_key < ? AND length(cleaned_name) >= ?",
+            (bidder, tenderer, amount - amount_tol, amount + amount_tol, min_len)
+        ).fetchall()
+        return [name for exist_amount, name in rows if abs(exist_amount - amount) < amount_tol]
+
+    def find_cross_source_candidates(self, tenderer, month_from, month_to):
+        """跨来源消解候选：规范化招标单位相同、月序号在[month_from, month_to]内且金额为正的项目"""
+        return self.conn.execute(
+            'SELECT row_id, "数据来源", xs_bidder, xs_project, amount_key FROM projects '
+            "WHERE xs_tenderer = ? AND xs_month BETWEEN ? AND ? AND amount_key > 0 ORDER BY row_id",
+            (tenderer, month_from, month_to)
+        ).fetchall()
+
+    def iter_rows(self, columns):
+        """按Excel行号顺序返回指定列"""
+        cols_sql = ", ".join(f'"{col}"' for col in columns)
+        return self.conn.execute(f"SELECT {cols_sql} FROM projects ORDER BY row_id")
+
+    def read_frame(self, columns=None):
+        """以DataFrame读取项目清单（按Excel行号排序，index为row_id）"""
+        columns = columns or self.columns
+        df = pd.DataFrame(self.iter_rows(["row_id"] + columns).fetchall(), columns=["row_id"] + columns)
+        return df.set_index("row_id")
+
+    def cube(self):
+        """分析立方体查询对象"""
+        return BidCube(self.conn)
+
+    def graph(self):
+        """关系图查询对象"""
+        return BidGraph(self.conn)
+
+    def mark_synced(self, workbook_path):
+        """记录与索引库一致的汇总文件指纹并提交"""
+        self.set_meta("workbook_path", os.path.abspath(workbook_path))
+        self.set_meta("workbook_sha256", self.file_signature(workbook_path))
+        self.set_meta("synced_at", pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S"))
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        self.conn.close()
+
+def company_stat_records(df):
+    """
+    按公司汇总项目的个数和金额（长表）：维度为总计、中标年份、项目所属行业
+    :param df: 参与统计的项目，含中标单位、中标年份、项目所属行业、中标金额（万元）列
+    :return: DataFrame[中标单位, 维度, 取值, 中标个数, 中标金额（万元）]
+    """
+    parts = []
+    grouped = df.groupby("中标单位")["中标金额（万元）"]
+    part = pd.DataFrame({"中标个数": grouped.size(), "中标金额（万元）": grouped.sum()}).reset_index()
+    part.insert(1, "维度", "总计")
+    part.insert(2, "取值", "")
+    parts.append(part)
+    for dim in CompanyStatsState.DIMS:
+        grouped = df.groupby(["中标单位", dim])["中标金额（万元）"]
+        part = pd.DataFrame({"中标个数": grouped.size(), "中标金额（万元）": grouped.sum()}).reset_index()
+        part.rename(columns={dim: "取值"}, inplace=True)
+        part.insert(1, "维度", dim)
+        parts.append(part)
+    df_records = pd.concat(parts, ignore_index=True)
+    df_records["中标金额（万元）"] = df_records["中标金额（万元）"].astype("float64")
+    return df_records
+
+class CompanyStatsState:
+    """
+    公司统计的增量状态，保存在项目清单索引库中
+    - 统计只取决于每个项目的SOURCE_COLUMNS列，按这些列的取值（统计键）归并项目：company_stat_rows表每个统计键一行，
+      记录具有该取值的项目条数，以及清洗后计入的公司、年份、行业、金额（不参与统计的取值公司为空）
+    - company_stats表为各公司按维度汇总的个数和金额，即company_stat_records的长表
+    - 每次由索引库中的全部项目按统计键计数（一条SQL），与上次的计数比对：只有新出现的取值需要清洗，只重算条数有变化的公司。
+      行号不参与比对，汇总文件被手动修改、插入或删除行后重新同步，未改动的项目仍不需要重新统计
+    """
+    DIMS = ["中标年份", "项目所属行业"]
+    ROW_COLUMNS = ["中标单位", "中标年份", "项目所属行业", "中标金额（万元）"]
+    SOURCE_COLUMNS = ["中标单位", "中标年份", "项目所属行业", "中标金额（万元）", "中标厂商类型"]
+    VERSION = "2" # 状态表结构版本，不一致时清除旧状态
+
+    def __init__(self, ledger_db):
+        self.ledger_db = ledger_db
+        self.conn = ledger_db.conn
+        if self.ledger_db.get_meta("company_stats_version") != self.VERSION:
+            self.conn.execute("DROP TABLE IF EXISTS company_stat_rows")
+            self.conn.execute("DROP TABLE IF EXISTS company_stats")
+            self.conn.execute("DELETE FROM meta WHERE key IN ('company_stats_row_id', 'company_stats_rebuild_count')")
+        # 年份、行业列不声明类型，原值（文本/数值）原样存取
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS company_stat_rows (
+                stat_key TEXT PRIMARY KEY, cnt INTEGER, company, year, industry, amount REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_company_stat_rows_company ON company_stat_rows (company);
+            CREATE TABLE IF NOT EXISTS company_stats (
+                company, dim, dim_value, cnt INTEGER, amount REAL,
+                PRIMARY KEY (company, dim, dim_value)
+            );
+        """)
+        self.ledger_db.set_meta("company_stats_version", self.VERSION)
+        self.conn.commit()
+
+    def reset(self):
+        self.conn.execute("DELETE FROM company_stat_rows")
+        self.conn.execute("DELETE FROM company_stats")
+        self.conn.commit()
+
+    def update(self, prepare):
+        """
+        按统计键比对索引库中的项目与上次统计的状态并更新
+        :param prepare: 清洗函数，输入含SOURCE_COLUMNS列的DataFrame，返回其中参与统计的行（index不变，含ROW_COLUMNS列）
+        :return: (新出现的统计键数, 计入的项目条数, 移除的项目条数, 受影响公司数)
+        """
+        # quote()保留取值类型（文本'1'与数值1不同），char(31)分隔各列
+        key_sql = " || char(31) || ".join(f'quote("{col}")' for col in self.SOURCE_COLUMNS)
+        source_sql = ", ".join(f'"{col}"' for col in self.SOURCE_COLUMNS)
+        self.conn.execute("DROP TABLE IF EXISTS temp.current_stat_keys")
+        # 同一统计键的各行取值相同，非聚合列取自其中任意一行
+        self.conn.execute(
+            f"CREATE TEMP TABLE current_stat_keys AS "
+            f"SELECT {key_sql} AS stat_key, COUNT(*) AS cnt, {source_sql} FROM projects GROUP BY stat_key"
+        )
+        self.conn.execute("CREATE UNIQUE INDEX temp.idx_current_stat_keys ON current_stat_keys (stat_key)")
+
+        # 新出现的统计键：清洗后写入状态
+        new_rows = self.conn.execute(
+            f"SELECT stat_key, cnt, {source_sql} FROM current_stat_keys "
+            "WHERE stat_key NOT IN (SELECT stat_key FROM company_stat_rows)"
+        ).fetchall()
+        df_new = pd.DataFrame([row[2:] for row in new_rows], columns=self.SOURCE_COLUMNS, index=[row[0] for row in new_rows])
+        df_valid = prepare(df_new) if new_rows else df_new
+        valid = {key: values for key, values in zip(df_valid.index, df_valid[self.ROW_COLUMNS].itertuples(index=False, name=None))}
+        self.conn.executemany(
+            "INSERT INTO company_stat_rows VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (key, cnt) + (valid[key][:3] + (float(valid[key][3]),) if key in valid else (None, None, None, None))
+                for key, cnt, *_ in new_rows
+            ]
+        )
+        added = sum(cnt for key, cnt, *_ in new_rows)
+        affected = {valid[key][0] for key in valid}
+
+        # 条数有变化（含减为0）的已有统计键
+        changed = self.conn.execute(
+            "SELECT s.stat_key, s.company, s.cnt, COALESCE(c.cnt, 0) FROM company_stat_rows s "
+            "LEFT JOIN current_stat_keys c ON c.stat_key = s.stat_key WHERE c.cnt IS NOT s.cnt"
+        ).fetchall()
+        removed = 0
+        for key, company, old_cnt, new_cnt in changed:
+            if new_cnt > old_cnt:
+                added += new_cnt - old_cnt
+            else:
+                removed += old_cnt - new_cnt
+            if company is not None:
+                affected.add(company)
+        self.conn.executemany("UPDATE company_stat_rows SET cnt = ? WHERE stat_key = ?", [(new_cnt, key) for key, _, _, new_cnt in changed if new_cnt > 0])
+        self.conn.executemany("DELETE FROM company_stat_rows WHERE stat_key = ?", [(key,) for key, _, _, new_cnt in changed if new_cnt == 0])
+        self.conn.execute("DROP TABLE temp.current_stat_keys")
+
+        # 受影响公司重新汇总（每个统计键按条数展开）
+        affected = sorted(affected)
+        for start in range(0, len(affected), 500):
+            companies = affected[start:start + 500]
+            placeholders = ", ".join(["?"] * len(companies))
+            self.conn.execute(f"DELETE FROM company_stats WHERE company IN ({placeholders})", companies)
+            rows = self.conn.execute(
+                f"SELECT company, year, industry, amount, cnt FROM company_stat_rows WHERE company IN ({placeholders}) ORDER BY stat_key",
+                companies
+            ).fetchall()
+            df_affected = pd.DataFrame([row[:4] for row in rows], columns=self.ROW_COLUMNS)
+            df_affected = df_affected.loc[df_affected.index.repeat([row[4] for row in rows])]
+            self.conn.executemany(
+                "INSERT INTO company_stats VALUES (?, ?, ?, ?, ?)",
+                company_stat_records(df_affected).itertuples(index=False, name=None)
+            )
+        self.conn.commit()
+        return len(new_rows), added, removed, len(affected)
+
+    def read_records(self):
+        """读取全部公司的汇总长表，列同company_stat_records"""
+        rows = self.conn.execute("SELECT company, dim, dim_value, cnt, amount FROM company_stats").fetchall()
+        return pd.DataFrame(rows, columns=["中标单位", "维度", "取值", "中标个数", "中标金额（万元）"]).astype({"中标个数": "int64", "中标金额（万元）": "float64"})
+
+class BidCube:
+    """
+    中标分析立方体查询：bid_cube表按(中标单位, 中标年份, 中标月份, 市, 项目所属行业, 中标厂商类型)汇总中标个数和金额，
+    由ProjectLedgerDB在追加、同步项目时维护，任意维度的上卷查询只需聚合立方体，无需读取项目清单
+    示例：西咸卫健中标金额前20的厂商按月统计
+        BidCube.open("项目汇总.xlsx").query(["中标单位", "中标月份"], {"市": "西咸", "项目所属行业": "卫健"}, top_n=20)
+    """
+    DIMENSIONS = ["中标单位", "中标年份", "中标月份", "市", "项目所属行业", "中标厂商类型"]
+    MEASURES = {"中标个数": "cnt", "中标金额（万元）": "amount"}
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    @classmethod
+    def open(cls, workbook_path):
+        """以只读方式打开汇总文件对应的索引库"""
+        return cls(ProjectLedgerDB.connect_readonly(workbook_path))
+
+    @staticmethod
+    def key_text(value):
+        """立方体维度取值：整数值的浮点数去掉小数部分，空值为“未知”"""
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        return ledger_key_text(value) or "未知"
+
+    def query(self, group_by, filters=None, top_n=None, order_by="中标金额（万元）"):
+        """
+        :param group_by: 分组维度列表，如["中标单位", "中标月份"]；为空时返回总计
+        :param filters: {维度: 取值或取值列表}
+        :param top_n: 只保留第一个分组维度按order_by合计排名前N的取值
+        :param order_by: 排名及排序依据，"中标金额（万元）"或"中标个数"
+        :return: DataFrame[分组维度..., 中标个数, 中标金额（万元）]，按order_by降序
+        """
+        dims = list(group_by)
+        filters = filters or {}
+        for dim in dims + list(filters):
+            if dim not in self.DIMENSIONS:
+                raise ValueError(f"不支持的维度: {dim}，可选: {self.DIMENSIONS}")
+        if order_by not in self.MEASURES:
+            raise ValueError(f"不支持的排序依据: {order_by}，可选: {list(self.MEASURES)}")
+        measure = self.MEASURES[order_by]
+
+        conditions, params = [], []
+        for dim, value in filters.items():
+            values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+            conditions.append(f'"{dim}" IN ({", ".join(["?"] * len(values))})')
+            params += [self.key_text(v) for v in values]
+        where_sql = " AND ".join(conditions) or "1"
+        query_params = list(params)
+        if top_n and dims:
+            # 先在同样的筛选条件下取第一个分组维度排名前N的取值
+            first = dims[0]
+            where_sql += f' AND "{first}" IN (SELECT "{first}" FROM bid_cube WHERE {where_sql} GROUP BY "{first}" ORDER BY SUM({measure}) DESC LIMIT ?)'
+            query_params += params + [int(top_n)]
+
+        dims_sql = ", ".join(f'"{dim}"' for dim in dims)
+        sql = (
+            f"SELECT {dims_sql + ', ' if dims else ''}COALESCE(SUM(cnt), 0), COALESCE(SUM(amount), 0) FROM bid_cube WHERE {where_sql}"
+            + (f" GROUP BY {dims_sql} ORDER BY SUM({measure}) DESC, {dims_sql}" if dims else "")
+        )
+        rows = self.conn.execute(sql, query_params).fetchall()
+        return pd.DataFrame(rows, columns=dims + list(self.MEASURES))
+
+    def size(self):
+        """立方体中的维度组合数"""
+        return self.conn.execute("SELECT COUNT(*) FROM bid_cube").fetchone()[0]
+
+class BidGraph:
+    """
+    中标关系图查询：bid_edges为中标单位-招标单位二部图（边权为中标个数、金额），cowin_edges为分包共同中标图（边权为共同中标次数），
+    以邻接表形式保存在索引库中，由ProjectLedgerDB在追加、同步项目时维护，查询某节点的邻居只需按主键/索引取边
+    示例：与某招标单位合作最多的前10家厂商、与某厂商共同中标最多的厂商
+        graph = BidGraph.open("项目汇总.xlsx")
+        graph.neighbors("招标-中标", "西安市教育局", top_k=10)
+        graph.neighbors("共同中标", "某某科技有限公司", top_k=10)
+    """
+    # 关系 -> (边表, 节点列, 邻居列, 节点列标签, 邻居列标签, {指标标签: 边表列})
+    RELATIONS = {
+        "中标-招标": ("bid_edges", "bidder", "tenderer", "中标单位", "招标单位", {"中标个数": "cnt", "中标金额（万元）": "amount"}),
+        "招标-中标": ("bid_edges", "tenderer", "bidder", "招标单位", "中标单位", {"中标个数": "cnt", "中标金额（万元）": "amount"}),
+        "共同中标": ("cowin_edges", "bidder", "partner", "中标单位", "共同中标单位", {"共同中标次数": "cnt"}),
+    }
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    @classmethod
+    def open(cls, workbook_path):
+        """以只读方式打开汇总文件对应的索引库"""
+        return cls(ProjectLedgerDB.connect_readonly(workbook_path))
+
+    def _relation(self, relation, order_by):
+        if relation not in self.RELATIONS:
+            raise ValueError(f"不支持的关系: {relation}，可选: {list(self.RELATIONS)}")
+        table, node_col, neighbor_col, node_label, neighbor_label, measures = self.RELATIONS[relation]
+        order_by = order_by or next(iter(measures))
+        if order_by not in measures:
+            raise ValueError(f"不支持的排序依据: {order_by}，可选: {list(measures)}")
+        return table, node_col, neighbor_col, node_label, neighbor_label, measures, measures[order_by]
+
+    def neighbors(self, relation, node, top_k=10, order_by=None):
+        """
+        :param relation: "中标-招标"、"招标-中标"或"共同中标"
+        :param node: 节点名称（中标单位或招标单位，去除首尾空白后匹配）
+        :param order_by: 排序依据，默认为该关系的第一个指标
+        :return: DataFrame[邻居, 指标...]，按order_by降序取前top_k个
+        """
+        table, node_col, neighbor_col, _, neighbor_label, measures, order_col = self._relation(relation, order_by)
+        measures_sql = ", ".join(measures.values())
+        rows = self.conn.execute(
+            f"SELECT {neighbor_col}, {measures_sql} FROM {table} WHERE {node_col} = ? ORDER BY {order_col} DESC, {neighbor_col} LIMIT ?",
+            (ledger_key_text(node), int(top_k) if top_k else -1)
+        ).fetchall()
+        return pd.DataFrame(rows, columns=[neighbor_label] + list(measures))
+
+    def top_k(self, relation, k=10, order_by=None):
+        """
+        每个节点按order_by取前k个邻居（窗口函数一次查询完成）
+        :return: DataFrame[节点, 邻居, 指标..., 排名]
+        """
+        table, node_col, neighbor_col, node_label, neighbor_label, measures, order_col = self._relation(relation, order_by)
+        measures_sql = ", ".join(measures.values())
+        rows = self.conn.execute(
+            f"SELECT * FROM (SELECT {node_col}, {neighbor_col}, {measures_sql}, "
+            f"ROW_NUMBER() OVER (PARTITION BY {node_col} ORDER BY {order_col} DESC, {neighbor_col}) AS rank_no FROM {table}) "
+            f"WHERE rank_no <= ? ORDER BY {node_col}, rank_no",
+            (int(k),)
+        ).fetchall()
+        return pd.DataFrame(rows, columns=[node_label, neighbor_label] + list(measures) + ["排名"])
+
+    def export(self, path, k=10):
+        """导出各关系每个节点的前k个邻居，每种关系一个Sheet"""
+        with pd.ExcelWriter(path) as writer:
+            for relation in self.RELATIONS:
+                self.top_k(relation, k).to_excel(writer, sheet_name=relation, index=False)
+
+    def size(self):
+        """(中标关系边数, 共同中标单位对数)"""
+        bid_edges = self.conn.execute("SELECT COUNT(*) FROM bid_edges").fetchone()[0]
+        cowin_pairs = self.conn.execute("SELECT COUNT(*) FROM cowin_edges").fetchone()[0] // 2
+        return bid_edges, cowin_pairs
+
+def _normalize_fingerprint_field(value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ""
+    if isinstance(value, (datetime.date, datetime.datetime)): # pd.Timestamp也是datetime子类
+        return value.strftime("%Y-%m-%d")
+    text = str(value).strip()
+    if re.match(r"^\d{4}-\d{2}-\d{2}", text): # "2025-01-02 00:00:00" 与 "2025-01-02" 视为同一时间
+        return text[:10]
+    return text
+
+def project_fingerprint(tenderer, bidder, amount, project, bid_time):
+    """
+    项目指纹：对规范化后的(招标单位, 中标单位, 金额, 清洗后项目名称, 中标时间)取哈希
+    用于识别完全重复导入的源数据行；招标单位、中标单位、项目名称、金额的规范化与查重索引（ledger_key_text、ledger_amount）一致
+    """
+    amount = ledger_amount(amount)
+    fields = [
+        ledger_key_text(tenderer),
+        ledger_key_text(bidder),
+        f"{amount:.4f}" if amount is not None else "",
+        clean_project_name(ledger_key_text(project)),
+        _normalize_fingerprint_field(bid_time),
+    ]
+    return hashlib.blake2b("\x1f".join(fields).encode("utf-8"), digest_size=16).hexdigest()
+
+# 数据行统一样式：微软雅黑8号、居中、细边框，以命名样式注册到工作簿中
+DATA_CELL_STYLE_NAME = "中标数据_微软雅黑8居中细边框"
+
+def register_data_cell_style(wb):
+    """在工作簿中注册数据行命名样式（已存在则直接复用），返回样式名"""
+    if DATA_CELL_STYLE_NAME not in wb.named_styles:
+        thin = Side(style="thin")
+        wb.add_named_style(NamedStyle(
+            name=DATA_CELL_STYLE_NAME,
+            font=Font(name="微软雅黑", size=8),
+            alignment=Alignment(horizontal="center", vertical="center"),
+            border=Border(left=thin, right=thin, top=thin, bottom=thin)
+        ))
+    return DATA_CELL_STYLE_NAME
+
+def append_styled_rows(ws, rows, start_row):
+    """
+    批量写入带样式的数据行
+    每个单元格只指定一次命名样式（字体、对齐、边框一并生效），避免逐格赋值Font/Alignment/Border时openpyxl反复做样式查重；
+    先指定样式再赋值，日期时间单元格仍按取值自动设置日期格式
+    :param rows: 行值列表的列表
+    :param start_row: 第一行写入的行号
+    """
+    if not rows:
+        return
+    style_name = register_data_cell_style(ws.parent)
+    for row_idx, values in enumerate(rows, start=start_row):
+        for col_idx, value in enumerate(values, start=1):
+            cell = ws.cell(row=row_idx, column=col_idx)
+            cell.style = style_name
+            cell.value = value
+
+class WorkbookSession:
+    """
+    工作簿会话：各Sheet的数据统一由会话读取，处理完成后由会话另存
+    - wb为完整加载的工作簿（保留公式、样式），既是写入对象，也直接从中读取取值，整个工作簿只解析一次
+    - 完整加载时公式单元格只有公式文本、没有计算结果，含公式的Sheet才另以只读、data_only方式流式解析一次（各Sheet共用），
+      读到Excel缓存的计算结果；这一次额外解析的耗时记在values_load_seconds中
+    单元格取值转换、尾部空行空列裁剪与pd.read_excel(openpyxl引擎)一致，保证读出的数据与逐Sheet调用read_excel相同
+    """
+    def __init__(self, path):
+        self.path = path
+        start = time.perf_counter()
+        self.wb = openpyxl.load_workbook(path)
+        self.load_seconds = time.perf_counter() - start
+        self._values_wb = None # 只读取值工作簿，读取含公式的Sheet时才打开
+        self.values_load_seconds = 0.0
+
+    def __getitem__(self, sheet_name):
+        return self.wb[sheet_name]
+
+    def _values_sheet(self, sheet_name):
+        """读取取值用的Sheet：不含公式时直接使用已加载的工作簿，含公式时使用只读取值工作簿"""
+        ws = self.wb[sheet_name]
+        if not any(cell.data_type == "f" for row in ws.iter_rows() for cell in row):
+            return ws
+        if self._values_wb is None:
+            start = time.perf_counter()
+            self._values_wb = openpyxl.load_workbook(self.path, read_only=True, data_only=True)
+            self.values_load_seconds = time.perf_counter() - start
+        ws = self._values_wb[sheet_name]
+        ws.reset_dimensions() # 不依赖文件中记录的数据范围（可能不准确），与read_excel相同
+        return ws
+
+    def iter_values(self, sheet_name):
+        """逐行返回Sheet的单元格取值（公式单元格为计算结果），第一行为表头"""
+        return self._values_sheet(sheet_name).iter_rows(values_only=True)
+
+    @staticmethod
+    def _convert_cell(cell):
+        if cell.value is None:
+            return ""
+        if cell.data_type == "e": # 错误值（如#N/A）按空值处理
+            return np.nan
+        if cell.data_type == "n": # 整数值的浮点数转为int，与read_excel一致
+            val = int(cell.value)
+            return val if val == cell.value else float(cell.value)
+        return cell.value
+
+    def sheet_rows(self, sheet_name):
+        """读取Sheet全部行（已转换取值），裁剪每行尾部空单元格及末尾空行，并补齐为等宽"""
+        data = []
+        last_row_with_data = -1
+        for row_number, row in enumerate(self._values_sheet(sheet_name).iter_rows()):
+            values = [self._convert_cell(cell) for cell in row]
+            while values and values[-1] == "":
+                values.pop()
+            if values:
+                last_row_with_data = row_number
+            data.append(values)
+        data = data[:last_row_with_data + 1]
+        if data:
+            max_width = max(len(values) for values in data)
+            data = [values + [""] * (max_width - len(values)) for values in data]
+        return data
+
+    def read_frame(self, sheet_name, skiprows, names):
+        """等价于 pd.read_excel(path, sheet_name, skiprows=skiprows, header=None, usecols=range(len(names)), names=names)"""
+        data = self.sheet_rows(sheet_name)
+        if len(data) <= skiprows:
+            return pd.DataFrame(columns=names)
+        parser = pd.io.parsers.TextParser(
+            data, header=None, names=names, skiprows=skiprows,
+            usecols=range(len(names)), skip_blank_lines=False
+            )
+        return parser.read()
+
+    def close(self):
+        """释放只读取值工作簿（写入对象不受影响）"""
+        if self._values_wb is not None:
+            self._values_wb.close()
+            self._values_wb = None
+
+    def save(self, path):
+        self.wb.save(path)
+
+# 源数据来源标识：文件名包含的关键字 -> 来源类型
+SOURCE_FILENAME_MARKERS = [("ICT", "ict"), ("派单分析", "province"), ("数说123", "shushuo")]
+
+# 源数据表头签名，与BidSourceNormalizer中各来源的整理方法一一对应：
+# (来源类型, 选择Sheet的规则(Sheet名列表 -> Sheet名或None), 表头所在行(从0开始), 整理时必需的列名)
+SOURCE_HEADER_SIGNATURES = [
+    ("ict", lambda sheets: sheets[0] if sheets else None, 1,
+     {"区域", "发布时间", "公告类型", "公告名称", "招标单位", "中标单位", "中标金额（万元）", "所属行业", "所属业务类型", "公告内容"}),
+    ("province", lambda sheets: next((sheet for sheet in sheets if "中标" in sheet), None), 0,
+     {"省份", "市", "区县", "中标月份", "中标时间", "招标类型", "项目名称", "招标单位", "中标金额", "行业"}),
+    ("shushuo", lambda sheets: "中标项目" if "中标项目" in sheets else None, 0,
+     {"市", "区/县", "中标年份", "中标月份", "项目名称", "招采单位", "中标公司", "中标金额", "项目建设内容"}),
+]
+SOURCE_SNIFF_ROWS = max(header_row for _, _, header_row, _ in SOURCE_HEADER_SIGNATURES) + 1
+
+def sniff_sheet_headers(source_path, nrows=SOURCE_SNIFF_ROWS):
+    """
+    只读取每个Sheet的前nrows行（不加载整个工作簿），用于识别源数据来源
+    :return: {Sheet名: [[单元格文本, ...], ...]}，Sheet按工作簿中的顺序排列
+    """
+    if source_path.lower().endswith(".xls"):
+        frames = pd.read_excel(source_path, sheet_name=None, header=None, nrows=nrows)
+        rows_by_sheet = {name: df.values.tolist() for name, df in frames.items()}
+    else:
+        # read_only模式按需流式读取，只解析前几行
+        wb = openpyxl.load_workbook(source_path, read_only=True, data_only=True)
+        try:
+            rows_by_sheet = {ws.title: [list(row) for row in ws.iter_rows(max_row=nrows, values_only=True)] for ws in wb.worksheets}
+        finally:
+            wb.close()
+    return {name: [[ledger_key_text(value) for value in row] for row in rows] for name, rows in rows_by_sheet.items()}
+
+def detect_source_kind(source_path):
+    """
+    判断源数据来源类型：先按表头签名识别，文件名被改过也能识别；表头无法读取或均不匹配时按文件名关键字识别
+    :return: (来源类型, 识别依据)，无法识别时来源类型为None
+    """
+    try:
+        headers = sniff_sheet_headers(source_path)
+    except Exception:
+        headers = {}
+    for kind, select_sheet, header_row, required_columns in SOURCE_HEADER_SIGNATURES:
+        sheet = select_sheet(list(headers))
+        rows = headers.get(sheet) or []
+        if len(rows) > header_row and required_columns <= set(rows[header_row]):
+            return kind, "表头"
+    filename = os.path.basename(source_path)
+    for marker, kind in SOURCE_FILENAME_MARKERS:
+        if marker in filename:
+            return kind, "文件名"
+    return None, None
+
+SOURCE_BATCH_SIZE = 5000 # 流式整理源数据时每批读取的行数，峰值内存由批大小而非文件大小决定
+SOURCE_STREAM_MIN_BYTES = 20 * 1024 * 1024 # 多文件导入时，超过该大小的文件在主进程中流式整理，不整体交给子进程
+
+def _rows_to_frame(rows, names, dtypes=None):
+    """
+    将已转换取值的行列表按表头列名转为DataFrame（行补齐/截断为表头宽度，类型推断与pd.read_excel一致）
+    :param dtypes: 第一批的列类型，之后各批按其对齐，同一列在各批中的类型保持一致：
+                   第一批为object的列仍为object，第一批为浮点数的整数列转为浮点数；
+                   无法对齐的（如第一批为数值、之后出现文本）保留本批推断的类型
+    """
+    width = len(names)
+    data = [(values + [""] * (width - len(values)))[:width] for values in rows]
+    df = pd.io.parsers.TextParser(data, header=None, names=names, skip_blank_lines=False).read()
+    if dtypes is not None:
+        for position, dtype in enumerate(dtypes):
+            current = df.dtypes.iloc[position]
+            if current != dtype and (dtype == object or (pd.api.types.is_float_dtype(dtype) and pd.api.types.is_integer_dtype(current))):
+                df.isetitem(position, df.iloc[:, position].astype(dtype))
+    return df
+
+def iter_sheet_batches(source_path, select_sheet, header_row, batch_size=SOURCE_BATCH_SIZE):
+    """
+    流式分批读取源数据Sheet，逐批返回以表头行为列名的DataFrame
+    .xlsx以openpyxl只读模式逐行读取，单元格取值转换、表头列名、末尾空行的处理与pd.read_excel一致；
+    .xls无法流式读取，整表读取后分批返回
+    :param select_sheet: Sheet选择规则(Sheet名列表 -> Sheet名或None)，与SOURCE_HEADER_SIGNATURES一致
+    :param header_row: 表头所在行（从0开始），之前的行跳过
+    """
+    if source_path.lower().endswith(".xls"):
+        sheet = select_sheet(pd.ExcelFile(source_path).sheet_names)
+        if sheet is None:
+            raise ValueError("未找到符合该来源格式的Sheet")
+        df_source = pd.read_excel(source_path, sheet_name=sheet, header=header_row)
+        for start in range(0, len(df_source), batch_size):
+            yield df_source.iloc[start:start + batch_size].reset_index(drop=True)
+        return
+
+    wb = openpyxl.load_workbook(source_path, read_only=True, data_only=True)
+    try:
+        sheet = select_sheet(wb.sheetnames)
+        if sheet is None:
+            raise ValueError("未找到符合该来源格式的Sheet")
+        names = None
+        dtypes = None # 第一批推断出的列类型，之后各批按其对齐
+        batch = []
+        blank_rows = [] # 连续空行暂存，之后还有数据时才输出（末尾空行不计入，与read_excel一致）
+        for row_number, row in enumerate(wb[sheet].iter_rows()):
+            if row_number < header_row:
+                continue
+            values = [WorkbookSession._convert_cell(cell) for cell in row]
+            while values and values[-1] == "":
+                values.pop()
+            if names is None:
+                if not values:
+                    raise ValueError(f"第{row_number + 1}行表头为空")
+                # 表头列名（重复列名、空列名的处理）交由TextParser生成，与read_excel一致
+                names = list(pd.io.parsers.TextParser([values], header=0).read().columns)
+                continue
+            if not values:
+                blank_rows.append(values)
+                continue
+            batch += blank_rows
+            blank_rows = []
+            batch.append(values)
+            if len(batch) >= batch_size:
+                df_batch = _rows_to_frame(batch, names, dtypes)
+                dtypes = list(df_batch.dtypes) if dtypes is None else dtypes
+                yield df_batch
+                batch = []
+        if batch:
+            yield _rows_to_frame(batch, names, dtypes)
+    finally:
+        wb.close()
+
+def expand_source_paths(text):
+    """
+    解析源数据输入框内容：多个路径以分号分隔，文件夹展开为其中的Excel文件（按文件名排序）
+    :return: 去重后的文件路径列表，保持输入顺序
+    """
+    paths = []
+    for part in re.split(r'[;；]', text or ""):
+        part = part.strip().strip('"')
+        if not part:
+            continue
+        if os.path.isdir(part):
+            for name in sorted(os.listdir(part)):
+                # 跳过Excel打开文件时产生的 ~$ 临时文件
+                if name.lower().endswith((".xlsx", ".xls")) and not name.startswith("~$"):
+                    paths.append(os.path.join(part, name))
+        else:
+            paths.append(part)
+    return list(dict.fromkeys(paths))
+
+class BidSourceNormalizer:
+    """
+    源数据整理：将各来源导出文件整理为统一Schema（不含厂商类型、所属行业两列的分类结果）
+    不依赖界面对象，日志通过log回调输出，可在子进程中运行
+    """
+    def __init__(self, target_columns, log=print):
+        self.target_columns = target_columns
+        self.log = log
+        self.error_status = None # 处理失败时对应的状态栏提示
+
+    def _fail(self, message, status):
+        self.log(message)
+        self.error_status = status
+        return None
+
+    # 区域拆分规则（作用于去除首尾空白后的区域字符串，省/市/区均以第一次出现的位置为准）：
+    # 省份：开头到“省”字（不含“省”）；无“省”则未知
+    # 市：“省”后到“市”字（不含“市”）；无“省”或“市”在“省”之前则从开头到“市”字；无“市”则未知
+    # 区县：“市”后到“区”字（含“区”）；无“市”或“区”在“市”之前则从开头到“区”字；无“区”则未知
+    # 边界情况见 tests/test_bid_analysis_tool.py 中的 REGION_CASES
+    REGION_PROVINCE_RE = re.compile(r'^([^省]*)省')
+    REGION_CITY_AFTER_PROVINCE_RE = re.compile(r'^[^省市]*省([^市]*)市')
+    REGION_CITY_RE = re.compile(r'^([^市]*)市')
+    REGION_DISTRICT_AFTER_CITY_RE = re.compile(r'^[^市区]*市([^区]*区)')
+    REGION_DISTRICT_RE = re.compile(r'^([^区]*区)')
+
+    @classmethod
+    def split_region_column(cls, regions):
+        """
+        拆分区域列为省、市、区县：只对去重后的区域字符串做正则提取，再按factorize编码广播回原行
+        :param regions: 区域Series
+        :return: (省份, 市, 区县) 三个与regions等长的ndarray
+        """
+        codes, uniques = pd.factorize(regions) # 空值编码为-1
+        text = pd.Series(uniques, dtype=object).astype(str).str.strip()
+        province = text.str.extract(cls.REGION_PROVINCE_RE, expand=False)
+        city = text.str.extract(cls.REGION_CITY_AFTER_PROVINCE_RE, expand=False).fillna(
+            text.str.extract(cls.REGION_CITY_RE, expand=False))
+        district = text.str.extract(cls.REGION_DISTRICT_AFTER_CITY_RE, expand=False).fillna(
+            text.str.extract(cls.REGION_DISTRICT_RE, expand=False))
+        columns = []
+        for part in (province, city, district):
+            labels = part.fillna("未知").to_numpy(dtype=object).tolist()
+            labels.append("未知") # 下标-1取到末尾，即空值的拆分结果
+            columns.append(np.array(labels, dtype=object)[codes])
+        return tuple(columns)
+
+    # 将可能含有多个中标单位的字段拆分为多行。常见分隔符包括英文/中文逗号、顿号和分号。
+    @staticmethod
+    def split_bidders_field(val):
+        if pd.isna(val):
+            return [val]
+        parts = re.split(r'[，,、;；]+', str(val))
+        parts = [p.strip() for p in parts if p and p.strip()]
+        return parts if parts else [val] # 确保至少返回一个原始值
+
+    def _explode_bidders(self, df_new_bid):
+        """按中标单位拆分行，并为分包子行标记备注"""
+        # 构造列表列并 explode（向量化，效率高）
+        df_new_bid['中标单位_list'] = df_new_bid['中标单位'].apply(self.split_bidders_field)
+        # 记录每行原始中标单位个数，以便拆分后标记分包
+        df_new_bid['中标单位_count'] = df_new_bid['中标单位_list'].apply(len)
+        # explode依据列表列拆分行，reset_index重置索引,drop=True表示删除旧索引列
+        df_new_bid = df_new_bid.explode('中标单位_list').reset_index(drop=True) 
+        df_new_bid['中标单位'] = df_new_bid['中标单位_list']
+
+        # 标记分包：若某原始行拆分出多个中标单位，则拆分后的所有子行在备注列写入 '分包'
+        df_new_bid['备注'] = df_new_bid['备注'].fillna('')
+        df_new_bid.loc[df_new_bid['中标单位_count'] > 1, '备注'] = '分包' # loc用于基于条件、标签名选择并赋值
+
+        # 清理临时列
+        df_new_bid.drop(columns=['中标单位_list', '中标单位_count'], inplace=True) # inplace=True表示在原DataFrame上进行修改，不返回新的DataFrame，drop用于删除指定的列或行。
+        return df_new_bid
+
+    @staticmethod
+    def _strip_header(df_source):
+        """源数据列名去除首尾空白，与识别来源时的表头口径（ledger_key_text）一致"""
+        df_source.columns = [ledger_key_text(col) if isinstance(col, str) else col for col in df_source.columns]
+        return df_source
+
+    def _build_ict(self, df_source):
+        """由源数据（整表或一批）生成统一格式的项目记录，并按中标单位拆分行"""
+        df_source = self._strip_header(df_source)
+        df_new_bid = pd.DataFrame(columns=self.target_columns)
+        
+        # 按照列名映射关系提取数据
+        df_new_bid["省份"], df_new_bid["市"], df_new_bid["区县"] = self.split_region_column(df_source["区域"]) # 只拆分去重后的区域取值
+        ## 日期格式转换
+        df_source["发布时间"] = pd.to_datetime(df_source["发布时间"], errors='coerce')  # errors='coerce'参数用于将无法解析的日期转换为NaT（Not a Time），避免程序报错。
+        df_new_bid["中标月份"] = df_source["发布时间"].dt.strftime("%Y%m") # %m表示月份是两位数格式，不足补0
+        df_new_bid["中标年份"] = df_source["发布时间"].dt.strftime("%y年") # %y表示两位数年份
+        df_new_bid['中标时间'] = df_source['发布时间'].dt.strftime("%Y-%m-%d")
+        
+        df_new_bid['招标类型'] = df_source['公告类型']
+        df_new_bid['项目名称'] = df_source['公告名称']
+        df_new_bid['招标单位'] = df_source['招标单位']
+        df_new_bid['中标单位'] = df_source['中标单位']
+        df_new_bid['中标金额（万元）'] = df_source['中标金额（万元）']
+        df_new_bid['所属行业（ICT）'] = df_source['所属行业']
+        df_new_bid['所属业务类型（ICT）'] = df_source['所属业务类型']
+        df_new_bid['公告内容（ICT）'] = df_source['公告内容']
+        # 标记数据来源
+        df_new_bid['数据来源'] = "ICT标局"
+
+        return self._explode_bidders(df_new_bid)
+
+    def process_ict(self, source_path):
+        self.log("正在使用 [ICT标局] 格式进行处理项目记录...")
+        try:
+            df_source = pd.read_excel(source_path, header=1)  # header=1表示第二行是列名
+        except Exception as e:
+            return self._fail(f"错误: 读取源数据失败 - {e}", "源数据读取失败")
+
+        try:
+            df_new_bid = self._build_ict(df_source)
+            self.log(f"共处理 {len(df_new_bid)} 条记录 (含拆分后的中标单位行数)")
+        except Exception as e:
+            return self._fail(f"错误: 处理源数据失败，请检查sheet名称和列名 - {e}", "源数据处理失败")
+        return df_new_bid
+
+    def _build_province(self, df_source):
+        """由源数据（整表或一批）生成统一格式的项目记录，并按中标单位拆分行"""
+        df_source = self._strip_header(df_source)
+        df_new_bid = pd.DataFrame(columns=self.target_columns)
+        
+        # 按照列名映射关系提取数据
+        df_new_bid["省份"] = df_source['省份']
+        df_new_bid["市"] = df_source['市']
+        df_new_bid["区县"] = df_source['区县']
+        df_new_bid['中标月份'] = df_source['中标月份']
+        df_new_bid['中标时间'] = df_source['中标时间']
+        df_new_bid['中标年份'] = pd.to_datetime(df_new_bid['中标时间'], errors='coerce').dt.strftime("%y年")
+        df_new_bid['招标类型'] = df_source['招标类型']
+        df_new_bid['项目名称'] = df_source['项目名称']
+        df_new_bid['招标单位'] = df_source['招标单位']
+        df_new_bid['中标单位'] = df_source['中标公司'] if '中标公司' in df_source.columns else df_source['中标单位']
+        df_new_bid['中标金额（万元）'] = df_source['中标金额'] / 10000
+        df_new_bid['行业（省公司）'] = df_source['行业']
+        # 标记数据来源
+        df_new_bid['数据来源'] = "省公司"
+
+        return self._explode_bidders(df_new_bid)
+
+    def process_province(self, source_path):
+        self.log("正在使用 [省公司] 格式进行处理项目记录...")
+        try:
+            sheet_names = pd.ExcelFile(source_path).sheet_names
+            target_sheet = next((sheet for sheet in sheet_names if "中标" in sheet), None) # Next函数用于从可迭代对象中获取第一个满足条件的元素。如果没有找到满足条件的元素，则返回None。
+            if not target_sheet:
+                return self._fail("错误: 未找到名称包含 '中标' 的Sheet", "源数据读取失败")
+            df_source = pd.read_excel(source_path, sheet_name=target_sheet) 
+        except Exception as e:
+            return self._fail(f"错误: 读取源数据失败 - {e}", "源数据读取失败")
+
+        try:
+            df_new_bid = self._build_province(df_source)
+            self.log(f"共处理 {len(df_new_bid)} 条记录 (含拆分后的中标单位行数)")
+        except Exception as e:
+            return self._fail(f"错误: 处理源数据失败，请检查sheet名称和列名 - {e}", "源数据处理失败")
+        return df_new_bid
+
+    def _build_shushuo(self, df_source):
+        """由源数据（整表或一批）生成统一格式的项目记录，并按中标单位拆分行"""
+        df_source = self._strip_header(df_source)
+        df_new_bid = pd.DataFrame(columns=self.target_columns)
+        
+        # 按照列名映射关系提取数据
+        df_new_bid["市"] = df_source['市']
+        df_new_bid["区县"] = df_source['区/县']
+        df_new_bid['省份'] = "陕西"
+        df_new_bid['中标年份'] = df_source['中标年份']
+        df_new_bid['中标月份'] = df_source['中标月份']
+        df_new_bid['招标类型'] = "中标公告"
+        df_new_bid['项目名称'] = df_source['项目名称']
+        df_new_bid['招标单位'] = df_source['招采单位']
+        df_new_bid['中标单位'] = df_source['中标公司']
+        df_new_bid['中标金额（万元）'] = df_source['中标金额']
+        df_new_bid['公告内容（ICT）'] = df_source['项目建设内容']
+        # 标记数据来源
+        df_new_bid['数据来源'] = "数说123"
+
+        return self._explode_bidders(df_new_bid)
+
+    def process_shushuo(self, source_path):
+        self.log("正在使用 [数说123] 格式进行处理项目记录...")
+        try:
+            df_source = pd.read_excel(source_path, sheet_name='中标项目') 
+        except Exception as e:
+            return self._fail(f"错误: 读取源数据失败 - {e}", "源数据读取失败")
+
+        try:
+            df_new_bid = self._build_shushuo(df_source)
+            self.log(f"共处理 {len(df_new_bid)} 条记录 (含拆分后的中标单位行数)")
+        except Exception as e:
+            return self._fail(f"错误: 处理源数据失败，请检查sheet名称和列名 - {e}", "源数据处理失败")
+        return df_new_bid
+
+    SOURCE_LABELS = {"ict": "ICT标局", "province": "省公司", "shushuo": "数说123"}
+
+    def iter_batches(self, kind, source_path, batch_size=SOURCE_BATCH_SIZE):
+        """
+        流式整理：分批读取源数据，逐批返回整理后的DataFrame；读取或整理失败时记录错误（error_status）并停止
+        Sheet选择规则与表头行取自SOURCE_HEADER_SIGNATURES，与对应的process_*方法一致
+        """
+        build = {"ict": self._build_ict, "province": self._build_province, "shushuo": self._build_shushuo}[kind]
+        _, select_sheet, header_row, _ = next(signature for signature in SOURCE_HEADER_SIGNATURES if signature[0] == kind)
+        self.log(f"正在使用 [{self.SOURCE_LABELS[kind]}] 格式分批处理项目记录（每批 {batch_size} 行）...")
+        reader = iter_sheet_batches(source_path, select_sheet, header_row, batch_size)
+        total = 0
+        while True:
+            try:
+                df_source = next(reader, None)
+            except Exception as e:
+                self._fail(f"错误: 读取源数据失败 - {e}", "源数据读取失败")
+                return
+            if df_source is None:
+                break
+            try:
+                df_new_bid = build(df_source)
+            except Exception as e:
+                self._fail(f"错误: 处理源数据失败，请检查sheet名称和列名 - {e}", "源数据处理失败")
+                return
+            total += len(df_new_bid)
+            yield df_new_bid
+        self.log(f"共处理 {total} 条记录 (含拆分后的中标单位行数)")
+
+    def normalize(self, kind, source_path):
+        """按来源类型整理源数据，失败返回None"""
+        process = {"ict": self.process_ict, "province": self.process_province, "shushuo": self.process_shushuo}[kind]
+        return process(source_path)
+
+def normalize_source_file(kind, source_path, target_columns):
+    """
+    多源导入时在子进程中执行：整理单个源数据文件（需为模块级函数以便pickle）
+    :return: (整理后的DataFrame或None, 日志行列表, 失败时的状态栏提示)
+    """
+    logs = []
+    normalizer = BidSourceNormalizer(target_columns, log=logs.append)
+    df_new_bid = normalizer.normalize(kind, source_path)
+    return df_new_bid, logs, normalizer.error_status
+
+LOG_FILE_NAME = "bid_analysis_log.log" # 完整日志文件，保存在程序目录下
+LOG_WIDGET_MAX_LINES = 5000 # 日志框最多保留的行数，超出部分只保留在日志文件中
+LOG_PUMP_INTERVAL_MS = 100 # 主线程取日志队列的间隔（毫秒）
+LOG_PUMP_BATCH_SIZE = 1000 # 每次最多取出的消息条数
+
+class ProgressReporter:
+    """
+    逐行处理进度汇总：按时间间隔输出一条“已处理/新增/跳过/速度”日志，代替逐行日志
+    """
+    def __init__(self, log, total, label, interval=2.0):
+        self.log = log
+        self.total = total
+        self.label = label
+        self.interval = interval
+        self.start = time.perf_counter()
+        self.last_report = self.start
+
+    def _report(self, processed, added, skipped):
+        elapsed = time.perf_counter() - self.start
+        speed = processed / elapsed if elapsed > 0 else 0.0
+        total = f"/{self.total}" if self.total is not None else "" # 流式处理时总数未知
+        self.log(f"{self.label}进度：已处理 {processed}{total} 条，新增 {added} 条，跳过 {skipped} 条，{speed:.0f} 条/秒")
+
+    def update(self, processed, added, skipped):
+        now = time.perf_counter()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            self._report(processed, added, skipped)
+
+    def finish(self, processed, added, skipped):
+        self._report(processed, added, skipped)
+
 class BidAnalysisApp:
     def __init__(self, root):
         self.root = root
@@ -26,6 +1626,12 @@ class BidAnalysisApp:
         self.project_file_path = tk.StringVar()
         self.company_file_path = tk.StringVar()
         self.status_msg = tk.StringVar(value="就绪")
+        self.dedup_audit_mode = tk.BooleanVar(value=False) # 查重审计模式：逐对difflib计算，不做LCS预筛
+        self.company_incremental = tk.BooleanVar(value=True) # 公司增量统计：只处理新增/变化的项目
+        self.company_verify = tk.BooleanVar(value=False) # 增量统计后再全量重算一次，校验结果一致
+        self.cross_source_enabled = tk.BooleanVar(value=False) # 跨来源消解（需勾选开启）：不同来源报送的同一中标结果只录入一次
+        self.cross_source_threshold = tk.DoubleVar(value=0.8) # 跨来源消解相似度阈值，越高越严格（精确），越低越宽松（召回）
+        self.label_cache = None # 关键词分类缓存，项目汇总流程中打开
 
         # 默认配置路径（如果存在）
         default_config = os.path.join(os.path.dirname(__file__), "关键词配置表.xlsx")
@@ -42,7 +1648,17 @@ class BidAnalysisApp:
         # 用于保证同一时间只有一个分析线程在运行
         self.analysis_lock = threading.Lock() # 互斥锁
 
+        # 日志：分析线程只把消息放入队列，由主线程定时批量写入日志框；完整日志同时写入文件
+        self.log_queue = queue.Queue()
+        self.logger = logging.getLogger("bid_analysis_tool")
+        self.logger.setLevel(logging.INFO)
+        if not self.logger.handlers:
+            handler = logging.FileHandler(os.path.join(os.path.dirname(os.path.abspath(__file__)), LOG_FILE_NAME), encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+            self.logger.addHandler(handler)
+
         self._create_ui()
+        self.root.after(LOG_PUMP_INTERVAL_MS, self._drain_log_queue)
 
     def _create_ui(self):
         # 1. 文件选择区域
@@ -53,6 +1669,7 @@ class BidAnalysisApp:
         tk.Label(frame_files, text="项目源数据(Excel):").grid(row=0, column=0, sticky="w") # sticky="w"表示标签左对齐，grid方法用于将控件放置在网格布局中的指定行和列。
         tk.Entry(frame_files, textvariable=self.source_file_path, width=80).grid(row=0, column=1, padx=5)
         tk.Button(frame_files, text="浏览...", command=self.select_source_file).grid(row=0, column=2)
+        tk.Button(frame_files, text="文件夹...", command=self.select_source_folder).grid(row=0, column=3, padx=5)
 
         # 配置文件
         tk.Label(frame_files, text="关键词配置(Excel):").grid(row=1, column=0, sticky="w")
@@ -75,6 +1692,11 @@ class BidAnalysisApp:
 
         tk.Button(frame_actions, text="项目汇总", command=self.start_project_analysis_thread, bg="#4CAF50", fg="white", font=("Microsoft YaHei", 10, "bold")).pack(side="left", padx=5)
         tk.Button(frame_actions, text="公司汇总", command=self.start_company_analysis_thread, bg="#4CAF50", fg="white", font=("Microsoft YaHei", 10, "bold")).pack(side="left", padx=50) # padx表示按钮之间的水平间距
+        tk.Checkbutton(frame_actions, text="查重审计模式", variable=self.dedup_audit_mode).pack(side="left", padx=5)
+        tk.Checkbutton(frame_actions, text="公司增量统计", variable=self.company_incremental).pack(side="left", padx=5)
+        tk.Checkbutton(frame_actions, text="全量校验", variable=self.company_verify).pack(side="left", padx=5)
+        tk.Checkbutton(frame_actions, text="跨来源消解", variable=self.cross_source_enabled).pack(side="left", padx=5)
+        tk.Spinbox(frame_actions, from_=0.5, to=1.0, increment=0.05, width=5, textvariable=self.cross_source_threshold).pack(side="left", padx=0)
         tk.Label(frame_actions, textvariable=self.status_msg, fg="blue").pack(side="left", padx=0)
 
         # 3. 日志区域
@@ -84,14 +1706,74 @@ class BidAnalysisApp:
         self.log_text = scrolledtext.ScrolledText(frame_log, height=20)
         self.log_text.pack(fill="both", expand=True)
 
-    def log(self, message):
-        self.log_text.insert(tk.END, message + "\n")
+    def log(self, message, widget=True):
+        """
+        记录日志（可在任意线程调用）：写入日志文件，并放入队列由主线程显示
+        :param widget: 为False时只写入日志文件（如逐行明细），不显示在日志框
+        """
+        self.logger.info(message)
+        if widget:
+            self.log_queue.put(("log", message))
+
+    def set_status(self, message):
+        """更新状态栏（可在任意线程调用）"""
+        self.log_queue.put(("status", message))
+
+    def _post_ui(self, func, *args):
+        """在主线程中执行界面操作（如弹窗），分析线程不直接操作Tk"""
+        self.log_queue.put(("call", func, args))
+
+    def _drain_log_queue(self):
+        """
+        主线程定时取出队列中的消息：日志合并为一次插入，日志框只保留最近LOG_WIDGET_MAX_LINES行
+        投递的界面操作出错时只记录日志，不影响后续消息；无论是否出错都会安排下一次取出
+        """
+        lines = []
+        try:
+            for _ in range(LOG_PUMP_BATCH_SIZE):
+                item = self.log_queue.get_nowait()
+                if item[0] == "log":
+                    lines.append(item[1])
+                    continue
+                # 状态和弹窗之前的日志先显示，保证顺序
+                self._flush_log_lines(lines)
+                lines = []
+                try:
+                    if item[0] == "status":
+                        self.status_msg.set(item[1])
+                    else:
+                        item[1](*item[2])
+                except Exception as e:
+                    self.logger.exception("界面更新出错")
+                    lines.append(f"界面更新出错: {str(e)}")
+        except queue.Empty:
+            pass
+        finally:
+            try:
+                self._flush_log_lines(lines)
+            finally:
+                self.root.after(LOG_PUMP_INTERVAL_MS, self._drain_log_queue)
+
+    def _flush_log_lines(self, lines):
+        if not lines:
+            return
+        self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+        line_count = int(self.log_text.index("end-1c").split(".")[0]) - 1
+        if line_count > LOG_WIDGET_MAX_LINES:
+            self.log_text.delete("1.0", f"{line_count - LOG_WIDGET_MAX_LINES + 1}.0")
         self.log_text.see(tk.END) # see方法用于将文本框的视图滚动到最后一行，以确保最新的日志消息始终可见。
 
     def select_source_file(self):
-        filename = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx;*.xls")])
-        if filename:
-            self.source_file_path.set(filename)
+        # 可多选，多个文件以分号分隔
+        filenames = filedialog.askopenfilenames(filetypes=[("Excel files", "*.xlsx;*.xls")])
+        if filenames:
+            self.source_file_path.set(";".join(filenames))
+
+    def select_source_folder(self):
+        # 选择文件夹时导入其中全部Excel文件
+        folder = filedialog.askdirectory()
+        if folder:
+            self.source_file_path.set(folder)
 
     def select_config_file(self):
         filename = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx;*.xls")])
@@ -108,16 +1790,19 @@ class BidAnalysisApp:
         if filename:
             self.company_file_path.set(filename)
 
-    def _start_thread_with_lock(self, target, start_msg="正在运行分析..."):
-        """尝试获取分析锁并在单独线程中运行 target；若已被占用则提示用户。"""
+    def _start_thread_with_lock(self, target, start_msg="正在运行分析...", args=()):
+        """
+        尝试获取分析锁并在单独线程中运行 target(*args)；若已被占用则提示用户。
+        界面变量（tk.Variable）只能在主线程读取，参数须在调用前由主线程读出后以普通值传入
+        """
         if not self.analysis_lock.acquire(blocking=False): 
             messagebox.showwarning("提示", "已有分析在运行，请稍后再试。")
             return
 
         def _worker():
             try:
-                self.status_msg.set(start_msg)
-                target()
+                self.set_status(start_msg)
+                target(*args)
             finally:
                 try:
                     self.analysis_lock.release()
@@ -129,262 +1814,150 @@ class BidAnalysisApp:
         thread.start()
 
     def start_project_analysis_thread(self):
-        if not self.source_file_path.get():
+        # 所有界面设置在主线程读出，后台线程只使用普通值
+        source_text = self.source_file_path.get()
+        config_path = self.config_file_path.get()
+        project_path = self.project_file_path.get()
+        if not source_text:
             messagebox.showwarning("提示", "请选择源数据文件")
             return
-        if not self.config_file_path.get():
+        if not config_path:
             messagebox.showwarning("提示", "请选择关键词配置文件")
             return
-        if not self.project_file_path.get():
+        if not project_path:
             messagebox.showwarning("提示", "请选择项目汇总文件")
             return
+        cross_source_threshold = None # 不做跨来源消解
+        if self.cross_source_enabled.get():
+            try:
+                cross_source_threshold = float(self.cross_source_threshold.get())
+            except (tk.TclError, ValueError):
+                messagebox.showwarning("提示", "跨来源消解阈值须为0~1之间的数字")
+                return
         
         # 通过锁保证与公司汇总不并发运行
-        self._start_thread_with_lock(self.run_project_analysis_workflow, start_msg="正在整理项目信息...")
+        self._start_thread_with_lock(
+            self.run_project_analysis_workflow, start_msg="正在整理项目信息...",
+            args=(source_text, config_path, project_path, self.dedup_audit_mode.get(), cross_source_threshold)
+            )
 
     def start_company_analysis_thread(self):
-        if not self.company_file_path.get():
+        company_path = self.company_file_path.get()
+        if not company_path:
             messagebox.showwarning("提示", "请选择公司汇总文件")
             return
         # 通过锁保证与项目汇总不并发运行
-        self._start_thread_with_lock(self.run_company_analysis_workflow, start_msg="正在汇总公司信息...")
-
-    def _split_region_direct(self, region):
-        """拆分区域字符串为省、市、区县"""
-        if pd.isna(region) or region.strip() == "":
-            return "未知", "未知", "未知"
-        
-        region = region.strip()
-        p_idx = region.find("省")  # 省的位置（无则返回-1）
-        c_idx = region.find("市")  # 市的位置（无则返回-1）
-        d_idx = region.find("区")  # 区的位置（无则返回-1）
-        
-        # 拆分省份：从开头到“省”字（不含“省”），无“省”则未知
-        province = region[:p_idx] if p_idx != -1 else "未知"
-        
-        # 拆分市：从“省”后到“市”字（不含“市”），无“省”则从开头找“市”，无“市”则未知
-        if p_idx != -1 and c_idx != -1 and c_idx > p_idx:
-            city = region[p_idx+1:c_idx] 
-        elif c_idx != -1:  # 极端情况：无“省”但有“市”（如“西安市雁塔区”）
-            city = region[:c_idx]
-        else:
-            city = "未知"
-        
-        # 拆分区县：从“市”后到“区”字（包含“区”），无“市”则从“省”后找“区”，无“区”则未知
-        if c_idx != -1 and d_idx != -1 and d_idx > c_idx:
-            district = region[c_idx+1:d_idx+1]
-        elif d_idx != -1:  # 极端情况：仅“区”（如“雁塔区”）
-            district = region[:d_idx+1]
-        else:
-            district = "未知"
-        
-        return province, city, district
+        self._start_thread_with_lock(
+            self.run_company_analysis_workflow, start_msg="正在汇总公司信息...",
+            args=(company_path, self.company_incremental.get(), self.company_verify.get())
+            )
 
-    def _get_keyword_best_match(self, text, keyword_map, default_val):
-        if not keyword_map:
+    def _get_keyword_best_match(self, text, matcher, default_val):
+        # matcher为加载配置时编译好的KeywordMatcher，单遍扫描得到各类别命中数
+        if matcher is None:
             return default_val
-        hit_counts = {k: 0 for k in keyword_map.keys()}
-        for k, kws in keyword_map.items():
-            for kw in kws:
-                if kw in text:
-                    hit_counts[k] += 1
-        max_hits = max(hit_counts.values())
-        if max_hits > 0:
-            for k, count in hit_counts.items():
-                if count == max_hits:
-                    return k
-        return default_val
+        return matcher.best_match(text, default_val)
     
-    def _analyze_vendor(self, row):
-            if '中标单位' not in row or pd.isna(row.get('中标单位', "")):
-                return "未知"
-            return self._get_keyword_best_match(str(row['中标单位']), self.vendor_map, "其他厂商")
+    def _classify_distinct(self, values, matcher, default_val, na_val=None, kind=None):
+        """
+        对整列文本只分类去重后的取值，再按factorize编码广播回原行
+        :param values: 待分类的文本Series
+        :param na_val: 空值对应的分类结果，为None时空值按字符串"nan"参与匹配
+        :param kind: 分类种类，已加载分类缓存时先查缓存，只对未命中的文本做关键词匹配
+        :return: 与values等长的分类结果ndarray
+        """
+        if na_val is None:
+            values = values.astype(str)
+        codes, uniques = pd.factorize(values) # codes为每行对应uniques的下标，空值编码为-1
+        texts = [str(u) for u in uniques]
+        if self.label_cache is not None and kind is not None:
+            labels = self.label_cache.classify(kind, texts, lambda text: self._get_keyword_best_match(text, matcher, default_val))
+        else:
+            labels = [self._get_keyword_best_match(text, matcher, default_val) for text in texts]
+        labels.append(na_val) # 下标-1取到末尾，即空值的分类结果
+        return np.array(labels, dtype=object)[codes]
 
-    def _analyze_industry(self, row):
+    def _analyze_vendor(self, df):
+        if '中标单位' not in df.columns:
+            return np.full(len(df), "未知", dtype=object)
+        return self._classify_distinct(df['中标单位'], self.vendor_matcher, "其他厂商", na_val="未知", kind="厂商类型")
+
+    def _analyze_industry(self, df):
         cols = ['项目名称', '招标单位', '所属行业（ICT）', '所属业务类型（ICT）', '行业（省公司）']
-        text = ""
-        for c in cols:
-            text += str(row.get(c, "")) + " "
-        return self._get_keyword_best_match(text, self.industry_map, "未分类")
+        # 列向量化拼接文本，与逐行 str(value) + " " 拼接结果一致（空值为"nan"）
+        parts = [df[c].astype(str) if c in df.columns else pd.Series("", index=df.index) for c in cols]
+        text = parts[0].str.cat(parts[1:], sep=" ") + " "
+        return self._classify_distinct(text, self.industry_matcher, "未分类")
+
+    def _classify_bid_frame(self, df_new_bid):
+        """批量计算厂商类型、项目所属行业两列（拆分中标单位后调用）"""
+        df_new_bid['中标厂商类型'] = self._analyze_vendor(df_new_bid)
+        df_new_bid['项目所属行业'] = self._analyze_industry(df_new_bid)
     
-    # 将可能含有多个中标单位的字段拆分为多行。常见分隔符包括英文/中文逗号、顿号和分号。
-    def _split_bidders_field(self, val):
-        if pd.isna(val):
-            return [val]
-        parts = re.split(r'[，,、;；]+', str(val))
-        parts = [p.strip() for p in parts if p and p.strip()]
-        return parts if parts else [val] # 确保至少返回一个原始值
-
-    def _process_ict_data(self, source_path):
-        self.log("正在使用 [ICT标局] 格式进行处理项目记录...")
-        try:
-            df_source = pd.read_excel(source_path, header=1)  # header=1表示第二行是列名
-        except Exception as e:
-            self.log(f"错误: 读取源数据失败 - {e}")
-            self.status_msg.set("源数据读取失败")
-            return None
-
-        df_new_bid = pd.DataFrame(columns=self.target_columns)
-        
-        try:
-            # 按照列名映射关系提取数据
-            df_new_bid["省份"], df_new_bid["市"], df_new_bid["区县"] = zip(*df_source["区域"].apply(self._split_region_direct)) # apply方法返回值类型为一个Series，*将Series解压为多个元组，zip将每个元组同一位置的元素组合成一个新的元组
-            ## 日期格式转换
-            df_source["发布时间"] = pd.to_datetime(df_source["发布时间"], errors='coerce')  # errors='coerce'参数用于将无法解析的日期转换为NaT（Not a Time），避免程序报错。
-            df_new_bid["中标月份"] = df_source["发布时间"].dt.strftime("%Y%m") # %m表示月份是两位数格式，不足补0
-            df_new_bid["中标年份"] = df_source["发布时间"].dt.strftime("%y年") # %y表示两位数年份
-            df_new_bid['中标时间'] = df_source['发布时间'].dt.strftime("%Y-%m-%d")
-            
-            df_new_bid['招标类型'] = df_source['公告类型']
-            df_new_bid['项目名称'] = df_source['公告名称']
-            df_new_bid['招标单位'] = df_source['招标单位']
-            df_new_bid['中标单位'] = df_source['中标单位']
-            df_new_bid['中标金额（万元）'] = df_source['中标金额（万元）']
-            df_new_bid['所属行业（ICT）'] = df_source['所属行业']
-            df_new_bid['所属业务类型（ICT）'] = df_source['所属业务类型']
-            df_new_bid['公告内容（ICT）'] = df_source['公告内容']
-            # 标记数据来源
-            df_new_bid['数据来源'] = "ICT标局"
-
-            # 构造列表列并 explode（向量化，效率高）
-            df_new_bid['中标单位_list'] = df_new_bid['中标单位'].apply(self._split_bidders_field)
-            # 记录每行原始中标单位个数，以便拆分后标记分包
-            df_new_bid['中标单位_count'] = df_new_bid['中标单位_list'].apply(len)
-            # explode依据列表列拆分行，reset_index重置索引,drop=True表示删除旧索引列
-            df_new_bid = df_new_bid.explode('中标单位_list').reset_index(drop=True) 
-            df_new_bid['中标单位'] = df_new_bid['中标单位_list']
-
-            # 标记分包：若某原始行拆分出多个中标单位，则拆分后的所有子行在备注列写入 '分包'
-            df_new_bid['备注'] = df_new_bid['备注'].fillna('')
-            df_new_bid.loc[df_new_bid['中标单位_count'] > 1, '备注'] = '分包' # loc用于基于条件、标签名选择并赋值
-
-            # 清理临时列
-            df_new_bid.drop(columns=['中标单位_list', '中标单位_count'], inplace=True) # inplace=True表示在原DataFrame上进行修改，不返回新的DataFrame，drop用于删除指定的列或行。
-
-            # 计算基于单行中标单位的分析列
-            df_new_bid['中标厂商类型'] = df_new_bid.apply(self._analyze_vendor, axis=1)
-            df_new_bid['项目所属行业'] = df_new_bid.apply(self._analyze_industry, axis=1)
-
-            self.log(f"共处理 {len(df_new_bid)} 条记录 (含拆分后的中标单位行数)")
-        except Exception as e:
-            self.log(f"错误: 处理源数据失败，请检查sheet名称和列名 - {e}")
-            self.status_msg.set("源数据处理失败")
-            return None
-        return df_new_bid
-
-    def _process_province_data(self, source_path):
-        self.log("正在使用 [省公司] 格式进行处理项目记录...")
-        try:
-            sheet_names = pd.ExcelFile(source_path).sheet_names
-            target_sheet = next((sheet for sheet in sheet_names if "中标" in sheet), None) # Next函数用于从可迭代对象中获取第一个满足条件的元素。如果没有找到满足条件的元素，则返回None。
-            if not target_sheet:
-                self.log("错误: 未找到名称包含 '中标' 的Sheet")
-                self.status_msg.set("源数据读取失败")
-                return None
-            df_source = pd.read_excel(source_path, sheet_name=target_sheet) 
-        except Exception as e:
-            self.log(f"错误: 读取源数据失败 - {e}")
-            self.status_msg.set("源数据读取失败")
-            return None
-
-        df_new_bid = pd.DataFrame(columns=self.target_columns)
-        
-        try:
-            # 按照列名映射关系提取数据
-            df_new_bid["省份"] = df_source['省份']
-            df_new_bid["市"] = df_source['市']
-            df_new_bid["区县"] = df_source['区县']
-            df_new_bid['中标月份'] = df_source['中标月份']
-            df_new_bid['中标时间'] = df_source['中标时间']
-            df_new_bid['中标年份'] = pd.to_datetime(df_new_bid['中标时间'], errors='coerce').dt.strftime("%y年")
-            df_new_bid['招标类型'] = df_source['招标类型']
-            df_new_bid['项目名称'] = df_source['项目名称']
-            df_new_bid['招标单位'] = df_source['招标单位']
-            df_new_bid['中标单位'] = df_source['中标公司'] if '中标公司' in df_source.columns else df_source['中标单位']
-            df_new_bid['中标金额（万元）'] = df_source['中标金额'] / 10000
-            df_new_bid['行业（省公司）'] = df_source['行业']
-            # 标记数据来源
-            df_new_bid['数据来源'] = "省公司"
-
-            # 构造列表列并 explode（向量化，效率高）
-            df_new_bid['中标单位_list'] = df_new_bid['中标单位'].apply(self._split_bidders_field)
-            # 记录每行原始中标单位个数，以便拆分后标记分包
-            df_new_bid['中标单位_count'] = df_new_bid['中标单位_list'].apply(len)
-            # explode依据列表列拆分行，reset_index重置索引,drop=True表示删除旧索引列
-            df_new_bid = df_new_bid.explode('中标单位_list').reset_index(drop=True) 
-            df_new_bid['中标单位'] = df_new_bid['中标单位_list']
-
-            # 标记分包：若某原始行拆分出多个中标单位，则拆分后的所有子行在备注列写入 '分包'
-            
-            df_new_bid['备注'] = df_new_bid['备注'].fillna('')
-            df_new_bid.loc[df_new_bid['中标单位_count'] > 1, '备注'] = '分包' # loc用于基于条件、标签名选择并赋值
-
-            # 清理临时列
-            df_new_bid.drop(columns=['中标单位_list', '中标单位_count'], inplace=True) # inplace=True表示在原DataFrame上进行修改，不返回新的DataFrame，drop用于删除指定的列或行。
-
-            # 计算基于单行中标单位的分析列
-            df_new_bid['中标厂商类型'] = df_new_bid.apply(self._analyze_vendor, axis=1)
-            df_new_bid['项目所属行业'] = df_new_bid.apply(self._analyze_industry, axis=1)
-
-            self.log(f"共处理 {len(df_new_bid)} 条记录 (含拆分后的中标单位行数)")
-        except Exception as e:
-            self.log(f"错误: 处理源数据失败，请检查sheet名称和列名 - {e}")
-            self.status_msg.set("源数据处理失败")
-            return None
-        return df_new_bid
-
-    def _process_shushuo_data(self, source_path):
-        self.log("正在使用 [数说123] 格式进行处理项目记录...")
+    def _iter_source_batches(self, sources):
+        """
+        按输入顺序逐批返回整理并分类后的源数据，厂商类型、所属行业两列在主进程中按批分类
+        :param sources: [(来源类型, 文件路径)]
+        单个文件或大文件在主进程中流式分批整理，峰值内存由批大小决定；多个较小文件用进程池并行整理，每个文件整体作为一批
+        流式整理在已返回部分数据后失败时抛出异常，避免只导入半个文件
+        """
+        streamed = [len(sources) == 1 or os.path.getsize(path) >= SOURCE_STREAM_MIN_BYTES for _, path in sources]
+        pooled = [source for source, stream in zip(sources, streamed) if not stream]
+        pool = None
+        futures = {}
+        if pooled:
+            workers = min(len(pooled), os.cpu_count() or 1)
+            self.log(f"共 {len(sources)} 个源数据文件，使用 {workers} 个进程并行整理{f'（{len(sources) - len(pooled)} 个大文件分批整理）' if len(pooled) < len(sources) else ''}...")
+            pool = ProcessPoolExecutor(max_workers=workers)
+            futures = {path: pool.submit(normalize_source_file, kind, path, self.target_columns) for kind, path in pooled}
+
+        success_count = 0
+        total = 0
         try:
-            df_source = pd.read_excel(source_path, sheet_name='中标项目') 
-        except Exception as e:
-            self.log(f"错误: 读取源数据失败 - {e}")
-            self.status_msg.set("源数据读取失败")
-            return None
-
-        df_new_bid = pd.DataFrame(columns=self.target_columns)
-        
-        try:
-            # 按照列名映射关系提取数据
-            df_new_bid["市"] = df_source['市']
-            df_new_bid["区县"] = df_source['区/县']
-            df_new_bid['省份'] = "陕西"
-            df_new_bid['中标年份'] = df_source['中标年份']
-            df_new_bid['中标月份'] = df_source['中标月份']
-            df_new_bid['招标类型'] = "中标公告"
-            df_new_bid['项目名称'] = df_source['项目名称']
-            df_new_bid['招标单位'] = df_source['招采单位']
-            df_new_bid['中标单位'] = df_source['中标公司']
-            df_new_bid['中标金额（万元）'] = df_source['中标金额']
-            df_new_bid['公告内容（ICT）'] = df_source['项目建设内容']
-           # 标记数据来源
-            df_new_bid['数据来源'] = "数说123"
-
-            # 构造列表列并 explode（向量化，效率高）
-            df_new_bid['中标单位_list'] = df_new_bid['中标单位'].apply(self._split_bidders_field)
-            # 记录每行原始中标单位个数，以便拆分后标记分包
-            df_new_bid['中标单位_count'] = df_new_bid['中标单位_list'].apply(len)
-            # explode依据列表列拆分行，reset_index重置索引,drop=True表示删除旧索引列
-            df_new_bid = df_new_bid.explode('中标单位_list').reset_index(drop=True) 
-            df_new_bid['中标单位'] = df_new_bid['中标单位_list']
-
-            # 标记分包：若某原始行拆分出多个中标单位，则拆分后的所有子行在备注列写入 '分包'
-            df_new_bid['备注'] = df_new_bid['备注'].fillna('')
-            df_new_bid.loc[df_new_bid['中标单位_count'] > 1, '备注'] = '分包' # loc用于基于条件、标签名选择并赋值
-
-            # 清理临时列
-            df_new_bid.drop(columns=['中标单位_list', '中标单位_count'], inplace=True) # inplace=True表示在原DataFrame上进行修改，不返回新的DataFrame，drop用于删除指定的列或行。
-
-            # 计算基于单行中标单位的分析列
-            df_new_bid['中标厂商类型'] = df_new_bid.apply(self._analyze_vendor, axis=1)
-            df_new_bid['项目所属行业'] = df_new_bid.apply(self._analyze_industry, axis=1)
-
-            self.log(f"共处理 {len(df_new_bid)} 条记录 (含拆分后的中标单位行数)")
-        except Exception as e:
-            self.log(f"错误: 处理源数据失败，请检查sheet名称和列名 - {e}")
-            self.status_msg.set("源数据处理失败")
-            return None
-        return df_new_bid
+            # 按输入顺序处理，保证合并后的行顺序与文件顺序一致
+            for (kind, path), stream in zip(sources, streamed):
+                if len(sources) > 1:
+                    self.log(f"[{os.path.basename(path)}]")
+                if stream:
+                    normalizer = BidSourceNormalizer(self.target_columns, log=self.log if len(sources) == 1 else (lambda line: self.log(f"  {line}")))
+                    yielded = 0
+                    for df_batch in normalizer.iter_batches(kind, path):
+                        # 计算基于单行中标单位的分析列（整列批量分类，相同文本只分类一次）
+                        self._classify_bid_frame(df_batch)
+                        yielded += len(df_batch)
+                        yield df_batch
+                    if normalizer.error_status:
+                        if yielded:
+                            raise RuntimeError(f"源数据 {os.path.basename(path)} 分批整理中途失败（已处理 {yielded} 条），本次不保存汇总文件")
+                        self.set_status(normalizer.error_status)
+                        continue
+                    total += yielded
+                else:
+                    try:
+                        df_part, logs, error_status = futures[path].result()
+                    except Exception as e:
+                        df_part, logs, error_status = None, [f"错误: 子进程整理源数据失败 - {e}"], "源数据处理失败"
+                    futures.pop(path)
+                    for line in logs:
+                        self.log(f"  {line}")
+                    if df_part is None:
+                        self.set_status(error_status or "源数据处理失败")
+                        continue
+                    self._classify_bid_frame(df_part)
+                    total += len(df_part)
+                    yield df_part
+                success_count += 1
+        finally:
+            if pool is not None:
+                for future in futures.values(): # 中途失败时取消尚未开始的整理任务
+                    future.cancel()
+                pool.shutdown(wait=True)
+
+        if self.label_cache is not None:
+            for kind, (hits, misses) in self.label_cache.stats.items():
+                self.log(f"[{kind}]分类缓存：命中 {hits} 个，未命中 {misses} 个（已分类并写入缓存）")
+        if len(sources) > 1:
+            self.log(f"源数据合并完成：成功 {success_count}/{len(sources)} 个文件，共 {total} 条记录")
 
     # def _update_summary_sheet(self, wb, sheet_name, bidder_stats, min_row_start):
     #     """
@@ -461,11 +2034,18 @@ class BidAnalysisApp:
         
     #     return updated_count, added_count
 
-    def run_project_analysis_workflow(self):
+    def run_project_analysis_workflow(self, source_text, config_path, project_path, dedup_audit=False, cross_source_threshold=None):
+        """
+        项目信息整理（在后台线程运行，参数由主线程从界面读出）
+        :param source_text: 源数据路径文本（多个文件或文件夹）
+        :param dedup_audit: 查重审计模式
+        :param cross_source_threshold: 跨来源消解相似度阈值，None表示不做跨来源消解
+        """
+        ledger_db = None
+        session = None
+        source_reader = None
         try:
-            source_path = self.source_file_path.get()
-            config_path = self.config_file_path.get()
-            project_path = self.project_file_path.get()
+            source_paths = expand_source_paths(source_text)
 
             self.log(f"正在加载配置文件: {config_path}")
             
@@ -476,7 +2056,7 @@ class BidAnalysisApp:
             except Exception as e:
                 self.log(f"错误: 读取配置文件失败 - {str(e)}")
                 self.log("请确保配置文件包含 '行业关键词' 和 '厂商关键词' 两个Sheet")
-                self.status_msg.set("配置读取失败")
+                self.set_status("配置读取失败")
                 return
 
             # 构建关键词字典
@@ -498,107 +2078,90 @@ class BidAnalysisApp:
                 if kw and kw != 'nan':
                     self.vendor_map[v_type].append(kw)
 
+            # 每次加载配置时编译一次多模式匹配器，逐行分类时只需单遍扫描文本
+            self.industry_matcher = KeywordMatcher(self.industry_map)
+            self.vendor_matcher = KeywordMatcher(self.vendor_map)
+
             self.log("关键词加载完成。")
-            self.log(f"正在读取源数据: {source_path}")
 
-            # 1.根据文件名选择处理逻辑，将项目数据整理为统一格式
-            filename = os.path.basename(source_path)
-            df_new_bid = None
-            
-            self.status_msg.set("正在处理源数据...")
-            if "ICT" in filename:
-                df_new_bid = self._process_ict_data(source_path)
-            elif "派单分析" in filename:
-                df_new_bid = self._process_province_data(source_path)
-            elif "数说123" in filename:
-                df_new_bid = self._process_shushuo_data(source_path)
-            else:
-                self.log("警告: 文件名未包含已知来源标识(ICT/派单分析/数说123)，请检查文件名...")
-                self.status_msg.set("未知源数据文件名")
-                messagebox.showwarning("提示", "文件名未包含已知来源标识(ICT/派单分析/数说123)，请检查文件名后重试。")
-                df_new_bid = None
+            # 厂商类型分类结果缓存：关键词配置变化时只失效受影响的条目（流程结束时淘汰超出上限的条目并关闭）
+            try:
+                self.label_cache = KeywordLabelCache(config_path)
+                invalidated = self.label_cache.sync_config("厂商类型", self.vendor_map, "其他厂商")
+                if invalidated > 0:
+                    self.log(f"关键词配置已修改，[厂商类型]分类缓存失效 {invalidated} 条")
+                elif invalidated < 0:
+                    self.log(f"[厂商类型]分类缓存首次使用: {self.label_cache.path}")
+            except Exception as e:
+                self.label_cache = None
+                self.log(f"警告: 分类缓存不可用，本次逐条分类 - {str(e)}")
+
+            # 1.根据表头签名（或文件名）选择处理逻辑，将项目数据整理为统一格式（多个文件时并行整理后合并）
+            sources = []
+            for source_path in source_paths:
+                self.log(f"正在读取源数据: {source_path}")
+                kind, basis = detect_source_kind(source_path)
+                if kind is None:
+                    self.log(f"警告: 表头与已知来源格式不符，文件名也未包含来源标识(ICT/派单分析/数说123)，已跳过: {os.path.basename(source_path)}")
+                    continue
+                self.log(f"按{basis}识别来源类型: {kind}")
+                sources.append((kind, source_path))
+            if not sources:
+                self.log("警告: 未识别出任何源数据的来源类型，请检查表头或文件名...")
+                self.set_status("未知源数据格式")
+                self._post_ui(messagebox.showwarning, "提示", "无法识别源数据来源：表头与ICT/省公司/数说123格式均不符，文件名也未包含来源标识(ICT/派单分析/数说123)，请检查后重试。")
+                return
 
-            if df_new_bid is None or df_new_bid.empty:
+            self.set_status("正在处理源数据...")
+            # 中途返回或出错时在finally中关闭，及时结束整理源数据的进程池、关闭源文件
+            source_reader = self._iter_source_batches(sources)
+            # 先取出第一批非空数据，源数据为空或整理失败时不再加载汇总文件
+            first_batch = next((df_batch for df_batch in source_reader if not df_batch.empty), None)
+            if first_batch is None:
                 self.log("无新增项目信息，流程终止。")
                 return
+            source_batches = itertools.chain([first_batch], source_reader)
             
             self.log(f"源数据整理完成。正在检查重复并写入项目清单...")
-            self.status_msg.set("正在更新[项目清单]...")
+            self.set_status("正在更新[项目清单]...")
 
-            # 2. 新项目检查去重后添加到项目汇总文件"项目清单"页（使用openpyxl）
-            wb = openpyxl.load_workbook(project_path)
-            if "项目清单" not in wb.sheetnames:
+            # 2. 新项目检查去重后添加到项目汇总文件"项目清单"页
+            # 汇总文件由工作簿会话加载一次：索引库与汇总文件不一致（手动修改/首次使用/换了文件）时从会话读取[项目清单]重新同步，新增项目也写入同一会话后另存
+            session = WorkbookSession(project_path)
+            self.log(f"汇总文件加载完成，耗时 {session.load_seconds:.1f} 秒")
+            if "项目清单" not in session.wb.sheetnames:
                 self.log("错误: 汇总文件中未找到 '项目清单' Sheet")
-                self.status_msg.set("汇总文件错误")
-                return
-            ws_bid = wb["项目清单"]
-            
-            # 获取现有项目数据用于查重、统计
-            existing_bid_data = {} # 使用字典存储，key为中标单位，value为该单位的项目列表
-            total_existing_count = 0 # 记录总行数，用于序号生成
-
-            # 第一行是表头，从第二行开始读取
-            # 需要确定关键列的索引（从1开始）
-            header = [cell.value for cell in ws_bid[1]]
-            try:
-                idx_tenderer = header.index("招标单位")
-                idx_bidder = header.index("中标单位")
-                idx_amount = header.index("中标金额（万元）")
-                idx_project = header.index("项目名称")
-            except ValueError as e:
-                self.log(f"错误: 汇总文件表头缺失关键列 - {e}")
-                self.status_msg.set("汇总文件错误")
+                self.set_status("汇总文件错误")
                 return
-
-            for row in ws_bid.iter_rows(min_row=2, values_only=True): # row是一个元组
-                bidder_name = str(row[idx_bidder]).strip()
-                if bidder_name not in existing_bid_data:
-                    existing_bid_data[bidder_name] = []
-                
-                existing_bid_data[bidder_name].append({
-                    "tenderer": str(row[idx_tenderer]).strip(),
-                    "bidder": bidder_name,
-                    "amount": float(row[idx_amount]) if row[idx_amount] else 0.0,
-                    "project": str(row[idx_project]).strip()
-                })
-                total_existing_count += 1
-
-            # 查重函数：项目名称相似度检查
-            def check_project_name_duplicate(new_name, exist_name):
-                if not new_name or pd.isna(new_name):
-                    return False
-                
-                # 预处理函数：去除干扰词
-                def clean_name(text):
-                    text = str(text).strip()
-                    # 去除常见的后缀和干扰词
-                    keywords = ["招标", "中标", "成交", "结果", "公告", "公示", "项目", "采购", "关于", "的"]
-                    for kw in keywords:
-                        text = text.replace(kw, "")
-                    # 去除标点和特殊字符
-                    text = re.sub(r'[^\w\u4e00-\u9fa5]', '', text)
-                    return text
-
-                cleaned_new = clean_name(new_name)
-                cleaned_exist = clean_name(exist_name)
-                if len(cleaned_exist) < 4 or len(cleaned_new) < 4: # 太短的不查重，避免误判
-                    return False
-                    
-                # 计算相似度：使用最长公共子串占比
-                # 逻辑：如果短字符串的大部分内容出现在长字符串中，则视为重复
-                matcher = difflib.SequenceMatcher(None, cleaned_new, cleaned_exist) # SequenceMatcher参数分别为：第一个参数是一个可选的函数，用于过滤掉不需要比较的字符，通常设置为None表示不进行过滤；第二个和第三个参数是要比较的两个字符串。
-                match_size = sum(block.size for block in matcher.get_matching_blocks()) # get_matching_blocks()方法返回一个匹配块的列表，每个匹配块是一个包含三个属性的对象，分别是a、b和size，表示在第一个字符串和第二个字符串中匹配的起始位置以及匹配的长度。通过对所有匹配块的size属性求和，可以得到两个字符串之间的总匹配长度。
-                
-                shorter_len = min(len(cleaned_new), len(cleaned_exist))
-                ratio = match_size / shorter_len
-                
-                # 阈值设定：0.85表示短字符串有85%以上的内容在长字符串中匹配
-                if ratio > 0.85:
-                    return True
-                return False
-            
-            # 项目查重函数：综合判断
-            def is_duplicate(new_row, existing_data):
+            ledger_db = ProjectLedgerDB(project_path, self.target_columns)
+            if ledger_db.is_synced_with(project_path):
+                self.log(f"项目清单索引库与汇总文件一致，直接使用: {ledger_db.path}")
+            else:
+                self.log("项目清单索引库与汇总文件不一致（文件被修改或首次使用），正在重新同步...")
+                rows = session.iter_values("项目清单")
+                header = list(next(rows, ())) # 第一行是表头，从第二行开始为数据
+                missing_cols = [col for col in ("招标单位", "中标单位", "中标金额（万元）", "项目名称") if col not in header]
+                if missing_cols:
+                    self.log(f"错误: 汇总文件表头缺失关键列 - {'、'.join(missing_cols)}")
+                    self.set_status("汇总文件错误")
+                    return
+                ledger_db.rebuild(header, rows)
+                ledger_db.mark_synced(project_path)
+                self.log(f"项目清单索引库同步完成，共 {ledger_db.count()} 条: {ledger_db.path}")
+            total_existing_count = ledger_db.count() # 记录总行数，用于序号生成
+            next_row_id = ledger_db.max_row_id() + 1 # 新增行在索引库中的行号
+
+            # 查重索引：候选项目从索引库按(中标单位, 招标单位, 金额)查询
+            dedup_index = ProjectDedupIndex(ledger_db, threshold=0.85, backend="difflib" if dedup_audit else "lcs")
+
+            # 跨来源消解（界面勾选时）：分块键随项目保存在索引库中，按招标单位、月份查询候选，只比较不同来源的记录
+            resolver = None
+            if cross_source_threshold is not None:
+                resolver = CrossSourceResolver(ledger_db, threshold=cross_source_threshold, backend="difflib" if dedup_audit else "lcs")
+                self.log(f"跨来源消解已开启（阈值 {resolver.threshold:.2f}），被消解的行将在日志中逐条列出")
+
+            # 项目查重字段：招标单位、中标单位、金额相同且项目名称相似
+            def dedup_fields(new_row):
                 new_tenderer = str(new_row['招标单位']).strip() if not pd.isna(new_row['招标单位']) else ""
                 new_bidder = str(new_row['中标单位']).strip() if not pd.isna(new_row['中标单位']) else ""
                 new_name = str(new_row['项目名称']).strip() if not pd.isna(new_row['项目名称']) else ""
@@ -606,95 +2169,111 @@ class BidAnalysisApp:
                     new_amount = float(new_row['中标金额（万元）'])
                 except (ValueError, TypeError):
                     new_amount = 0.0
-                
-                # 优化：只在对应中标单位的项目列表中查找
-                candidates = existing_data.get(new_bidder, [])
-                
-                # 查重：招标单位、中标单位、金额、项目名称
-                for exist in candidates:
-                    if (exist['tenderer'] == new_tenderer and 
-                        exist['bidder'] == new_bidder and 
-                        abs(exist['amount'] - new_amount) < 0.001 and
-                        check_project_name_duplicate(new_name, exist['project'])):
-                        return True
-                    
-                return False
+                return new_tenderer, new_bidder, new_amount, new_name
             
             added_count = 0
             skipped_count = 0
-            affected_bidders_set = set() # 记录新增项目里涉及到的中标单位，用于更新全量中标公司sheet
+            fingerprint_hit_count = 0 # 指纹命中直接跳过的行数
+            cross_source_count = 0 # 跨来源消解为同一项目而跳过的行数
 
-            # 遍历新项目数据并追加至项目清单Sheet
+            # 遍历新项目数据，查重通过的行先暂存，最后批量追加至项目清单Sheet
             project_no_init = total_existing_count + 1 # 用于序号递增
-            for _, row in df_new_bid.iterrows(): # row是一个Series对象
-                if is_duplicate(row, existing_bid_data):
-                    self.log(f"项目：{row['项目名称']} 已存在，跳过。")
-                    skipped_count += 1
-                    continue
-                
-                row_no = project_no_init + added_count
-                row['序号'] = row_no
-                row['修改时间'] = f"{pd.Timestamp.now().strftime('%Y-%m-%d')}新增"
-                # 转换为列表，准备追加
-                row_values = [row[col] for col in self.target_columns]
-                ws_bid.append(row_values)
+            accepted_rows = []
+            # 逐行明细只写入日志文件，日志框中定时汇总进度
+            progress = ProgressReporter(self.log, None, "查重") # 源数据分批读取，总条数未知
+            processed = 0
+            for df_batch in source_batches:
+                for _, row in df_batch.iterrows(): # row是一个Series对象
+                    processed += 1
+                    progress.update(processed - 1, added_count, skipped_count)
+                    new_tenderer, new_bidder, new_amount, new_name = dedup_fields(row)
+                    # 先查索引库中的项目指纹，完全重复导入的行无需再做相似度查重；
+                    # 只用于满足查重条件的行（名称过短、金额无效的行查重从不判定为重复，指纹命中也不能跳过）
+                    if dedup_index.accepts_fingerprint(row['中标金额（万元）'], new_name):
+                        fingerprint = project_fingerprint(row['招标单位'], row['中标单位'], row['中标金额（万元）'], row['项目名称'], row['中标时间'])
+                        if ledger_db.has_fingerprint(fingerprint):
+                            fingerprint_hit_count += 1
+                            skipped_count += 1
+                            continue
+                    if dedup_index.is_duplicate(new_tenderer, new_bidder, new_amount, new_name):
+                        self.log(f"项目：{row['项目名称']} 已存在，跳过。", widget=False)
+                        skipped_count += 1
+                        continue
+                    if resolver is not None:
+                        match = resolver.find_match(resolver.make_record(
+                            row['数据来源'], row['招标单位'], row['中标单位'], row['项目名称'], row['中标月份'], row['中标时间'], row['中标金额（万元）']
+                            ))
+                        if match is not None:
+                            # 模糊匹配跳过的行在日志框中逐条显示，便于核对
+                            self.log(f"跨来源消解：项目：{row['项目名称']}（{row['数据来源']}，{row['中标单位']}，{row['中标金额（万元）']}万元）与项目清单第 {match} 行为同一中标结果，跳过。")
+                            cross_source_count += 1
+                            skipped_count += 1
+                            continue
                 
-                # 获取当前写入的行号
-                current_row = ws_bid.max_row
-                
-                # 定义样式对象
-                font_style = Font(name="微软雅黑", size=8)
-                align_style = Alignment(horizontal="center", vertical="center")
-                border_style = Border(
-                    left=Side(style="thin"), 
-                    right=Side(style="thin"), 
-                    top=Side(style="thin"), 
-                    bottom=Side(style="thin")
-                )
-
-                for col_idx in range(1, len(row_values) + 1):
-                    cell = ws_bid.cell(row=current_row, column=col_idx)
-                    cell.font = font_style
-                    cell.alignment = align_style
-                    cell.border = border_style
-
-                added_count += 1
-                # 更新existing_data以便后续查重（防止源数据内部重复）、统计
-                affected_bidder = str(row['中标单位']).strip() if not pd.isna(row['中标单位']) else ""
-                if affected_bidder not in existing_bid_data:
-                    existing_bid_data[affected_bidder] = []
-                    
-                existing_bid_data[affected_bidder].append({
-                    "tenderer": str(row['招标单位']).strip() if not pd.isna(row['招标单位']) else "",
-                    "bidder": affected_bidder,
-                    "amount": float(row['中标金额（万元）']) if not pd.isna(row['中标金额（万元）']) else 0.0,
-                    "project": str(row['项目名称']).strip() if not pd.isna(row['项目名称']) else ""
-                })
-                
-            self.log(f"项目信息处理完成。新增 {added_count} 条，跳过重复 {skipped_count} 条。")
+                    row_no = project_no_init + added_count
+                    row['序号'] = row_no
+                    row['修改时间'] = f"{pd.Timestamp.now().strftime('%Y-%m-%d')}新增"
+                    # 转换为列表，暂存待批量追加
+                    row_values = [row[col] for col in self.target_columns]
+                    accepted_rows.append(row_values)
+
+                    added_count += 1
+                    # 新增项目写入索引库以便后续查重（防止源数据内部重复），汇总文件保存成功后再提交
+                    ledger_db.add_projects([row_values], start_row_id=next_row_id)
+                    next_row_id += 1
+
+            progress.finish(processed, added_count, skipped_count)
+
+            self.log(f"查重索引（{dedup_index.similarity.name}）：相似度计算 {dedup_index.compared_count} 次，预筛排除 {dedup_index.prefiltered_count} 次。")
+            if resolver is not None:
+                self.log(f"跨来源消解：块内比较 {resolver.compared_count} 次，预筛排除 {resolver.prefiltered_count} 次，关联为同一项目并跳过 {resolver.linked_count} 条。")
+            self.log(f"项目信息处理完成。新增 {added_count} 条，跳过重复 {skipped_count} 条（其中指纹直接命中 {fingerprint_hit_count} 条，跨来源消解 {cross_source_count} 条）。")
             
 
             # 文件名加时间后缀另存
             new_project_file_path = re.sub(r'(\.xlsx|\.xls)$', f"_更新项目_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}\\1", project_path, flags=re.IGNORECASE) # \\1表示引用第一个捕获组
             try:
-                wb.save(new_project_file_path)
+                # 新增项目带样式追加到[项目清单]末尾（行号与索引库一致）后另存
+                append_styled_rows(session["项目清单"], accepted_rows, start_row=next_row_id - len(accepted_rows))
+                session.save(new_project_file_path)
             except Exception as e:
+                # 索引库中未提交的新增项目由finally回滚
                 self.log(f"保存项目汇总文件出错: {str(e)}")
-                self.status_msg.set("保存项目汇总文件出错")
-                messagebox.showerror("错误", f"保存项目汇总文件出错: {str(e)}")
+                self.set_status("保存项目汇总文件出错")
+                self._post_ui(messagebox.showerror, "错误", f"保存项目汇总文件出错: {str(e)}")
                 return
-            self.log(f"处理完成。新增项目 {added_count} 条，跳过项目 {skipped_count} 条")
-            self.status_msg.set("项目更新完成")
-            messagebox.showinfo("成功", f"处理完成！\n新增项目: {added_count}\n跳过项目: {skipped_count}\n结果已保存至: {new_project_file_path}")
+            # 索引库提交新增项目（分析立方体已同步累加），并记录与新汇总文件一致
+            ledger_db.mark_synced(new_project_file_path)
+            self.log(f"分析立方体已更新，共 {ledger_db.cube().size()} 个维度组合")
+            self.log("关系图已更新，共 {} 条中标单位-招标单位关系、{} 对分包共同中标单位".format(*ledger_db.graph().size()))
+            self.log(f"处理完成。新增项目 {added_count} 条，跳过项目 {skipped_count} 条（指纹直接命中 {fingerprint_hit_count} 条，跨来源消解 {cross_source_count} 条）")
+            self.set_status("项目更新完成")
+            self._post_ui(messagebox.showinfo, "成功", f"处理完成！\n新增项目: {added_count}\n跳过项目: {skipped_count}（指纹命中 {fingerprint_hit_count}，跨来源 {cross_source_count}）\n结果已保存至: {new_project_file_path}")
 
         except Exception as e:
             self.log(f"项目信息整理出错: {str(e)}")
-            self.status_msg.set("项目信息整理出错")
+            self.set_status("项目信息整理出错")
             self.log(traceback.format_exc())
-
-    def run_company_analysis_workflow(self):
-        self.status_msg.set("正在加载公司汇总文件...")
-        company_path = self.company_file_path.get()
+        finally:
+            if source_reader is not None:
+                source_reader.close()
+            # 出错或中途返回时丢弃索引库中未提交的修改
+            if ledger_db is not None:
+                ledger_db.rollback()
+                ledger_db.close()
+            if session is not None:
+                session.close()
+            if self.label_cache is not None:
+                self.label_cache.close()
+                self.label_cache = None
+
+    def run_company_analysis_workflow(self, company_path, incremental=True, verify=False):
+        """
+        公司信息汇总（在后台线程运行，参数由主线程从界面读出）
+        :param incremental: 公司增量统计
+        :param verify: 增量统计后全量校验
+        """
+        self.set_status("正在加载公司汇总文件...")
 
         # 定义常量
         TARGET_YEARS = ["24年", "25年", "26年", "27年"] # 中标公司sheet列标签中统计的年份, 必须与文件保持一致
@@ -726,35 +2305,46 @@ class BidAnalysisApp:
         all_company_stat_col = shared_company_stat_col+ ["修改时间"]
         filtered_company_stat_col = shared_company_stat_col + ["清单客户属地", "分配行业", "分配行业批次", "分配时间", "入库情况", "确认行业", "备注", "修改时间"]
 
+        ledger_db = None
         try:
             # 1. 读取数据并预处理
             self.log("正在读取公司汇总文件...")
-            self.status_msg.set("正在读取公司汇总文件...")
+            self.set_status("正在读取公司汇总文件...")
+            session = None
             try: 
-                df_all_project = pd.read_excel(company_path, sheet_name="项目清单")
-                self.log("项目清单读取完成！")
-                df_pre_all_company_stats = pd.read_excel(
-                    company_path, sheet_name="全量中标公司", skiprows=2, header=None, 
-                    usecols=range(len(all_company_stat_col)), names=all_company_stat_col
-                    )
+                # 公司汇总文件各Sheet数据均由该会话读取，最后也由其另存
+                session = WorkbookSession(company_path)
+                self.log(f"公司汇总文件解析完成，耗时 {session.load_seconds:.2f} 秒")
+                read_start = time.perf_counter()
+                # 项目清单从索引库查询；公司汇总文件通常经过人工校核，与索引库不一致时由[项目清单]的取值重新同步
+                ledger_db = ProjectLedgerDB(company_path, self.target_columns)
+                if not ledger_db.is_synced_with(company_path):
+                    self.log("项目清单索引库与公司汇总文件不一致（文件被修改或首次使用），正在重新同步...")
+                    project_rows = session.iter_values("项目清单")
+                    ledger_db.rebuild(list(next(project_rows, ())), project_rows)
+                    ledger_db.mark_synced(company_path)
+                self.log("项目清单索引库就绪！")
+                df_pre_all_company_stats = session.read_frame("全量中标公司", skiprows=2, names=all_company_stat_col)
                 self.log("全量中标公司读取完成！")
                 self.log("全量中标公司页列标签设定如下，请确保与文件一致：")
                 for idx, col in enumerate(all_company_stat_col, start=1):
                     self.log(f"{idx}. {col}")
-                df_pre_filterd_company_stats = pd.read_excel(
-                    company_path, sheet_name="筛后中标公司", skiprows=2, header=None, 
-                    usecols=range(len(filtered_company_stat_col)), names=filtered_company_stat_col
-                    )
+                df_pre_filterd_company_stats = session.read_frame("筛后中标公司", skiprows=2, names=filtered_company_stat_col)
                 self.log("筛后中标公司读取完成！")
+                self.log(f"各Sheet数据读取耗时 {time.perf_counter() - read_start:.2f} 秒")
+                if session.values_load_seconds > 0:
+                    self.log(f"（其中含公式的Sheet另以只读方式读取公式计算结果，解析耗时 {session.values_load_seconds:.2f} 秒）")
                 self.log("筛后中标公司页列标签设定如下，请确保与文件一致：")
                 for idx, col in enumerate(filtered_company_stat_col, start=1):
                     self.log(f"{idx}. {col}")
-                wb = openpyxl.load_workbook(company_path)
             except Exception as e:
                 self.log(f"错误：读取公司汇总文件失败 - {str(e)}")
                 self.log("请确保公司汇总文件包含'项目清单', '全量中标公司', '筛后中标公司' Sheet")
-                self.status_msg.set("公司汇总文件读取失败")
+                self.set_status("公司汇总文件读取失败")
                 return
+            finally:
+                if session is not None:
+                    session.close() # 读取完成后只保留写入对象
             
             # 数据预处理
             # 清理空值，保证数值列数据类型正确
@@ -787,52 +2377,96 @@ class BidAnalysisApp:
                 .str.replace(r"\s+", "", regex=True)  # 删所有空白字符（含全角/制表符/换行）
                 )
             
-            # 剔除中标单位为空或无效值的项目记录
-            self.log("正在预处理项目数据...")
-            invalid_values = ["", "无", "-", "/", "未知"]
-            df_valid_project = df_all_project[~(df_all_project["中标单位"].isna() | df_all_project["中标单位"].isin(invalid_values))].copy()
-            # 一次性清洗所有类型的空格：半角、全角、制表符、换行符
-            df_valid_project["中标单位"] = (
-                df_valid_project["中标单位"]
-                .astype(str)
-                .str.strip()  # 先删首尾半角空格,只要操作的是pandas的Series对象（而非单个 Python 原生字符串），调用任何字符串方法都必须通过.str访问器
-                .str.replace(r"\s+", "", regex=True)  # 删所有空白字符（含全角/制表符/换行）
-                )
-            # 再次清除空字符串""
-            df_valid_project = df_valid_project[df_valid_project["中标单位"] != ""].copy()
-            self.log(f"原始项目记录 {len(df_all_project)} 条, 过滤无中标单位记录 {len(df_all_project) - len(df_valid_project)} 条")
-            # 只统计非运营商的中标公司
-            df_valid_project = df_valid_project[df_valid_project["中标厂商类型"] == "其他厂商"]
-            self.log(f"过滤运营商中标项目后剩余 {len(df_valid_project)} 条")
-            # 转换数据类型，处理空值
-            df_valid_project["中标金额（万元）"] = pd.to_numeric(df_valid_project["中标金额（万元）"], errors='coerce').fillna(0.0) # coerce参数用于将无法转换的值设置为NaN，fillna(0)将NaN替换为0
-            df_valid_project["中标年份"] = df_valid_project["中标年份"].fillna("未知")
-            df_valid_project["项目所属行业"] = df_valid_project["项目所属行业"].fillna("未分类")
-            
+            def prepare_valid_projects(df_all_project):
+                """剔除中标单位为空或无效值的项目记录，只保留非运营商项目，并清洗参与统计的列"""
+                invalid_values = ["", "无", "-", "/", "未知"]
+                df_valid_project = df_all_project[~(df_all_project["中标单位"].isna() | df_all_project["中标单位"].isin(invalid_values))].copy()
+                # 一次性清洗所有类型的空格：半角、全角、制表符、换行符
+                df_valid_project["中标单位"] = (
+                    df_valid_project["中标单位"]
+                    .astype(str)
+                    .str.strip()  # 先删首尾半角空格,只要操作的是pandas的Series对象（而非单个 Python 原生字符串），调用任何字符串方法都必须通过.str访问器
+                    .str.replace(r"\s+", "", regex=True)  # 删所有空白字符（含全角/制表符/换行）
+                    )
+                # 再次清除空字符串""
+                df_valid_project = df_valid_project[df_valid_project["中标单位"] != ""].copy()
+                self.log(f"原始项目记录 {len(df_all_project)} 条, 过滤无中标单位记录 {len(df_all_project) - len(df_valid_project)} 条")
+                # 只统计非运营商的中标公司
+                df_valid_project = df_valid_project[df_valid_project["中标厂商类型"] == "其他厂商"]
+                self.log(f"过滤运营商中标项目后剩余 {len(df_valid_project)} 条")
+                # 转换数据类型，处理空值
+                df_valid_project["中标金额（万元）"] = pd.to_numeric(df_valid_project["中标金额（万元）"], errors='coerce').fillna(0.0) # coerce参数用于将无法转换的值设置为NaN，fillna(0)将NaN替换为0
+                df_valid_project["中标年份"] = df_valid_project["中标年份"].fillna("未知")
+                df_valid_project["项目所属行业"] = df_valid_project["项目所属行业"].fillna("未分类")
+                return df_valid_project
+
+            def pivot_count_amount(df_records, companies, dim_col, dim_values, col_label):
+                """
+                由公司汇总长表展开为 [维度值+"中标个数", 维度值+"中标金额（万元）", ...] 交替排列的列
+                :param dim_values: 配置中需要统计的维度取值（决定列及顺序）
+                :param col_label: 维度取值 -> 列标签前缀
+                """
+                df_dim = df_records[df_records["维度"] == dim_col]
+                # 配置外的取值不单独出列，但计入总指标，这里显式记录到日志
+                outside = df_dim[~df_dim["取值"].isin(dim_values)]
+                if not outside.empty:
+                    outside_stat = outside.groupby("取值")[["中标个数", "中标金额（万元）"]].sum()
+                    detail = "，".join(f"{k}: {int(r['中标个数'])}条/{r['中标金额（万元）']:.2f}万元" for k, r in outside_stat.iterrows())
+                    self.log(f"提示: [{dim_col}]不在统计列配置中的项目 {outside['中标个数'].sum()} 条，仅计入中标总个数/总金额 - {detail}")
+
+                # pivot将维度值展开为列，reindex补齐无项目的公司和维度值（填0）
+                counts = df_dim.pivot(index="中标单位", columns="取值", values="中标个数").reindex(index=companies, columns=dim_values).fillna(0)
+                amounts = df_dim.pivot(index="中标单位", columns="取值", values="中标金额（万元）").reindex(index=companies, columns=dim_values).fillna(0)
+                columns = {}
+                for value in dim_values:
+                    label = col_label(value)
+                    columns[label + "中标个数"] = counts[value].astype(int)
+                    columns[label + "中标金额（万元）"] = amounts[value].astype('float64')
+                return pd.DataFrame(columns, index=companies)
+
+            def calculate_company_metrics(df_records):
+                """由公司汇总长表得到各公司总指标、各年份指标、各行业指标，列顺序与shared_company_stat_col一致"""
+                df_total = df_records[df_records["维度"] == "总计"].set_index("中标单位")[["中标个数", "中标金额（万元）"]].sort_index()
+                df_total.columns = ["中标总个数", "中标总金额（万元）"]
+                df_total["中标总个数"] = df_total["中标总个数"].astype(int)
+                df_year = pivot_count_amount(df_records, df_total.index, "中标年份", TARGET_YEARS, lambda year: "20" + year)
+                df_industry = pivot_count_amount(df_records, df_total.index, "项目所属行业", TARGET_INDUSTRIES, lambda industry: industry)
+                df_metrics = pd.concat([df_total, df_year, df_industry], axis=1)
+                df_metrics.index.name = "中标单位"
+                return df_metrics.reset_index()
+
             # 2. 按中标单位分组统计核心指标
-            self.status_msg.set("正在统计中标公司数据...")
+            self.set_status("正在统计中标公司数据...")
             self.log("正在统计中标公司数据...")
-
-            def calculate_company_metrics(group):
-                metrics = {}
-                # 总指标
-                metrics["中标总个数"] = len(group)
-                metrics["中标总金额（万元）"] = group["中标金额（万元）"].sum()
-
-                # 各年份指标
-                for year in TARGET_YEARS:
-                    year_data = group[group["中标年份"] == year]
-                    metrics["20" + year + "中标个数"] = len(year_data)
-                    metrics["20" + year + "中标金额（万元）"] = year_data["中标金额（万元）"].sum()
-
-                # 各行业指标
-                for industry in TARGET_INDUSTRIES:
-                    industry_data = group[group["项目所属行业"] == industry]
-                    metrics[industry + "中标个数"] = len(industry_data)
-                    metrics[industry + "中标金额（万元）"] = industry_data["中标金额（万元）"].sum()
-
-                return pd.Series(metrics)
-            df_new_all_company_stats = df_valid_project.groupby("中标单位").apply(calculate_company_metrics, include_groups=False).reset_index() # groupby返回一个DataFrameGroupBy对象，apply方法将自定义函数应用于每个分组，reset_index用于重置索引，使得“中标单位”成为DataFrame的一列而不是索引。
+            try:
+                if incremental:
+                    # 增量统计：按统计列的取值比对全部项目，只清洗新出现的取值、重算受影响公司
+                    state = CompanyStatsState(ledger_db)
+                    self.log("公司增量统计：正在比对项目清单与上次统计的状态...")
+                    new_keys, added, removed, affected = state.update(prepare_valid_projects)
+                    self.log(f"公司增量统计：新出现的取值 {new_keys} 种，计入项目 {added} 条，移除项目 {removed} 条（修改的项目按移除原取值、计入新取值各计一次），重算 {affected} 家公司")
+                    df_company_records = state.read_records()
+                    df_new_all_company_stats = calculate_company_metrics(df_company_records)
+                    if verify:
+                        self.log("全量校验：正在由全部项目重新统计...")
+                        df_full_stats = calculate_company_metrics(company_stat_records(prepare_valid_projects(ledger_db.read_frame())))
+                        same_shape = df_full_stats.shape == df_new_all_company_stats.shape and df_full_stats["中标单位"].equals(df_new_all_company_stats["中标单位"])
+                        stat_cols = df_full_stats.columns[1:]
+                        if same_shape and np.allclose(df_full_stats[stat_cols].to_numpy(dtype=float), df_new_all_company_stats[stat_cols].to_numpy(dtype=float), atol=1e-6):
+                            self.log("全量校验通过：增量统计与全量统计结果一致。")
+                        else:
+                            self.log(f"警告: 全量校验不一致（增量 {len(df_new_all_company_stats)} 家，全量 {len(df_full_stats)} 家），已改用全量结果并重置增量状态")
+                            df_new_all_company_stats = df_full_stats
+                            state.reset()
+                            state.update(prepare_valid_projects)
+                else:
+                    df_valid_project = prepare_valid_projects(ledger_db.read_frame())
+                    df_new_all_company_stats = calculate_company_metrics(company_stat_records(df_valid_project))
+            finally:
+                # 统计完成后即释放索引库，出错时丢弃未提交的增量状态
+                ledger_db.rollback()
+                ledger_db.close()
+                ledger_db = None
             # 将列名“中标单位”改为“公司名称”，与公司sheet保持一致，以便后续合并
             df_new_all_company_stats.rename(columns={"中标单位": "公司名称"}, inplace=True)
             self.log(f"共统计出 {len(df_new_all_company_stats)} 家中标公司。")
@@ -847,7 +2481,7 @@ class BidAnalysisApp:
                 :return: 合并后的最终DataFrame（保留原表所有行+顺序，新增公司在后）
                 """
 
-                self.status_msg.set(f"正在合并 [{sheet_name}] 数据...")
+                self.set_status(f"正在合并 [{sheet_name}] 数据...")
                 self.log(f"正在合并  [{sheet_name}] 数据...")
                 # ========== 1. 原表预处理（优化：清洗公司名称+唯一辅助列） ==========
                 # 深拷贝避免修改原数据，重置索引保证连续
@@ -918,63 +2552,83 @@ class BidAnalysisApp:
                         self.log(f"[{sheet_name}] 新增公司: {company_name}, 中标总个数: {bid_count}, 中标总金额（万元）: {bid_amount:.2f} 万元")
                 return df_merged_company_stats
 
-            # 4. 写回Excel文件，使用openpyxl设置格式
-            def write_company_stats_to_sheet(wb, sheet_name, df_stats, start_row):
-                self.status_msg.set(f"正在写入[{sheet_name}] sheet...")
+            # 4. 写回Excel文件：已有行只更新有变化的单元格（保留原有格式），新增公司批量追加并设置样式
+            def cell_value_differs(current, value):
+                """单元格现有取值与待写入的值是否不同：空单元格与空值相同，数值按与合并时相同的精度比较"""
+                if current is None:
+                    return not pd.isna(value)
+                numeric = (int, float, np.number)
+                if isinstance(current, numeric) and isinstance(value, numeric):
+                    return not np.isclose(current, value, rtol=0, atol=1e-6)
+                return current != value
+
+            def write_company_stats_to_sheet(wb, sheet_name, df_stats, pre_row_count, start_row):
+                """
+                :param pre_row_count: 原表数据行数，df_stats中此前的行与Sheet中的行一一对应，其后为新增公司
+                """
+                self.set_status(f"正在写入[{sheet_name}] sheet...")
                 self.log(f"正在写入[{sheet_name}] sheet...")
 
                 ws = wb[sheet_name]
-
-                # 定义样式
-                font_style = Font(name="微软雅黑", size=8)
-                align_style = Alignment(horizontal="center", vertical="center")
-                border_style = Border(
-                    left=Side(style="thin"),
-                    right=Side(style="thin"),
-                    top=Side(style="thin"),
-                    bottom=Side(style="thin")
-                )
-
-                # 清空旧数据（保留表头）
-                ws.delete_rows(start_row, ws.max_row - start_row + 1) # 两个参数分别是起始行号和删除的行数
-
-                # 写入新数据并设置样式
-                for r_idx, row in enumerate(dataframe_to_rows(df_stats, index=False, header=False), start=start_row): # index=False表示不写入索引列，header=False表示不写入列名
-                    for c_idx, value in enumerate(row, start=1):
-                        cell = ws.cell(r_idx, c_idx, value=value)
-                        cell.font = font_style
-                        cell.alignment = align_style
-                        cell.border = border_style
-
-                self.log(f"[{sheet_name}] sheet写入完成")
+                rows = list(dataframe_to_rows(df_stats, index=False, header=False)) # index=False表示不写入索引列，header=False表示不写入列名
+
+                # 数据末尾之后的空行（读取时已裁剪）一并清除，新增公司紧接数据末尾追加
+                last_data_row = start_row + pre_row_count - 1
+                if ws.max_row > last_data_row:
+                    ws.delete_rows(last_data_row + 1, ws.max_row - last_data_row) # 两个参数分别是起始行号和删除的行数
+
+                # 已有行逐格比较单元格取值，只写入不同的单元格：读取时空单元格按0计，统计值未变但原单元格为空时也要写入
+                # （修改时间已在合并时按统计值的变化更新）
+                updated_rows = 0
+                updated_cells = 0
+                for i in range(pre_row_count):
+                    r_idx = start_row + i
+                    row_cells = 0
+                    for c_idx, value in enumerate(rows[i], start=1):
+                        cell = ws.cell(r_idx, c_idx)
+                        if cell_value_differs(cell.value, value):
+                            cell.value = value
+                            row_cells += 1
+                    updated_rows += row_cells > 0
+                    updated_cells += row_cells
+
+                append_styled_rows(ws, rows[pre_row_count:], start_row=last_data_row + 1)
+                self.log(f"[{sheet_name}] sheet写入完成：更新 {updated_rows} 行（{updated_cells} 个单元格），新增 {len(rows) - pre_row_count} 行")
 
             # 更新并写入[全量中标公司]统计信息
             df_merged_all_company_stats = merge_company_stats(df_pre_all_company_stats, df_new_all_company_stats, "全量中标公司")
-            write_company_stats_to_sheet(wb, "全量中标公司", df_merged_all_company_stats, start_row=3)
+            write_company_stats_to_sheet(session.wb, "全量中标公司", df_merged_all_company_stats, len(df_pre_all_company_stats), start_row=3)
             # 更新并写入[筛后中标公司]统计信息
             df_new_filterd_company_stats = df_new_all_company_stats[df_new_all_company_stats["中标总金额（万元）"] > FILTER_AMOUNT]
             df_merged_filterd_company_stats = merge_company_stats(df_pre_filterd_company_stats, df_new_filterd_company_stats, "筛后中标公司")
-            write_company_stats_to_sheet(wb, "筛后中标公司", df_merged_filterd_company_stats, start_row=3)
+            write_company_stats_to_sheet(session.wb, "筛后中标公司", df_merged_filterd_company_stats, len(df_pre_filterd_company_stats), start_row=3)
 
             # 保存文件
             new_company_file_path = re.sub(r'(\.xlsx|\.xls)$', f"_更新公司_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}\\1", company_path, flags=re.IGNORECASE) # \\1表示引用第一个捕获组
             try:
-                wb.save(new_company_file_path)
+                save_start = time.perf_counter()
+                session.save(new_company_file_path)
+                self.log(f"公司统计文件保存完成，耗时 {time.perf_counter() - save_start:.2f} 秒")
             except Exception as e:
                 self.log(f"保存公司统计文件出错: {str(e)}")
-                self.status_msg.set("保存公司统计文件出错")
-                messagebox.showerror("错误", f"保存公司统计文件出错: {str(e)}")
+                self.set_status("保存公司统计文件出错")
+                self._post_ui(messagebox.showerror, "错误", f"保存公司统计文件出错: {str(e)}")
                 return
-            self.status_msg.set("公司统计分析完成")
+            self.set_status("公司统计分析完成")
             self.log("公司统计分析完成。")
-            messagebox.showinfo("成功", f"公司统计分析完成！\n全量中标公司新增 {len(df_merged_all_company_stats) - len(df_pre_all_company_stats)} 家\n筛后中标公司新增 {len(df_merged_filterd_company_stats) - len(df_pre_filterd_company_stats)} 家\n结果已保存至: {new_company_file_path}")
+            self._post_ui(messagebox.showinfo, "成功", f"公司统计分析完成！\n全量中标公司新增 {len(df_merged_all_company_stats) - len(df_pre_all_company_stats)} 家\n筛后中标公司新增 {len(df_merged_filterd_company_stats) - len(df_pre_filterd_company_stats)} 家\n结果已保存至: {new_company_file_path}")
             
         except Exception as e:
             self.log(f"错误：公司统计分析出错 - {str(e)}")
-            self.status_msg.set("公司统计分析出错")
+            self.set_status("公司统计分析出错")
             self.log(traceback.format_exc())
+        finally:
+            if ledger_db is not None:
+                ledger_db.rollback()
+                ledger_db.close()
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support() # 打包为exe后，多源并行整理的子进程需要此调用
     root = tk.Tk() # 创建主窗口
     app = BidAnalysisApp(root)
     root.mainloop() # 进入Tkinter事件循环
@@ -0,0 +1,560 @@
+import datetime
+import logging
+import os
+import queue
+import random
+import sys
+import time
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pytest
+from openpyxl.styles import Alignment, Border, Font, Side
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import bid_analysis_tool as bat
+
+# 项目清单统一Schema，与BidAnalysisApp.target_columns一致
+TARGET_COLUMNS = [
+    "序号", "省份", "市", "区县", "中标年份", "中标月份", "中标时间", "招标类型",
+    "项目名称", "招标单位", "中标单位", "中标金额（万元）",
+    "中标厂商类型", "项目所属行业", "备注", "所属行业（ICT）",
+    "所属业务类型（ICT）", "公告内容（ICT）", "行业（省公司）", "数据来源", "修改时间"
+]
+
+def project_row(values):
+    """按TARGET_COLUMNS排列的项目行，未给出的列为空"""
+    return [values.get(col) for col in TARGET_COLUMNS]
+
+# 示例语料用字：常见项目名称用字，字符集小、重复多，相似名称较多
+PROJECT_NAME_CHARS = "智慧校园平台建设运维服务信息化系统网络安全数据中心升级改造医院教育局政务云"
+
+def sample_names(rng, count, min_len=2, max_len=90):
+    """随机项目名称（清洗后），长度跨过64字，覆盖LCS多字进位"""
+    names = ["".join(rng.choice(PROJECT_NAME_CHARS) for _ in range(rng.randint(min_len, max_len))) for _ in range(count)]
+    return [name for name in map(bat.clean_project_name, names) if name]
+
+def mutate_name(rng, name, edits):
+    """对名称随机增删改若干字，构造近似重复的名称"""
+    chars = list(name)
+    for _ in range(edits):
+        op = rng.choice("idr")
+        pos = rng.randrange(len(chars) + 1)
+        if op == "i":
+            chars.insert(pos, rng.choice(PROJECT_NAME_CHARS))
+        elif chars and pos < len(chars):
+            if op == "d":
+                del chars[pos]
+            else:
+                chars[pos] = rng.choice(PROJECT_NAME_CHARS)
+    return "".join(chars) or name
+
+def lcs_reference(a, b):
+    """逐格动态规划的LCS长度，作为位并行实现的对照"""
+    prev = [0] * (len(b) + 1)
+    for ch in a:
+        cur = [0]
+        for j, other in enumerate(b):
+            cur.append(prev[j] + 1 if ch == other else max(prev[j + 1], cur[j]))
+        prev = cur
+    return prev[-1]
+
+def dedup_corpus(seed=0, groups=60):
+    """查重样例：每个新名称配一组候选（近似改写 + 随机名称）"""
+    rng = random.Random(seed)
+    corpus = []
+    for name in sample_names(rng, groups, min_len=4):
+        candidates = [mutate_name(rng, name, rng.randint(0, 6)) for _ in range(rng.randint(1, 12))]
+        candidates += sample_names(rng, rng.randint(0, 30), min_len=4)
+        rng.shuffle(candidates)
+        corpus.append((name, candidates))
+    return corpus
+
+# ---------- user-004 相似度后端 ----------
+
+def test_lcs_lengths_match_dynamic_programming():
+    rng = random.Random(1)
+    names = sample_names(rng, 60, max_len=150)
+    for name in names[:15]:
+        lengths = bat.BitParallelLcsSimilarity.lcs_lengths(name, names)
+        assert lengths.tolist() == [lcs_reference(name, other) for other in names]
+
+def test_lcs_upper_bound_not_below_difflib_ratio():
+    for name, candidates in dedup_corpus(seed=2):
+        lengths = bat.BitParallelLcsSimilarity.lcs_lengths(name, candidates)
+        for other, length in zip(candidates, lengths):
+            assert length / min(len(name), len(other)) >= bat.matching_block_ratio(name, other) - 1e-12
+
+@pytest.mark.parametrize("threshold", [0.6, 0.85, 0.95])
+def test_lcs_backend_decisions_match_difflib(threshold):
+    audit = bat.DifflibSimilarity()
+    fast = bat.BitParallelLcsSimilarity(min_batch=1)
+    duplicates = 0
+    for name, candidates in dedup_corpus(seed=3):
+        expected = audit.duplicate_mask(name, candidates, threshold)
+        assert fast.duplicate_mask(name, candidates, threshold).tolist() == expected.tolist()
+        duplicates += int(expected.sum())
+    assert duplicates > 0 # 样例中确有判定为重复的候选
+    assert fast.prefiltered_count > 0
+
+def test_lcs_backend_benchmark():
+    """基准：两种后端对同一批样例的判定一致，LCS预筛后需复核的候选远少于逐对计算"""
+    corpus = dedup_corpus(seed=4, groups=200)
+    timings = {}
+    backends = {}
+    for name in ("difflib", "lcs"):
+        backend = bat.SIMILARITY_BACKENDS[name]()
+        start = time.perf_counter()
+        decisions = [backend.duplicate_mask(new, candidates, 0.85).tolist() for new, candidates in corpus]
+        timings[name] = time.perf_counter() - start
+        backends[name] = (backend, decisions)
+    assert backends["lcs"][1] == backends["difflib"][1]
+    assert backends["lcs"][0].compared_count < backends["difflib"][0].compared_count / 2
+    print(
+        f"\n查重基准：{sum(len(c) for _, c in corpus)} 对，"
+        f"difflib {timings['difflib']:.3f} 秒（计算 {backends['difflib'][0].compared_count} 次），"
+        f"lcs {timings['lcs']:.3f} 秒（复核 {backends['lcs'][0].compared_count} 次，预筛排除 {backends['lcs'][0].prefiltered_count} 次）"
+    )
+
+# ---------- user-005 项目指纹 ----------
+
+def test_fingerprint_hit_implies_duplicate(tmp_path):
+    ledger = bat.ProjectLedgerDB(str(tmp_path / "项目汇总.xlsx"), TARGET_COLUMNS)
+    base = {"招标单位": "西安市教育局", "中标单位": "某某科技有限公司", "中标时间": "2025-03-01"}
+    rows = [
+        dict(base, 项目名称="智慧校园平台建设项目", **{"中标金额（万元）": 12.5}),
+        dict(base, 项目名称="网络", **{"中标金额（万元）": 3.0}),               # 清洗后不足4个字，不查重
+        dict(base, 项目名称="数据中心升级改造", **{"中标金额（万元）": float("nan")}), # 金额缺失
+        dict(base, 项目名称="政务云运维服务", **{"中标金额（万元）": "待定"}),       # 金额不是数值
+    ]
+    ledger.add_projects([project_row(row) for row in rows], start_row_id=2)
+    index = bat.ProjectDedupIndex(ledger)
+    for row in rows:
+        # 原样重复导入（含首尾空白）：指纹都能命中，但只有满足查重条件的行可以据此跳过
+        again = {key: f" {value} " if isinstance(value, str) else value for key, value in row.items()}
+        fingerprint = bat.project_fingerprint(again["招标单位"], again["中标单位"], again["中标金额（万元）"], again["项目名称"], again["中标时间"])
+        assert ledger.has_fingerprint(fingerprint)
+        try:
+            amount = float(again["中标金额（万元）"])
+        except ValueError:
+            amount = 0.0
+        duplicate = index.is_duplicate(again["招标单位"].strip(), again["中标单位"].strip(), amount, again["项目名称"].strip())
+        accepted = index.accepts_fingerprint(again["中标金额（万元）"], again["项目名称"].strip())
+        assert accepted == duplicate == (row is rows[0])
+    ledger.close()
+
+# ---------- user-006 数据行样式 ----------
+
+def styled_sample_rows(count):
+    """覆盖各种取值类型的数据行：日期时间、日期、整数、浮点数、文本、空值"""
+    return [
+        [i + 1, "陕西省", "西安市", None, 2025, f"2025-{i % 12 + 1:02d}", datetime.datetime(2025, i % 12 + 1, 1, 9, 30),
+         "公开招标", f"项目{i}", "西安市教育局", "某某科技有限公司", 12.5 + i, datetime.date(2025, 1, i % 28 + 1)]
+        for i in range(count)
+    ]
+
+def append_rows_per_cell(ws, rows):
+    """优化前的写法：逐行append后逐格赋值字体、对齐、边框，作为样式对照"""
+    thin = Side(style="thin")
+    for values in rows:
+        ws.append(values)
+        for col_idx in range(1, len(values) + 1):
+            cell = ws.cell(row=ws.max_row, column=col_idx)
+            cell.font = Font(name="微软雅黑", size=8)
+            cell.alignment = Alignment(horizontal="center", vertical="center")
+            cell.border = Border(left=thin, right=thin, top=thin, bottom=thin)
+
+def saved_cells(path):
+    """重新打开保存后的工作簿，取出每个单元格的取值及样式"""
+    ws = openpyxl.load_workbook(path)["项目清单"]
+    return [
+        [(cell.value, cell.number_format, cell.font.name, cell.font.sz, cell.alignment.horizontal, cell.alignment.vertical,
+          cell.border.left.style, cell.border.right.style, cell.border.top.style, cell.border.bottom.style) for cell in row]
+        for row in ws.iter_rows()
+    ]
+
+def test_append_styled_rows_matches_per_cell_styles(tmp_path):
+    rows = styled_sample_rows(30)
+    paths = {}
+    for name in ("per_cell", "named_style"):
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.title = "项目清单"
+        ws.append(["列{}".format(i) for i in range(len(rows[0]))])
+        if name == "per_cell":
+            append_rows_per_cell(ws, rows)
+        else:
+            bat.append_styled_rows(ws, rows, start_row=2)
+        paths[name] = tmp_path / f"{name}.xlsx"
+        wb.save(paths[name])
+    expected = saved_cells(paths["per_cell"])
+    assert saved_cells(paths["named_style"]) == expected
+    assert expected[1][6][1] != "General" # 日期时间单元格保留日期格式
+
+def test_append_styled_rows_benchmark(tmp_path):
+    rows = styled_sample_rows(500)
+    timings = {}
+    for name in ("per_cell", "named_style"):
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.append(["表头"])
+        start = time.perf_counter()
+        if name == "per_cell":
+            append_rows_per_cell(ws, rows)
+        else:
+            bat.append_styled_rows(ws, rows, start_row=2)
+        timings[name] = time.perf_counter() - start
+    print(f"\n数据行样式基准：{len(rows)} 行，逐格赋值 {timings['per_cell']:.2f} 秒，命名样式 {timings['named_style']:.2f} 秒")
+    assert timings["named_style"] < timings["per_cell"]
+
+# ---------- user-010 工作簿会话 ----------
+
+def test_workbook_session_reads_like_read_excel(tmp_path):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "数据"
+    ws.append(["标题"])
+    ws.append(["a", "b", "c", "d", "e"])
+    ws.append([1, "公司A", "13800000000", 2.0, datetime.datetime(2025, 1, 2)])
+    ws.append([])
+    ws.append([2, " 公司B ", "#DIV/0!", 2.5, "x"])
+    ws["C5"].data_type = "e"
+    ws.append([3, None, "0123", None, None, "多余列"])
+    ws.append(["4", "公司C", True, "1.5"])
+    ws["A12"].font = Font(bold=True) # 带格式的尾部空行
+    formulas = wb.create_sheet("公式")
+    formulas.append(["标题"])
+    formulas.append(["a", "b"])
+    formulas.append([1, "=A3*2"])
+    path = tmp_path / "会话.xlsx"
+    wb.save(path)
+
+    session = bat.WorkbookSession(str(path))
+    # 不含公式的Sheet直接从完整加载的工作簿读取，含公式的Sheet才另以只读方式读取计算结果
+    for sheet, names, reparsed in (("数据", ["a", "b", "c", "d", "e"], False), ("公式", ["a", "b"], True)):
+        expected = pd.read_excel(path, sheet_name=sheet, skiprows=2, header=None, usecols=range(len(names)), names=names)
+        pd.testing.assert_frame_equal(session.read_frame(sheet, 2, names), expected)
+        assert (session.values_load_seconds > 0) == reparsed
+    session.close()
+
+# ---------- user-011 区域拆分 ----------
+
+# 区域拆分边界情况：(区域, 省份, 市, 区县)
+REGION_CASES = [
+    ("陕西省西安市雁塔区", "陕西", "西安", "雁塔区"),
+    ("陕西省西安市", "陕西", "西安", "未知"),
+    ("陕西省", "陕西", "未知", "未知"),
+    ("西安市雁塔区", "未知", "西安", "雁塔区"),
+    ("雁塔区", "未知", "未知", "雁塔区"),
+    ("西安市区陕西省", "西安市区陕西", "西安", "区"),   # “省”在最后
+    ("新区陕西省西安市", "新区陕西", "西安", "新区"),   # “区”在“市”之前
+    ("北京市", "未知", "北京", "未知"),                 # 无“省”
+    ("省西安市", "", "西安", "未知"),
+    (" 陕西省西安市雁塔区 ", "陕西", "西安", "雁塔区"), # 首尾空白
+    (None, "未知", "未知", "未知"),
+    ("   ", "未知", "未知", "未知"),
+]
+
+def split_region_by_find(region):
+    """优化前的逐行拆分（按str.find定位省、市、区），作为正则拆分的对照"""
+    if pd.isna(region) or region.strip() == "":
+        return "未知", "未知", "未知"
+    region = region.strip()
+    p_idx, c_idx, d_idx = region.find("省"), region.find("市"), region.find("区")
+    province = region[:p_idx] if p_idx != -1 else "未知"
+    if p_idx != -1 and c_idx != -1 and c_idx > p_idx:
+        city = region[p_idx + 1:c_idx]
+    elif c_idx != -1:
+        city = region[:c_idx]
+    else:
+        city = "未知"
+    if c_idx != -1 and d_idx != -1 and d_idx > c_idx:
+        district = region[c_idx + 1:d_idx + 1]
+    elif d_idx != -1:
+        district = region[:d_idx + 1]
+    else:
+        district = "未知"
+    return province, city, district
+
+@pytest.mark.parametrize("region, province, city, district", REGION_CASES)
+def test_split_region_column_edge_cases(region, province, city, district):
+    # 同一区域与其它取值混在一列中，确认factorize广播回原行的结果
+    regions = pd.Series(["陕西省西安市雁塔区", region, None, region])
+    columns = bat.BidSourceNormalizer.split_region_column(regions)
+    assert [column[1] for column in columns] == [province, city, district]
+    assert [column[3] for column in columns] == [province, city, district]
+    assert split_region_by_find(region) == (province, city, district)
+
+def test_split_region_column_matches_find_splitting():
+    rng = random.Random(5)
+    regions = ["".join(rng.choice("陕西省市区县新城") for _ in range(rng.randint(0, 8))) for _ in range(500)]
+    columns = bat.BidSourceNormalizer.split_region_column(pd.Series(regions))
+    assert list(zip(*columns)) == [split_region_by_find(region) for region in regions]
+
+# ---------- user-012 公司增量统计 ----------
+
+def prepare_stat_projects(df):
+    """与公司汇总流程相同口径的清洗：只统计有中标单位的非运营商项目"""
+    df = df[df["中标单位"].notna() & (df["中标厂商类型"] == "其他厂商")].copy()
+    df["中标单位"] = df["中标单位"].astype(str).str.replace(r"\s+", "", regex=True)
+    df["中标金额（万元）"] = pd.to_numeric(df["中标金额（万元）"], errors="coerce").fillna(0.0)
+    df["中标年份"] = df["中标年份"].fillna("未知")
+    df["项目所属行业"] = df["项目所属行业"].fillna("未分类")
+    return df
+
+def stat_sheet_rows(seed, count):
+    rng = random.Random(seed)
+    return [
+        project_row({
+            "中标单位": rng.choice([f"公司{i:02d}" for i in range(20)] + [None, " 公司01 "]),
+            "中标年份": rng.choice(["24年", "25年", None]),
+            "项目所属行业": rng.choice(["党政", "教育", "卫健", None]),
+            "中标金额（万元）": rng.choice([round(rng.uniform(0, 500), 2), None, "待定"]),
+            "中标厂商类型": rng.choice(["其他厂商", "其他厂商", "电信"]),
+            "项目名称": f"项目{i}",
+        })
+        for i in range(count)
+    ]
+
+def sorted_records(df):
+    return df.sort_values(["中标单位", "维度", "取值"], key=lambda col: col.astype(str)).reset_index(drop=True)
+
+def test_company_stats_incremental_after_edit(tmp_path):
+    ledger = bat.ProjectLedgerDB(str(tmp_path / "公司汇总.xlsx"), TARGET_COLUMNS)
+    rows = stat_sheet_rows(seed=6, count=400)
+    ledger.rebuild(TARGET_COLUMNS, rows)
+    state = bat.CompanyStatsState(ledger)
+    new_keys, added, removed, affected = state.update(prepare_stat_projects)
+    assert (added, removed) == (400, 0)
+
+    # 手动修改汇总文件：改一行金额、删掉中间一行（其后各行行号前移），重新同步后再统计
+    edited = [list(row) for row in rows]
+    edited[10][TARGET_COLUMNS.index("中标单位")] = "公司03"
+    edited[10][TARGET_COLUMNS.index("中标厂商类型")] = "其他厂商"
+    edited[10][TARGET_COLUMNS.index("中标金额（万元）")] = 987.65
+    removed_row = edited.pop(200)
+    ledger.rebuild(TARGET_COLUMNS, edited)
+    new_keys, added, removed, affected = state.update(prepare_stat_projects)
+    # 只有改过的一行取值是新的，行号变化的其余各行不需要重新统计
+    assert (new_keys, added, removed) == (1, 1, 2)
+    companies = {"公司03", rows[10][TARGET_COLUMNS.index("中标单位")], removed_row[TARGET_COLUMNS.index("中标单位")]}
+    assert affected <= len(companies)
+
+    expected = bat.company_stat_records(prepare_stat_projects(ledger.read_frame()))
+    pd.testing.assert_frame_equal(sorted_records(state.read_records()), sorted_records(expected), check_exact=False)
+    # 未修改时再次统计无需处理任何项目
+    assert state.update(prepare_stat_projects) == (0, 0, 0, 0)
+    ledger.close()
+
+# ---------- user-014 日志队列 ----------
+
+class FakeRoot:
+    def __init__(self):
+        self.scheduled = []
+
+    def after(self, delay, callback):
+        self.scheduled.append(callback)
+
+class FakeText:
+    def __init__(self):
+        self.text = ""
+
+    def insert(self, index, text):
+        self.text += text
+
+    def index(self, index):
+        return f"{self.text.count(chr(10)) + 1}.0"
+
+    def delete(self, start, end):
+        pass
+
+    def see(self, index):
+        pass
+
+class FakeVar:
+    def __init__(self):
+        self.value = None
+
+    def set(self, value):
+        self.value = value
+
+def test_log_pump_survives_raising_callable():
+    app = bat.BidAnalysisApp.__new__(bat.BidAnalysisApp) # 不创建窗口，只替换主线程取消息用到的对象
+    app.root, app.log_text, app.status_msg = FakeRoot(), FakeText(), FakeVar()
+    app.log_queue = queue.Queue()
+    app.logger = logging.getLogger("test_bid_analysis_tool")
+    shown = []
+    def broken_dialog(*args):
+        raise RuntimeError("弹窗失败")
+    app.log_queue.put(("log", "第一条"))
+    app.log_queue.put(("call", broken_dialog, ()))
+    app.log_queue.put(("log", "第二条"))
+    app.log_queue.put(("call", shown.append, ("提示",)))
+    app.log_queue.put(("status", "完成"))
+    app._drain_log_queue()
+    assert app.root.scheduled == [app._drain_log_queue] # 出错后仍安排下一次取出
+    assert shown == ["提示"] and app.status_msg.value == "完成"
+    assert "第一条" in app.log_text.text and "弹窗失败" in app.log_text.text and "第二条" in app.log_text.text
+
+# ---------- user-015 分析立方体 ----------
+
+def test_cube_skips_blank_padding_rows(tmp_path):
+    rows = [
+        project_row({"中标单位": "某某科技有限公司", "招标单位": "西安市教育局", "项目名称": "智慧校园平台", "中标年份": "25年", "中标金额（万元）": 12.5}),
+        project_row({"中标单位": "某某科技有限公司", "招标单位": "西安市卫健委", "项目名称": "医院信息化", "中标年份": "25年", "中标金额（万元）": 30.0}),
+        project_row({"中标单位": None, "招标单位": "西安市教育局", "项目名称": "网络改造", "中标金额（万元）": 5.0}), # 中标单位未知的真实项目
+    ]
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "项目清单"
+    ws.append(TARGET_COLUMNS)
+    ws.append(rows[0])
+    ws.append([None] * len(TARGET_COLUMNS)) # 中间的空行
+    ws.append(rows[1])
+    ws.append(rows[2])
+    ws.append(["", " "] + [None] * (len(TARGET_COLUMNS) - 2)) # 只有空白字符的行
+    for row_idx in range(ws.max_row + 1, ws.max_row + 20): # 带格式的尾部空行
+        for col_idx in range(1, len(TARGET_COLUMNS) + 1):
+            ws.cell(row=row_idx, column=col_idx).font = Font(name="微软雅黑", size=8)
+    path = tmp_path / "项目汇总.xlsx"
+    wb.save(path)
+
+    session = bat.WorkbookSession(str(path))
+    values = session.iter_values("项目清单")
+    ledger = bat.ProjectLedgerDB(str(path), TARGET_COLUMNS)
+    ledger.rebuild(list(next(values)), values)
+    cube = ledger.cube()
+    assert cube.query([]).values.tolist() == [[3, 47.5]]
+    assert cube.query(["中标单位"]).values.tolist() == [["某某科技有限公司", 2, 42.5], ["未知", 1, 5.0]]
+    # 追加时同样跳过空行
+    ledger.add_projects([[None] * len(TARGET_COLUMNS)], start_row_id=ledger.max_row_id() + 1)
+    assert cube.query([]).values.tolist() == [[3, 47.5]]
+    ledger.close()
+    session.close()
+
+# ---------- user-016 跨来源消解 ----------
+
+def cross_source_corpus(seed, groups=40):
+    """同一招标单位、月份下各来源报送的项目（中标单位、项目名称措辞不同），以及待消解的记录"""
+    rng = random.Random(seed)
+    bidders = [f"{name}科技有限公司" for name in sample_names(rng, 8, min_len=2, max_len=6)]
+    rows, queries = [], []
+    for group in range(groups):
+        tenderer = f"西安市第{group % 5}招标单位"
+        month = f"2025{group % 3 + 1:02d}"
+        project = "".join(rng.choice(PROJECT_NAME_CHARS) for _ in range(rng.randint(6, 30)))
+        bidder = rng.choice(bidders)
+        amount = round(rng.uniform(10, 900), 2)
+        for source in ("ICT标局", "省公司"):
+            rows.append(project_row({
+                "数据来源": source, "招标单位": tenderer, "中标单位": mutate_name(rng, bidder, rng.randint(0, 2)),
+                "项目名称": mutate_name(rng, project, rng.randint(0, 8)), "中标月份": month, "中标金额（万元）": amount,
+            }))
+        queries.append(("数说123", tenderer, mutate_name(rng, bidder, rng.randint(0, 3)), mutate_name(rng, project, rng.randint(0, 10)),
+                        month, None, amount * rng.choice([1, 1.01, 10000])))
+    return rows, queries
+
+def test_cross_source_prefilter_matches_difflib(tmp_path):
+    rows, queries = cross_source_corpus(seed=7)
+    ledger = bat.ProjectLedgerDB(str(tmp_path / "项目汇总.xlsx"), TARGET_COLUMNS)
+    ledger.add_projects(rows, start_row_id=2)
+    for threshold in (0.6, 0.8, 0.9):
+        audit = bat.CrossSourceResolver(ledger, threshold=threshold, backend="difflib")
+        fast = bat.CrossSourceResolver(ledger, threshold=threshold)
+        expected = [audit.find_match(audit.make_record(*query)) for query in queries]
+        assert [fast.find_match(fast.make_record(*query)) for query in queries] == expected
+        assert audit.prefiltered_count == 0
+        assert fast.compared_count + fast.prefiltered_count >= audit.compared_count
+    assert any(match is not None for match in expected)
+    assert fast.prefiltered_count > 0
+    ledger.close()
+
+# ---------- user-018 按表头识别来源 ----------
+
+def test_padded_headers_detect_and_normalize(tmp_path):
+    # 数说123导出，表头单元格带首尾空白
+    header = ["市", " 区/县", "中标年份 ", "中标月份", " 项目名称 ", "招采单位", "中标公司", "中标金额", "项目建设内容"]
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "中标项目"
+    ws.append(header)
+    ws.append(["西安", "雁塔区", "25年", "202503", "智慧校园平台", "西安市教育局", "甲公司、乙公司", 12.5, "建设内容"])
+    path = tmp_path / "weekly_export.xlsx"
+    wb.save(path)
+
+    assert bat.detect_source_kind(str(path)) == ("shushuo", "表头")
+    normalizer = bat.BidSourceNormalizer(TARGET_COLUMNS, log=lambda message: None)
+    for df in (list(normalizer.iter_batches("shushuo", str(path)))[0], normalizer.normalize("shushuo", str(path))):
+        assert normalizer.error_status is None
+        assert df["中标单位"].tolist() == ["甲公司", "乙公司"]
+        assert df["区县"].tolist() == ["雁塔区", "雁塔区"]
+        assert df["项目名称"].tolist() == ["智慧校园平台", "智慧校园平台"]
+
+# ---------- user-020 分批整理源数据 ----------
+
+def test_sheet_batches_keep_first_batch_dtypes(tmp_path):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(["金额", "编号", "名称"])
+    ws.append([1.5, "A01", "甲"])
+    ws.append([2.5, "A02", "乙"])
+    ws.append([3, 1003, "丙"])   # 第二批：金额为整数，编号为数字
+    ws.append([4, 1004, None])
+    path = tmp_path / "源数据.xlsx"
+    wb.save(path)
+
+    batches = list(bat.iter_sheet_batches(str(path), lambda sheets: sheets[0], 0, batch_size=2))
+    assert len(batches) == 2
+    assert list(batches[1].dtypes) == list(batches[0].dtypes)
+    expected = pd.read_excel(path)
+    pd.testing.assert_frame_equal(pd.concat(batches, ignore_index=True), expected)
+
+class FakeFuture:
+    def __init__(self, result):
+        self._result = result
+
+    def result(self):
+        return self._result
+
+    def cancel(self):
+        return True
+
+class FakePool:
+    instances = []
+
+    def __init__(self, max_workers):
+        self.shutdown_called = False
+        FakePool.instances.append(self)
+
+    def submit(self, func, kind, path, target_columns):
+        return FakeFuture((pd.DataFrame({"项目名称": [os.path.basename(path)]}), [], None))
+
+    def shutdown(self, wait=True):
+        self.shutdown_called = True
+
+def test_source_batches_close_shuts_down_pool(tmp_path, monkeypatch):
+    monkeypatch.setattr(bat, "ProcessPoolExecutor", FakePool)
+    sources = []
+    for name in ("a.xlsx", "b.xlsx"):
+        (tmp_path / name).write_bytes(b"x")
+        sources.append(("ict", str(tmp_path / name)))
+    app = bat.BidAnalysisApp.__new__(bat.BidAnalysisApp)
+    app.target_columns = TARGET_COLUMNS
+    app.label_cache = None
+    app.log = app.set_status = lambda message: None
+    app._classify_bid_frame = lambda df: None
+    reader = app._iter_source_batches(sources)
+    assert next(reader)["项目名称"].tolist() == ["a.xlsx"]
+    reader.close() # 项目汇总流程中途返回时在finally中关闭
+    assert FakePool.instances[-1].shutdown_called
+
+# ---------- user-008 项目清单索引库 ----------
+
+def test_sidecar_per_workbook_lineage(tmp_path):
+    project = bat.ProjectLedgerDB.sidecar_path(str(tmp_path / "项目汇总.xlsx"))
+    company = bat.ProjectLedgerDB.sidecar_path(str(tmp_path / "公司汇总.xlsx"))
+    assert project != company # 同目录下的项目汇总、公司汇总文件各用一个索引库
+    # 另存的结果（含多次另存）与原文件共用索引库
+    assert bat.ProjectLedgerDB.sidecar_path(str(tmp_path / "项目汇总_更新项目_20250101_093000.xlsx")) == project
+    assert bat.ProjectLedgerDB.sidecar_path(str(tmp_path / "公司汇总_更新公司_20250101_093000_更新公司_20250102_100000.xlsx")) == company
@@ -3,6 +3,7 @@ from tkinter import filedialog, messagebox, scrolledtext
 from tkinter import ttk # ttk是tkinter的一个子模块，提供了更现代化的组件，如Combobox、Treeview等
 from tkcalendar import DateEntry # 日历选择框
 import pandas as pd
+import numpy as np
 from pandas.tseries.offsets import MonthEnd
 import openpyxl
 import os
@@ -12,6 +13,13 @@ from typing import Dict
 from datetime import datetime
 import logging
 import traceback
+import hashlib
+import io
+import json
+import shutil
+import time
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
 
 # @Time     : 2026/04/13/16:00
 # @Author   : talen
@@ -19,6 +27,281 @@ import traceback
 
 class NameMappingError(Exception):
     """单元/行业名称映射失败的自定义异常"""
+
+class LongestMatchNameMapper:
+    """
+    单元/行业名称的最长匹配映射器（Aho-Corasick自动机）
+    底表名称包含映射表"清单底表"列的某个关键字，即映射为对应的"通报模板"名称
+    同时包含多个关键字时取最长的（"南高新"优先于"高新"），等长时取映射表中靠前的，
+    与按关键字长度降序排序后逐个 `key in name` 的结果一致，但每个名称只需扫描一遍
+    """
+    def __init__(self, map_list):
+        self._goto = [{}] # 状态转移表，下标为状态号，0为根节点
+        self._fail = [0]  # 失配指针
+        self._best = [None] # 每个状态可命中的最优关键字：((-长度, 映射表顺序), 目标名称)，已合并失配链上的后缀关键字
+        self._empty_target = None # 空关键字包含于任意名称，仅在其他关键字都未命中时使用
+        for order, (key, target_name) in enumerate(map_list):
+            key = str(key)
+            priority = (-len(key), order)
+            if not key:
+                if self._empty_target is None:
+                    self._empty_target = target_name
+                continue
+            state = 0
+            for ch in key:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._best.append(None)
+                    self._goto[state][ch] = nxt
+                state = nxt
+            if self._best[state] is None or priority < self._best[state][0]:
+                self._best[state] = (priority, target_name)
+        self._build_fail_links()
+
+    def _build_fail_links(self):
+        # 广度优先构建失配指针，并把失配链上的最优关键字合并到当前状态，扫描时无需再沿链回溯
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                fail_to = self._goto[f].get(ch, 0)
+                self._fail[nxt] = fail_to if fail_to != nxt else 0
+                suffix_best = self._best[self._fail[nxt]]
+                if suffix_best is not None and (self._best[nxt] is None or suffix_best[0] < self._best[nxt][0]):
+                    self._best[nxt] = suffix_best
+
+    def match(self, name):
+        """返回名称对应的目标名称，没有命中任何关键字时返回None"""
+        goto, fail, best_of = self._goto, self._fail, self._best
+        best = None
+        state = 0
+        for ch in name:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            candidate = best_of[state]
+            if candidate is not None and (best is None or candidate[0] < best[0]):
+                best = candidate
+        return best[1] if best is not None else self._empty_target
+
+class ParsedSheetCache:
+    """
+    已解析Sheet的本地缓存（pandas pickle，保留列类型，加载为毫秒级）
+    缓存条目以 (文件内容哈希, sheet, header, usecols) 为键，文件大小、修改时间未变时直接复用上次的内容哈希，
+    文件仅被另存/复制（内容未变）时仍能命中；源文件内容变化后，旧条目在写入新条目时一并清理
+    - 每个条目文件的sha256记录在索引中，加载前先校验，只有本程序写入且未被改动的条目才会反序列化，
+      被替换或损坏的条目按未命中重新解析
+    """
+    INDEX_FILENAME = "index.json"
+    ENTRY_SUFFIX = ".pkl"
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self._index_filepath = os.path.join(cache_dir, self.INDEX_FILENAME)
+        self._index = self._load_index() # {"files": {绝对路径: {"size", "mtime_ns", "sha1"}}, "entries": {条目文件名: sha256}}
+        self.hits = 0
+        self.misses = 0
+
+    def _load_index(self):
+        try:
+            with open(self._index_filepath, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = None
+        if isinstance(index, dict) and isinstance(index.get("files"), dict) and isinstance(index.get("entries"), dict):
+            return index
+        # 索引缺失或为旧版本：目录中的条目无法校验，不加载，直接删除
+        if os.path.isdir(self.cache_dir):
+            for filename in os.listdir(self.cache_dir):
+                if filename.endswith((".pkl", ".pkl.tmp", ".npz", ".npz.tmp")):
+                    try:
+                        os.remove(os.path.join(self.cache_dir, filename))
+                    except OSError:
+                        pass
+        return {"files": {}, "entries": {}}
+
+    def _save_index(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_filepath = self._index_filepath + ".tmp"
+        with open(tmp_filepath, 'w', encoding='utf-8') as f:
+            json.dump(self._index, f, ensure_ascii=False)
+        os.replace(tmp_filepath, self._index_filepath)
+
+    def _content_hash(self, filepath):
+        """大小、修改时间未变时沿用记录的哈希，否则重新计算文件内容的sha1"""
+        filepath = os.path.abspath(filepath)
+        stat = os.stat(filepath)
+        entry = self._index["files"].get(filepath)
+        if entry and entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+            return entry["sha1"]
+        sha1 = hashlib.sha1()
+        with open(filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha1.update(chunk)
+        digest = sha1.hexdigest()
+        old_digest = entry.get("sha1") if entry else None
+        self._index["files"][filepath] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha1": digest}
+        try:
+            if old_digest and old_digest != digest:
+                self._purge_content(old_digest)
+            self._save_index()
+        except OSError:
+            pass
+        return digest
+
+    def _purge_content(self, digest):
+        """删除已无任何源文件引用的旧内容的缓存条目"""
+        if any(entry.get("sha1") == digest for entry in self._index["files"].values()):
+            return
+        for filename in list(self._index["entries"]):
+            if filename.startswith(digest + "_"):
+                del self._index["entries"][filename]
+        for filename in os.listdir(self.cache_dir):
+            if filename.startswith(digest + "_"):
+                try:
+                    os.remove(os.path.join(self.cache_dir, filename))
+                except OSError:
+                    pass
+
+    def _entry_filename(self, digest, sheet_name, header, usecols):
+        key = json.dumps([str(sheet_name), header, list(usecols) if usecols is not None else None], ensure_ascii=False)
+        return f"{digest}_{hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]}{self.ENTRY_SUFFIX}"
+
+    def read_excel(self, filepath, sheet_names, header=0, usecols=None):
+        """
+        按sheet读取，命中缓存的直接加载，其余sheet一次read_excel读取后写入缓存
+        @return: {sheet名: DataFrame}
+        """
+        digest = self._content_hash(filepath)
+        result = {}
+        missing = []
+        for sheet_name in sheet_names:
+            entry_filename = self._entry_filename(digest, sheet_name, header, usecols)
+            expected_sha256 = self._index["entries"].get(entry_filename)
+            try:
+                if expected_sha256 is None:
+                    raise FileNotFoundError(entry_filename)
+                with open(os.path.join(self.cache_dir, entry_filename), 'rb') as f:
+                    data = f.read()
+                if hashlib.sha256(data).hexdigest() != expected_sha256:
+                    raise ValueError(f"缓存条目校验失败: {entry_filename}")
+                result[sheet_name] = pd.read_pickle(io.BytesIO(data), compression=None)
+                self.hits += 1
+            except Exception: # 不存在、校验失败或已损坏，重新解析
+                missing.append(sheet_name)
+        if missing:
+            self.misses += len(missing)
+            parsed = pd.read_excel(filepath, sheet_name=missing, header=header, usecols=usecols)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            index_changed = False
+            for sheet_name, df in parsed.items():
+                result[sheet_name] = df
+                entry_filename = self._entry_filename(digest, sheet_name, header, usecols)
+                entry_filepath = os.path.join(self.cache_dir, entry_filename)
+                buffer = io.BytesIO()
+                df.to_pickle(buffer, compression=None)
+                data = buffer.getvalue()
+                try:
+                    with open(entry_filepath + ".tmp", 'wb') as f:
+                        f.write(data)
+                    os.replace(entry_filepath + ".tmp", entry_filepath)
+                except OSError: # 缓存写入失败不影响本次读取结果
+                    continue
+                self._index["entries"][entry_filename] = hashlib.sha256(data).hexdigest()
+                index_changed = True
+            if index_changed:
+                try:
+                    self._save_index()
+                except OSError:
+                    pass
+        return result
+
+    def clear(self):
+        """清空缓存目录"""
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        self._index = {"files": {}, "entries": {}}
+        self.hits = 0
+        self.misses = 0
+
+class PrehandledSnapshotWriter:
+    """
+    预处理后数据快照的后台写入器
+    单个后台线程按提交顺序写文件，主线程继续统计；线程内只做文件写入，不调用任何Tk接口，
+    结果（成功文件及失败原因）由主线程在流程结束时通过finish()取回并提示
+    """
+    # 格式: (文件扩展名, 依赖的模块，None表示无额外依赖)
+    FORMATS = {
+        "csv.gz": (".csv.gz", None),
+        "parquet": (".parquet", "pyarrow"),
+        "feather": (".feather", "pyarrow"),
+        "xlsx": (".xlsx", None),
+    }
+    DEFAULT_FORMAT = "csv.gz"
+
+    def __init__(self, output_dir, fmt, time_str):
+        self.output_dir = output_dir
+        self.fmt = fmt
+        self.time_str = time_str
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._futures = []
+
+    @classmethod
+    def resolve_format(cls, fmt):
+        """
+        校验配置的快照格式，未知格式或依赖未安装时退回csv.gz
+        @return: (实际使用的格式, 退回原因，未退回时为None)
+        """
+        fmt = str(fmt).strip().lower().lstrip('.')
+        if fmt not in cls.FORMATS:
+            return cls.DEFAULT_FORMAT, f"不支持的快照格式{fmt}"
+        required_module = cls.FORMATS[fmt][1]
+        if required_module and importlib.util.find_spec(required_module) is None:
+            return cls.DEFAULT_FORMAT, f"{fmt}格式需要安装{required_module}"
+        return fmt, None
+
+    def submit(self, origin_filepath, sheet_name, df):
+        """提交一个DataFrame，提交后调用方不得再修改该DataFrame"""
+        file_name = os.path.basename(origin_filepath)
+        new_filename = re.sub(r'(\.xlsx|\.xls)$', '', file_name, flags=re.IGNORECASE) + f"_预处理_{self.time_str}{self.FORMATS[self.fmt][0]}"
+        abs_new_filepath = os.path.join(self.output_dir, new_filename)
+        self._futures.append((abs_new_filepath, self._executor.submit(self._write, abs_new_filepath, sheet_name, df)))
+
+    def _write(self, filepath, sheet_name, df):
+        os.makedirs(self.output_dir, exist_ok=True)
+        if self.fmt == "csv.gz":
+            df.to_csv(filepath, index=False, encoding='utf-8-sig', compression='gzip')
+        elif self.fmt == "parquet":
+            df.to_parquet(filepath, index=False)
+        elif self.fmt == "feather":
+            df.reset_index(drop=True).to_feather(filepath)
+        else:
+            df.to_excel(filepath, sheet_name=sheet_name, index=False)
+
+    def finish(self):
+        """
+        等待所有文件写完
+        @return: (成功写入的文件列表, [(文件, 异常)])
+        """
+        saved, failed = [], []
+        for filepath, future in self._futures:
+            try:
+                future.result()
+                saved.append(filepath)
+            except Exception as e:
+                failed.append((filepath, e))
+        self._executor.shutdown(wait=True)
+        self._futures = []
+        return saved, failed
+
 class BizReportApp:
     def __init__(self, root):
         self.root = root
@@ -50,6 +333,9 @@ class BizReportApp:
         self.config_filepath = os.path.join(self.base_dir, "reference", "config.yaml")
         self.unit_industry_map_filepath = os.path.join(self.base_dir, "reference", "单元_行业名称映射表.xlsx")
         self._report_template_filepath = os.path.join(self.base_dir, "reference", "通报模板.xlsx")
+        # 已解析源数据的缓存，源文件未变化时跳过Excel解析
+        self.use_source_cache = tk.BooleanVar(value=True)
+        self.source_cache = ParsedSheetCache(os.path.join(self.base_dir, "源数据缓存"))
 
         # =============================== 创建UI ==================================
         self._create_ui()
@@ -76,6 +362,10 @@ class BizReportApp:
         self.industry_order = None
         # 明细列标签，保留顺序
         self.col_order = None
+        # 预处理后数据快照：是否保存、保存格式
+        self.snapshot_enabled = True
+        self.snapshot_format = PrehandledSnapshotWriter.DEFAULT_FORMAT
+        self._snapshot_writer = None # 本次运行的后台写入器，流程结束时取回结果
 
         # 防抖定时器，由于延迟校验输入
         self._check_timer = None
@@ -166,6 +456,12 @@ class BizReportApp:
         ttk.Checkbutton(frame_settings_caliber, text="宽口径", variable=self.loose_mode).grid(row=0, column=0, padx=5)
         ttk.Checkbutton(frame_settings_caliber, text='窄口径', variable=self.strict_mode).grid(row=0, column=1, padx=5)
 
+        # 3. 源数据缓存
+        frame_settings_cache = tk.LabelFrame(frame_settings, text="源数据缓存", padx=10, pady=10)
+        frame_settings_cache.pack(side='left', padx=10, pady=5,anchor='n')
+        ttk.Checkbutton(frame_settings_cache, text="使用缓存", variable=self.use_source_cache).grid(row=0, column=0, padx=5)
+        tk.Button(frame_settings_cache, text="清空缓存", command=self._clear_source_cache).grid(row=0, column=1, padx=5)
+
         # =============================== 操作区域 ===============================
         frame_actions = tk.LabelFrame(self.root, padx=10, pady=10)
         frame_actions.pack(fill='x', side='top', padx=10, pady=5)
@@ -316,6 +612,11 @@ class BizReportApp:
         else:
             self.logger.info(message)
     
+    def _clear_source_cache(self):
+        """清空源数据缓存，下次生成报告时重新解析所有文件"""
+        self.source_cache.clear()
+        self._log("已清空源数据缓存")
+
     def _select_file(self, filepath_var: tk.StringVar):
         filename = filedialog.askopenfilename(
             initialdir=self.base_dir,
@@ -387,6 +688,10 @@ class BizReportApp:
             self.unit_order = self.config['unit_order']
             self.industry_order = self.config['industry_order']
             self.col_order = self.config['col_order']
+            # 预处理后数据快照，可选配置，缺省时保存为csv.gz
+            snapshot_config = self.config.get('prehandled_snapshot') or {}
+            self.snapshot_enabled = bool(snapshot_config.get('enabled', True))
+            self.snapshot_format = snapshot_config.get('format', PrehandledSnapshotWriter.DEFAULT_FORMAT)
         # 捕获：配置文件少写了字段（比如漏了 above_million）
         except KeyError as ke:
             self._log(f"加载配置失败：\n配置文件缺少关键字段: {traceback.format_exc()}", 'error')
@@ -405,27 +710,28 @@ class BizReportApp:
         """使用pandas打开底表文件, 并检查是否存在指定列"""
         # 要加载的文件列表
         self._update_status("读取文件")
+        # 单元、行业映射在同一个文件中，一次读取两个sheet
         file_list = [
-            (self.unit_industry_map_filepath, "单元", ["清单底表", "通报模板"], "单元名称映射文件"),
-            (self.unit_industry_map_filepath, "行业", ["清单底表", "通报模板"], "行业名称映射文件"),
-            (self.biz_above_million_filepath.get().strip(), self.above_million_sheet, self.above_million_required_cols, "百万以上商机文件"),
-            (self.biz_below_million_filepath.get().strip(), self.below_million_sheet, self.below_million_required_cols, "百万以下商机文件"),
-            (self.contract_status_filepath.get().strip(), self.contract_status_sheet, self.contract_status_required_cols, "签约情况文件"),
-            (self.biz_code_filepath.get().strip(), self.biz_code_sheet, self.biz_code_required_cols, "全量商机编码文件")
+            (self.unit_industry_map_filepath, ["单元", "行业"], ["清单底表", "通报模板"], ["单元名称映射文件", "行业名称映射文件"]),
+            (self.biz_above_million_filepath.get().strip(), [self.above_million_sheet], self.above_million_required_cols, ["百万以上商机文件"]),
+            (self.biz_below_million_filepath.get().strip(), [self.below_million_sheet], self.below_million_required_cols, ["百万以下商机文件"]),
+            (self.contract_status_filepath.get().strip(), [self.contract_status_sheet], self.contract_status_required_cols, ["签约情况文件"]),
+            (self.biz_code_filepath.get().strip(), [self.biz_code_sheet], self.biz_code_required_cols, ["全量商机编码文件"])
         ]
         # 逐个加载
         def _check_na(df, col):
             return ((df[col].isna()) | (df[col] == '')).sum()
+        def _read_sheets(filepath, sheetnames, header, required_cols):
+            if self.use_source_cache.get():
+                return self.source_cache.read_excel(filepath, sheetnames, header=header, usecols=required_cols)
+            return pd.read_excel(filepath, sheet_name=sheetnames, header=header, usecols=required_cols)
         df_list = []
-        for filepath, sheetname, required_cols, display_name in file_list:
+        hits_before, misses_before = self.source_cache.hits, self.source_cache.misses
+        for filepath, sheetnames, required_cols, display_names in file_list:
+            display_name = "、".join(display_names)
             self._log(f"正在加载{display_name}...")
             try:
-                df = pd.read_excel(filepath, sheet_name=sheetname, header=1 if "映射文件" in display_name else 0, usecols=required_cols)
-                df_list.append(df)
-                self._log(f"成功加载{display_name}！共 {len(df)} 行")
-                # 提醒关键列数据缺失
-                if "百万" in display_name or "签约" in display_name:
-                    self._log(f"{display_name}缺失：单元{_check_na(df, required_cols[1])}个，行业{_check_na(df, required_cols[2])}个，日期{_check_na(df, required_cols[3])}个", "warning")
+                df_dict = _read_sheets(filepath, sheetnames, 1 if "映射文件" in display_name else 0, required_cols)
             except ValueError as ve: # usecols列缺失，捕获ValueError
                 self._log(f"{display_name}缺少必需列：\n{traceback.format_exc()}", 'error')
                 self._update_status("读取文件失败")
@@ -435,6 +741,15 @@ class BizReportApp:
                 self._log(f"{display_name}格式不正确：\n{traceback.format_exc()}", 'error')
                 messagebox.showerror('错误', f'加载{display_name}失败')
                 return None
+            for sheetname, sheet_display_name in zip(sheetnames, display_names):
+                df = df_dict[sheetname]
+                df_list.append(df)
+                self._log(f"成功加载{sheet_display_name}！共 {len(df)} 行")
+                # 提醒关键列数据缺失
+                if "百万" in sheet_display_name or "签约" in sheet_display_name:
+                    self._log(f"{sheet_display_name}缺失：单元{_check_na(df, required_cols[1])}个，行业{_check_na(df, required_cols[2])}个，日期{_check_na(df, required_cols[3])}个", "warning")
+        if self.use_source_cache.get():
+            self._log(f"源数据缓存：命中 {self.source_cache.hits - hits_before} 个sheet，重新解析 {self.source_cache.misses - misses_before} 个sheet")
         # 单独提醒全量商机编码文件关键列数据缺失
         self._log(f"全量商机编码文件缺失：日期{_check_na(df_list[5], self.biz_code_required_cols[1])}个", "warning")
         return df_list
@@ -536,36 +851,35 @@ class BizReportApp:
         # # 将签约情况表中的"省口径签约额"列单位从"元"改为"万元"
         df_contract['money'] = df_contract['money'] / 10000
         
-        # 3. 构建单元名称映射表、行业名称映射表，可能存在多对一映射关系
+        # 3. 构建单元名称映射器、行业名称映射器，可能存在多对一映射关系
         ## 注意不要用dict，因为清单底表列存在"高新","南高新"这种相互包含的关键字
-        ## 并且本来就是要逐个遍历，所以即使使用dict也不会提高效率
-        ## 因此使用list保留顺序, 并根据关键字长度排个序，长的关键字在前边，避免"南高新"被"高新"给匹配走
-        unit_map_list = df_unit_map[["清单底表", "通报模板"]].values.tolist() #values是将DataFrame转换成二维numpy数组，tolist()再将其转换成列表
-        unit_map_list.sort(key=lambda x: len(x[0]), reverse=True)
-        industry_map_list = df_industry_map[["清单底表", "通报模板"]].values.tolist()
-        industry_map_list.sort(key=lambda x: len(x[0]), reverse=True)
+        ## 映射器编译时即按"关键字越长越优先、等长按映射表顺序"确定优先级，避免"南高新"被"高新"给匹配走
+        unit_mapper = LongestMatchNameMapper(df_unit_map[["清单底表", "通报模板"]].values.tolist()) #values是将DataFrame转换成二维numpy数组，tolist()再将其转换成列表
+        industry_mapper = LongestMatchNameMapper(df_industry_map[["清单底表", "通报模板"]].values.tolist())
 
         # 4. 根据单元_行业名称映射表，将底表的单元、行业两列映射成与模板中一致
         # 注意：非绝对匹配，只要底表名称包含"清单底表"列的某个键，就可以映射到对应的"通报模板"名称，不成功会标记为"unmatched"
-        def map_fuzzy_names(data_series, map_list, type: str):
+        def map_fuzzy_names(data_series, mapper, type: str):
             """
             模糊名称匹配，原始值包含关键词→替换为目标值
+            只匹配去重后的取值，再按factorize编码广播回原行；空值标记为"unmatched"，不计入未匹配名称
             """
             unmatched_names = [] # 收集所有未匹配的名称
-            def map_func(x):
-                if pd.isna(x):
-                    return "unmatched"
+            codes, uniques = pd.factorize(data_series) # codes为每行对应uniques的下标，空值编码为-1
+            mapped_names = []
+            for x in uniques:
                 x_str = str(x).strip()
-                for key, target_name in map_list:
-                    if key in x_str:
-                        return target_name
-                unmatched_names.append(x_str)
-                return "unmatched"
+                target_name = mapper.match(x_str)
+                if target_name is None:
+                    unmatched_names.append(x_str)
+                    target_name = "unmatched"
+                mapped_names.append(target_name)
+            mapped_names.append("unmatched") # 下标-1取到末尾，即空值的映射结果
             # 执行映射
-            mapped_series = data_series.apply(map_func)
+            mapped_series = pd.Series(np.array(mapped_names, dtype=object)[codes], index=data_series.index, name=data_series.name)
             # 检查是否有未匹配项
             if unmatched_names:
-                unique_unmatched = list(set(unmatched_names))
+                unique_unmatched = list(dict.fromkeys(unmatched_names))
                 error_msg = f"{type}名称映射失败，未匹配的名称：{','.join(unique_unmatched)}\n请更新映射表后重试！"
                 self._log(error_msg, 'error')
                 raise NameMappingError(error_msg)
@@ -573,15 +887,15 @@ class BizReportApp:
         
         try:
             self._log("正在映射单元名称...")
-            df_above['unit'] = map_fuzzy_names(df_above['unit'], unit_map_list, '百万以上单元')
-            df_below['unit'] = map_fuzzy_names(df_below['unit'], unit_map_list, '百万以下单元')
-            df_contract['unit'] = map_fuzzy_names(df_contract['unit'], unit_map_list, '签约情况单元')
+            df_above['unit'] = map_fuzzy_names(df_above['unit'], unit_mapper, '百万以上单元')
+            df_below['unit'] = map_fuzzy_names(df_below['unit'], unit_mapper, '百万以下单元')
+            df_contract['unit'] = map_fuzzy_names(df_contract['unit'], unit_mapper, '签约情况单元')
             self._log("成功映射单元名称！")
 
             self._log("正在映射行业名称...")
-            df_above['industry'] = map_fuzzy_names(df_above['industry'], industry_map_list, '百万以上行业')
-            df_below['industry'] = map_fuzzy_names(df_below['industry'], industry_map_list, '百万以下行业')
-            df_contract['industry'] = map_fuzzy_names(df_contract['industry'], industry_map_list, '签约情况行业')
+            df_above['industry'] = map_fuzzy_names(df_above['industry'], industry_mapper, '百万以上行业')
+            df_below['industry'] = map_fuzzy_names(df_below['industry'], industry_mapper, '百万以下行业')
+            df_contract['industry'] = map_fuzzy_names(df_contract['industry'], industry_mapper, '签约情况行业')
             self._log("成功映射行业名称！")
         except NameMappingError as e:
             # 映射失败，终止整个流程
@@ -615,42 +929,29 @@ class BizReportApp:
 
         # 6. 保存预处理之后的数据到文件，留待后续参考
         def save_prehandled_data(file_list):
-            prehandled_output_dir = os.path.join(self.base_dir, "预处理后的数据")
+            """
+            提交到后台线程保存预处理后的数据，统计同时进行，保存结果在流程结束时汇报
+            """
+            if not self.snapshot_enabled:
+                self._log("配置中已关闭预处理数据快照，跳过保存")
+                return
+            snapshot_format, fallback_reason = PrehandledSnapshotWriter.resolve_format(self.snapshot_format)
+            if fallback_reason:
+                self._log(f"{fallback_reason}，预处理数据改为保存为{snapshot_format}", "warning")
             now_str = pd.Timestamp.now().strftime("%Y%m%d_%H%M%S")
-            current_prehandles_dir = os.path.join(prehandled_output_dir, now_str)
-            os.makedirs(current_prehandles_dir, exist_ok=True)
-
+            current_prehandles_dir = os.path.join(self.base_dir, "预处理后的数据", now_str)
+            self._snapshot_writer = PrehandledSnapshotWriter(current_prehandles_dir, snapshot_format, now_str)
+            # 以下统计只读取这些DataFrame，不再修改，后台线程可直接写出
             for origin_filepath, sheet_name, df in file_list:
-                file_name = os.path.basename(origin_filepath)
-                new_filepath = re.sub(
-                    r'(\.xlsx|\.xls)$', 
-                    fr'_预处理_{now_str}\1',
-                    file_name,
-                    flags=re.IGNORECASE
-                    )
-               
-                abs_new_filepath = os.path.join(current_prehandles_dir, new_filepath)
-                try:
-                    df.to_excel(
-                        abs_new_filepath,
-                        sheet_name = sheet_name,
-                        index = False
-                    )
-                    self._log(f"预处理后的数据文件已保存至: \n{abs_new_filepath}")
-                except Exception as e:
-                    self._log(f"保存预处理数据失败：\n{traceback.format_exc()}", level="error")
-                    self._update_status("保存预处理数据失败")
-                    messagebox.showerror("失败", f"保存预处理数据失败：\n{str(e)}")
-                    return False
-            return True
+                self._snapshot_writer.submit(origin_filepath, sheet_name, df)
+            self._log(f"预处理后的数据正在后台保存({snapshot_format})...")
         
         prehandled_data_file_list = [
             (self.biz_above_million_filepath.get(), self.above_million_sheet, df_above),
             (self.biz_below_million_filepath.get(), self.below_million_sheet, df_below),
             (self.contract_status_filepath.get(), self.contract_status_sheet, df_contract_merged)
         ]  
-        if not save_prehandled_data(prehandled_data_file_list):
-            return
+        save_prehandled_data(prehandled_data_file_list)
 
         # ==================================== 数据汇总 ====================================
         self._update_status("数据汇总")
@@ -658,141 +959,129 @@ class BizReportApp:
         # 1. 合并
         df_all_biz = pd.concat([df_above, df_below], ignore_index=True, sort=False) # ignore_index重置索引，sort=False避免列名排序
         # 2. 函数
-        def unified_count_sum_fun(df, groupby_col, prefix):
+        # 金额档位（万元）：五十万以下 <50，五十至百万 [50, 100)，百万以上 >=100
+        money_band_labels = ["五十万以下", "五十至百万", "百万以上"]
+        # 指定时间段/指定月的统计列（不含前缀）；计划签约量/金额由百万以下、百万以上计划签约相加得到
+        period_stat_labels = [
+            "百万以下计划签约", "百万以上计划签约", "五十万以下计划签约", "五十至百万计划签约",
+            "实际签约", "五十万以下实际签约", "五十至百万实际签约", "百万以上实际签约"
+            ]
+        period_stat_cols = [f"{label}{stat}" for label in period_stat_labels for stat in ("量", "金额")]
+
+        def collect_stat_facts(df_all_biz, df_contract_merged, strict_modes):
             """
-            统一的计数和求和函数
+            统计明细打标签：每行只计算一次金额档位、所属时间段，再展开成长表，一条记录计入几个统计列就出现几行
+            @param df_all_biz: 商机清单，包含百万以上、百万以下，两种口径共用
+            @param df_contract_merged: 实际签约情况，宽口径使用全部记录，窄口径只使用strict为True的记录
+            @param strict_modes: 需要统计的口径列表，True为窄口径、False为宽口径
+            @return: (明细DataFrame[口径, 维度, 名称, 统计列, money], 随后三个月的统计列标签列表)
             """
-            return df.groupby(groupby_col).agg(
-                **{f"{prefix}量": (groupby_col, "count")},
-                **{f"{prefix}金额": ("money", "sum")}
-                )
-        
-        def unified_stat_by_period_money(df_all_biz, df_contract_filterd, groupby_col, by_month: bool = False):
+            period_start, period_end = self.start_date.get(), self.end_date.get()
+            month_start = pd.to_datetime(f"{self.stat_year.get()}-{self.stat_month.get()}-01")
+            month_end = month_start + MonthEnd(1)
+
+            # 商机清单标签
+            above = df_all_biz['above_flag'].astype(bool)
+            below = ~above
+            plan_band = pd.cut(df_all_biz['money'], bins=[-np.inf, 50, 100, np.inf], right=False, labels=money_band_labels)
+            plan_in_period = df_all_biz['date'].between(period_start, period_end) # between默认是闭区间，所以会包含结束日期，符合需求
+            plan_in_month = df_all_biz['date'].between(month_start, month_end)
+            # 由于百万以上商机预计签约日期只到月，按时间段统计时需要参考“是否目标时间段”这一列
+            above_target = above & (df_all_biz['target'] == "是")
+            fact_masks = [ # [(口径, 数据表, 行掩码, 统计列)]
+                ("共用", df_all_biz, pd.Series(True, index=df_all_biz.index), "整体计划签约"),
+                ("共用", df_all_biz, above, "整体百万以上计划签约"),
+                ("共用", df_all_biz, below & plan_in_period, "peroid_百万以下计划签约"),
+                ("共用", df_all_biz, above_target, "peroid_百万以上计划签约"),
+                ("共用", df_all_biz, below & plan_in_month, "month_百万以下计划签约"),
+                ("共用", df_all_biz, above & plan_in_month, "month_百万以上计划签约"),
+            ]
+            for band in money_band_labels[:2]:
+                fact_masks.append(("共用", df_all_biz, below & plan_in_period & (plan_band == band), f"peroid_{band}计划签约"))
+                fact_masks.append(("共用", df_all_biz, below & plan_in_month & (plan_band == band), f"month_{band}计划签约"))
+            # 随后三个月
+            next_month_labels = []
+            for idx in range(1, 4):
+                start_dt = month_start + pd.DateOffset(months=idx)
+                end_dt = start_dt + MonthEnd(1)
+                next_month_labels.append(f"{start_dt.month}月计划签约")
+                fact_masks.append(("共用", df_all_biz, df_all_biz['date'].between(start_dt, end_dt), next_month_labels[-1]))
+
+            # 实际签约标签，按口径分别计入
+            contract_band = pd.cut(df_contract_merged['money'], bins=[-np.inf, 50, 100, np.inf], right=False, labels=money_band_labels)
+            contract_in_period = df_contract_merged['sign_date'].between(period_start, period_end)
+            contract_in_month = df_contract_merged['sign_date'].between(month_start, month_end)
+            for strict_mode in strict_modes:
+                mode_key = "窄口径" if strict_mode else "宽口径"
+                in_mode = df_contract_merged['strict'].astype(bool) if strict_mode else pd.Series(True, index=df_contract_merged.index)
+                for prefix, in_time in (("peroid_", contract_in_period), ("month_", contract_in_month)):
+                    fact_masks.append((mode_key, df_contract_merged, in_mode & in_time, f"{prefix}实际签约"))
+                    for band in money_band_labels:
+                        fact_masks.append((mode_key, df_contract_merged, in_mode & in_time & (contract_band == band), f"{prefix}{band}实际签约"))
+
+            # 展开成长表，单元、行业两个维度各一份
+            fact_frames = []
+            for mode_key, df, mask, label in fact_masks:
+                df_selected = df.loc[mask.to_numpy(), ['unit', 'industry', 'money']]
+                for groupby_col in ('unit', 'industry'):
+                    fact_frames.append(pd.DataFrame({
+                        '口径': mode_key,
+                        '维度': groupby_col,
+                        '名称': df_selected[groupby_col].to_numpy(),
+                        '统计列': label,
+                        'money': df_selected['money'].to_numpy()
+                        }))
+            return pd.concat(fact_frames, ignore_index=True), next_month_labels
+
+        def aggregate_stat_facts(df_facts):
             """
-            可以指定按单元/行业汇总，并分金额范围统计
-            @param df_all_biz: 商机清单，包含百万以上、百万以下
-            @param df_contract_filterd: 实际签约情况，按不同口径筛选过
-            @param groupby_col: 指定按单元/行业汇总
-            @param by_month: 区分是按指定时间段统计，还是按月，
+            单次groupby得到所有口径、维度、统计列的计数和求和，再按(口径, 维度)拆成宽表
+            @return: {(口径, 维度): DataFrame(index=名称, columns=统计列+量/金额)}
             """
-            # 如果是按月统计，转换为具体时间
-            if by_month:
-                start_date = pd.to_datetime(f"{self.stat_year.get()}-{self.stat_month.get()}-01")
-                end_date = start_date + MonthEnd(1)
-            else:
-                start_date = self.start_date.get()
-                end_date = self.end_date.get()
-            
-            df_plan_period = df_all_biz[
-                df_all_biz['date'].between(start_date, end_date)
-            ]
-            
-            # 由于百万以上商机预计签约日期只到月，按时间段统计时需要参考“是否目标时间段”这一列
-            # 百万以上和百万以下，分开统计
-            df_below_period = df_plan_period[~df_plan_period['above_flag']].copy() # between默认是闭区间，所以会包含结束日期，符合需求
-            df_below_period_less50 = df_below_period[df_below_period['money'] < 50]
-            df_below_period_50to100 = df_below_period[df_below_period['money'].between(50, 100, inclusive='left')]
-            df_agg_below_period_less50 = unified_count_sum_fun(df_below_period_less50, groupby_col, '五十万以下计划签约')
-            df_agg_below_period_50to100 = unified_count_sum_fun(df_below_period_50to100, groupby_col, '五十至百万计划签约')
-            if by_month:
-                df_above_period = df_plan_period[df_plan_period['above_flag']]
-            else:
-                df_above_period = df_all_biz[(df_all_biz['above_flag']) & (df_all_biz['target'] == "是")].copy()
-            df_agg_above_period = unified_count_sum_fun(df_above_period, groupby_col, '百万以上计划签约')
-            # 计划签约情况
-            df_agg_below_period = unified_count_sum_fun(df_below_period, groupby_col, '百万以下计划签约') # 百万以下
-            # # merge百万以下、百万以上的整体计划签约情况
-            df_agg_plan_period = df_agg_below_period.join(
-                df_agg_above_period,
-                how='outer'
-            ).fillna(0)
-            # # 总计 = 百万以上+百万以下
-            df_agg_plan_period['计划签约量'] = df_agg_plan_period['百万以上计划签约量'] + df_agg_plan_period['百万以下计划签约量']
-            df_agg_plan_period['计划签约金额'] = df_agg_plan_period['百万以上计划签约金额'] + df_agg_plan_period['百万以下计划签约金额']
-            # # 删除中间列
-            df_agg_plan_period = df_agg_plan_period[['计划签约量', '计划签约金额']].copy()
-            
-            # 实际签约情况
-            df_contract_period = df_contract_filterd[df_contract_filterd['sign_date'].between(start_date, end_date)].copy()
-            df_agg_contract_period = unified_count_sum_fun(df_contract_period, groupby_col, '实际签约')
-            df_contract_period_less50 = df_contract_period[df_contract_period['money'] < 50]
-            df_contract_period_50to100 = df_contract_period[df_contract_period['money'].between(50, 100, inclusive='left')]
-            df_contract_period_more100 = df_contract_period[df_contract_period['money'] >= 100]
-            df_agg_contract_period_less50 = unified_count_sum_fun(df_contract_period_less50, groupby_col, '五十万以下实际签约')
-            df_agg_contract_period_50to100 = unified_count_sum_fun(df_contract_period_50to100, groupby_col, '五十至百万实际签约')
-            df_agg_contract_period_more100 = unified_count_sum_fun(df_contract_period_more100, groupby_col, "百万以上实际签约")
-
-            # 横向合并所有统计表（列拼接，外连接保证所有单元都保留）
-            df_join = df_agg_plan_period.join(
-                [
-                    df_agg_contract_period,
-                    df_agg_below_period_less50,
-                    df_agg_contract_period_less50,
-                    df_agg_below_period_50to100,
-                    df_agg_contract_period_50to100,
-                    df_agg_above_period,
-                    df_agg_contract_period_more100
-                    ],
-                how='outer'
-                ).fillna(0)
-            # 按指定顺序进行行排序，不存在的单元自动补充0
-            row_index = self.unit_order if groupby_col == 'unit' else self.industry_order if groupby_col == 'industry' else None
-            df_stat = df_join.reindex(index=row_index, fill_value=0)
-
-            # 转签率 = 实际签约量 / 计划签约量
-            # df.apply() 默认给函数依次传入每列数据，数据类型是Series，带索引
-            # df.apply(axis=1) 依次传入整行
-            # df['列'].apply() 传入单列的每个元素
-            # df.applymap() 作用在全表每个单元格
-            # df_stat['转签率'] =  df_stat.apply(
-            #     lambda x: "{:.2%}".format(x['实际签约量'] / x['计划签约量'])
-            #     if x['计划签约量'] != 0 else 0,
-            #     axis=1
-            # )
-            df_stat['转签率'] = 0 # 先赋值为0，在写入excel时，重新计算
-            # 按指定顺序重新排布列索引
-            df_stat = df_stat.reindex(columns=self.col_order)
-            # 给所有列名加前缀
-            prefix = "month_" if by_month else "peroid_"
-            df_stat = df_stat.add_prefix(prefix)
-            return df_stat
-
-        def stat_standard_pipline(df_all_biz, df_contract_merged, groupby_col, strict_mode: bool):
+            if df_facts.empty:
+                return {}
+            df_agg = df_facts.groupby(['口径', '维度', '名称', '统计列'])['money'].agg(['count', 'sum'])
+            df_wide = df_agg.unstack('统计列') # 列为(count/sum, 统计列)
+            df_wide.columns = [f"{label}{'量' if stat == 'count' else '金额'}" for stat, label in df_wide.columns]
+            # 去掉其他口径、维度独有的统计列(全为空)，避免拼接时列名重复
+            return {
+                key: df_group.droplevel(['口径', '维度']).dropna(axis=1, how='all')
+                for key, df_group in df_wide.groupby(level=['口径', '维度'])
+                }
+
+        def assemble_stat(stat_tables, next_month_labels, groupby_col, strict_mode: bool):
             """
-            统一的统计函数，可指定按照宽口径/窄口径、单元/行业维度进行统计
+            由聚合结果拼出与通报模板一致的统计表：整体计划签约 + 指定时间段(col_order) + 指定月(col_order) + 随后三个月，首行为合计
             """
-            # 窄口径筛选
-            if strict_mode:
-                df_contract_filterd = df_contract_merged[df_contract_merged['strict']].copy()
-            else:
-                df_contract_filterd = df_contract_merged.copy() # 宽口径不筛选，直接使用原表
             mode_logtext = "窄口径" if strict_mode else "宽口径"
             groupby_logtext = "单元" if groupby_col=="unit" else "行业" if groupby_col=="industry" else None
-            self._log(f"正在按照{mode_logtext}-{groupby_logtext}维度进行统计...")
-            # 整体计划签约情况统计
-            df_stat_overall_plan = unified_count_sum_fun(df_all_biz, groupby_col, "整体计划签约")
-            df_stat = df_stat_overall_plan.join([unified_count_sum_fun(df_all_biz[df_all_biz['above_flag']], groupby_col, "整体百万以上计划签约")], how='outer').fillna(0)
+            self._log(f"正在按照{mode_logtext}-{groupby_logtext}维度整理统计结果...")
+            df_common = stat_tables.get(("共用", groupby_col), pd.DataFrame())
+            df_merged = df_common.join(stat_tables.get((mode_logtext, groupby_col), pd.DataFrame()), how='outer')
             # 按指定顺序进行行排序，不存在的单元自动补充0
             row_index = self.unit_order if groupby_col == 'unit' else self.industry_order if groupby_col == 'industry' else None
-            df_stat = df_stat.reindex(index=row_index, fill_value=0).fillna(0)
-            self._log("整体计划签约情况统计完成！")
-            # 指定时间段统计
-            df_stat_by_period = unified_stat_by_period_money(df_all_biz, df_contract_filterd, groupby_col)
-            self._log("指定时间段统计完成！")
-            # 指定月统计
-            df_stat_cur_month = unified_stat_by_period_money(df_all_biz, df_contract_filterd, groupby_col, by_month=True)
-            self._log("指定月统计完成！")
-            df_stat = df_stat.join([df_stat_by_period, df_stat_cur_month], how='outer').fillna(0)
-            # 统计随后三个月
-            current_month_fisrt_day  = pd.to_datetime(f"{self.stat_year.get()}-{self.stat_month.get()}-01")
-            for idx in range(1, 4):
-                start_dt = current_month_fisrt_day + pd.DateOffset(months=idx)
-                end_dt = start_dt + MonthEnd(1)
-                df_all_biz_filtered = df_all_biz[df_all_biz['date'].between(start_dt, end_dt)].copy()
-                df_stat = df_stat.join([unified_count_sum_fun(df_all_biz_filtered, groupby_col, f"{start_dt.month}月计划签约")], how='outer').fillna(0)
-            self._log("随后三月统计完成！")
+            # 整体计划签约情况
+            df_stat = df_merged.reindex(
+                index=row_index,
+                columns=["整体计划签约量", "整体计划签约金额", "整体百万以上计划签约量", "整体百万以上计划签约金额"]
+                ).fillna(0)
+            # 指定时间段、指定月
+            period_blocks = []
+            for prefix in ("peroid_", "month_"):
+                df_block = df_merged.reindex(index=row_index, columns=[prefix + col for col in period_stat_cols]).fillna(0)
+                df_block.columns = period_stat_cols
+                # 总计 = 百万以上+百万以下
+                df_block['计划签约量'] = df_block['百万以上计划签约量'] + df_block['百万以下计划签约量']
+                df_block['计划签约金额'] = df_block['百万以上计划签约金额'] + df_block['百万以下计划签约金额']
+                # 按指定顺序重新排布列索引，并给所有列名加前缀
+                period_blocks.append(df_block.reindex(columns=self.col_order).add_prefix(prefix))
+            df_stat = df_stat.join(period_blocks, how='outer').fillna(0)
+            # 随后三个月：不在通报顺序中的名称按外连接追加在末尾
+            for label in next_month_labels:
+                df_month = df_common.reindex(columns=[f"{label}量", f"{label}金额"]).dropna(how='all').sort_index()
+                df_stat = df_stat.join([df_month], how='outer').fillna(0)
 
-             # 计算[合计]行
+            # 计算[合计]行
             # to_frame将Series强行包装成二维DataFrame
             # pandas.core.series.Series
             # A    5
@@ -807,6 +1096,13 @@ class BizReportApp:
             df_total.index = [f"{'单位' if groupby_col == 'unit' else '行业' if groupby_col == 'industry' else ''}合计"]
             # 合并合计行 + 明细行
             df_final = pd.concat([df_total, df_stat], ignore_index=True, sort=False)
+            # 转签率 = 实际签约量 / 计划签约量，合计行按合计数计算，计划签约为0时置为"/"
+            for prefix in ("peroid_", "month_"):
+                if f"{prefix}转签率" not in df_final.columns:
+                    continue
+                df_plan, df_actual = df_final[f"{prefix}计划签约量"], df_final[f"{prefix}实际签约量"]
+                has_plan = df_plan != 0
+                df_final[f"{prefix}转签率"] = (df_actual / df_plan.where(has_plan)).astype(object).where(has_plan, "/")
 
             return df_final
         
@@ -824,30 +1120,49 @@ class BizReportApp:
             self._log("指定月商机top10筛选完成！")
             return df_top_10
 
-        def save_to_report_file(df_unit_stat, df_industry_stat, df_top_10, strict_mode: bool):
+        def write_block_to_sheet(ws, df, start_row, start_col, template_values=None):
             """
-            将统计结果进报告模板文件里并保存
-            @report_filepath 最终要填写的报告模板文件地址
-            @param df_unit 按单元维度统计的商机计划与签约信息
-            @param df_industry 按行业维度统计的商机计划与签约信息
-            @param df_top_10 指定月top10商机
+            将DataFrame按二维块写入模板，逐行取单元格直接赋值，不回读已写入的单元格
+            @param template_values: 不为None时，记录被覆盖单元格的模板原值 {(行, 列): 原值}，用于写下一个口径前还原
             """
-            def write_df_to_template_sheet(ws, df, start_row, start_col):
-                for row_idx, row_data in enumerate(df.itertuples(index=False, name=None)): # name=None不生产命名元组，直接返回普通元组
-                    for col_idx, cell_value in enumerate(row_data):
-                        target_row = start_row + row_idx
-                        target_col = start_col + col_idx
-                        target_cell = ws.cell(target_row, target_col)
-                        target_cell.value = cell_value
-                        # 处理转签率这一列，转签率总和列单独算，计划签约为0时，转签率置为"/"
-                        if col_idx == 6 or col_idx == 23:
-                            if ws.cell(target_row, target_col - 2).value == 0:
-                                target_cell.value = "/"
-                            else:
-                                target_cell.value = ws.cell(target_row, target_col - 1).value / ws.cell(target_row, target_col - 2).value
+            values = df.to_numpy(dtype=object).tolist()
+            if not values:
+                return
+            rows = ws.iter_rows(min_row=start_row, max_row=start_row + len(values) - 1, min_col=start_col, max_col=start_col + len(values[0]) - 1)
+            for row_cells, row_values in zip(rows, values):
+                for cell, cell_value in zip(row_cells, row_values):
+                    if template_values is not None:
+                        template_values.setdefault((cell.row, cell.column), cell.value)
+                    cell.value = cell_value
+
+        target_sheet_name = "1.有效商机转签情况"
+        # 定义三部分的起始位置，从1开始计数
+        write_config = {
+            # 单元维度
+            "unit": {
+                "start_row": 4,
+                "start_col": 2
+            },
+            # 行业维度
+            "industry": {
+                "start_row": 43,
+                "start_col": 2
+            },
+            # top10
+            "top_10": {
+                "start_row": 60,
+                "start_col": 1
+            }
+        }
 
+        def prepare_report_template(df_top_10):
+            """
+            加载通报模板（只解析一次），写入各口径共用的表头和指定月商机top10
+            @return: 模板workbook，加载失败时返回None
+            """
             self._log("开始加载通报模板...")
             self._update_status("生成报告")
+            start_time = time.perf_counter()
             try:
                 wb = openpyxl.load_workbook(
                     filename=self._report_template_filepath,
@@ -857,17 +1172,16 @@ class BizReportApp:
                 self._log(f"加载通报模板失败：\n{traceback.format_exc()}", "error")
                 self._update_status("报告生成失败")
                 messagebox.showerror("路径无效", f"无法加载通报模板！")
-                return False
+                return None
             
-            target_sheet_name = "1.有效商机转签情况"
             if target_sheet_name not in wb.sheetnames:
                 self._log(f"模板中未找到目标Sheet: {target_sheet_name}", "error")
                 self._update_status("报告生成失败")
                 messagebox.showerror("Sheet不存在", f"模板中未找到目标Sheet: {target_sheet_name}")
-                return False
+                return None
             
             ws = wb[target_sheet_name]
-            self._log(f"成功加载目标Sheet: {target_sheet_name}!")
+            self._log(f"成功加载目标Sheet: {target_sheet_name}! 耗时 {time.perf_counter() - start_time:.2f} 秒")
 
             # 更新表头
             period_st = pd.to_datetime(self.start_date.get())
@@ -889,68 +1203,46 @@ class BizReportApp:
                 ws.cell(41, 40 + col_offset).value = col_label
                 col_offset += 2
 
-            # 定义三部分的起始位置，从1开始计数
-            write_config = {
-                # 单元维度
-                "unit": {
-                    "start_row": 4,
-                    "start_col": 2
-                },
-                # 行业维度
-                "industry": {
-                    "start_row": 43,
-                    "start_col": 2
-                },
-                # top10
-                "top_10": {
-                    "start_row": 60,
-                    "start_col": 1
-                }
-            }
+            if not df_top_10.empty:
+                self._log("开始写入商机top10数据...")
+                write_block_to_sheet(ws, df_top_10, write_config['top_10']['start_row'], write_config['top_10']['start_col'])
+            else:
+                self._log("商机top10数据为空", "warning")
+            return wb
 
+        def save_to_report_file(wb, template_values, df_unit_stat, df_industry_stat, strict_mode: bool):
+            """
+            将统计结果写入报告模板并保存，同一个模板workbook依次用于各口径
+            @param wb 已写好表头和top10的模板workbook
+            @param template_values 上一个口径覆盖的单元格模板原值，写入前先还原，使每个口径都从同一份模板开始
+            @param df_unit 按单元维度统计的商机计划与签约信息
+            @param df_industry 按行业维度统计的商机计划与签约信息
+            """
+            start_time = time.perf_counter()
+            ws = wb[target_sheet_name]
+            for (row, col), value in template_values.items():
+                ws.cell(row, col).value = value
             # 写入指定位置
             if not df_unit_stat.empty:
                 self._log("开始写入单元维度统计数据...")
-                write_df_to_template_sheet(
-                    ws=ws,
-                    df=df_unit_stat,
-                    start_row=write_config['unit']['start_row'],
-                    start_col=write_config['unit']['start_col']
-                )
+                write_block_to_sheet(ws, df_unit_stat, write_config['unit']['start_row'], write_config['unit']['start_col'], template_values)
             else:
                 self._log("单元维度统计数据为空", "warning")
             if not df_industry_stat.empty:
                 self._log("开始写入行业维度统计数据...")
-                write_df_to_template_sheet(
-                    ws=ws,
-                    df=df_industry_stat,
-                    start_row=write_config['industry']['start_row'],
-                    start_col=write_config['industry']['start_col']
-                )
+                write_block_to_sheet(ws, df_industry_stat, write_config['industry']['start_row'], write_config['industry']['start_col'], template_values)
             else:
                 self._log("行业维度统计数据为空", "warning")
-            if not df_top_10.empty:
-                self._log("开始写入商机top10数据...")
-                write_df_to_template_sheet(
-                    ws=ws,
-                    df=df_top_10,
-                    start_row=write_config['top_10']['start_row'],
-                    start_col=write_config['top_10']['start_col']
-                )
-            else:
-                self._log("商机top10数据为空", "warning")
             # 保存文件
             filename = f"商机报告_{'窄口径' if strict_mode else '宽口径'}_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
             filepath = os.path.join(self.base_dir, filename)
             try:
                 wb.save(filepath)
-                wb.close()
-                self._log(f"报告已生成！文件保存至：\n{filepath}")
+                self._log(f"报告已生成！写入及保存耗时 {time.perf_counter() - start_time:.2f} 秒，文件保存至：\n{filepath}")
                 self._update_status("报告生成成功")
                 messagebox.showinfo("生成成功", f"报告已生成！文件保存至：\n{filepath}")
                 return True
             except Exception as e:
-                wb.close()
                 self._log(f"报告文件保存失败: \n{traceback.format_exc()}", "error")
                 self._update_status("报告生成失败")
                 messagebox.showerror("生成失败", f"报告生成失败：\n{str(e)}")
@@ -958,16 +1250,42 @@ class BizReportApp:
             
         # 3. 调用函数进行统计, 并保存结果到文件
         df_top_10 = filter_top_10(df_all_biz)
-        # 宽口径
-        if self.loose_mode.get():
-            df_loose_unit_stat = stat_standard_pipline(df_all_biz, df_contract_merged, groupby_col='unit', strict_mode=False)
-            df_loss_industry_stat = stat_standard_pipline(df_all_biz, df_contract_merged, groupby_col='industry', strict_mode=False)
-            if not save_to_report_file(df_loose_unit_stat, df_loss_industry_stat, df_top_10, strict_mode=False):
-                return
-        if self.strict_mode.get():
-            df_strict_unit_stat = stat_standard_pipline(df_all_biz, df_contract_merged, groupby_col='unit', strict_mode=True)
-            df_strict_industry_stat = stat_standard_pipline(df_all_biz, df_contract_merged, groupby_col='industry', strict_mode=True)
-            save_to_report_file(df_strict_unit_stat, df_strict_industry_stat, df_top_10, strict_mode=True)
+        # 所有口径、维度的计数与求和一次统计完成，再分别整理
+        strict_modes = [strict_mode for strict_mode, selected in ((False, self.loose_mode.get()), (True, self.strict_mode.get())) if selected]
+        self._log("正在统计计划签约与实际签约情况...")
+        df_facts, next_month_labels = collect_stat_facts(df_all_biz, df_contract_merged, strict_modes)
+        stat_tables = aggregate_stat_facts(df_facts)
+        self._log(f"统计完成！共 {len(df_facts)} 条统计明细")
+        # 模板只加载一次，各口径依次写入同一个workbook并另存，写入前还原上一个口径覆盖的单元格
+        if not strict_modes:
+            return
+        wb = prepare_report_template(df_top_10)
+        if wb is None:
+            return
+        template_values = {}
+        try:
+            for strict_mode in strict_modes:
+                df_unit_stat = assemble_stat(stat_tables, next_month_labels, groupby_col='unit', strict_mode=strict_mode)
+                df_industry_stat = assemble_stat(stat_tables, next_month_labels, groupby_col='industry', strict_mode=strict_mode)
+                if not save_to_report_file(wb, template_values, df_unit_stat, df_industry_stat, strict_mode=strict_mode):
+                    return
+        finally:
+            wb.close()
+
+    def _finish_prehandled_snapshot(self):
+        """等待后台保存预处理数据完成，汇报保存结果；保存失败不影响已生成的报告"""
+        if self._snapshot_writer is None:
+            return
+        writer, self._snapshot_writer = self._snapshot_writer, None
+        self._log("等待预处理后的数据保存完成...")
+        saved, failed = writer.finish()
+        for filepath in saved:
+            self._log(f"预处理后的数据文件已保存至: \n{filepath}")
+        if failed:
+            for filepath, e in failed:
+                self._log(f"保存预处理数据失败：{filepath}\n{''.join(traceback.format_exception(type(e), e, e.__traceback__))}", level="error")
+            self._update_status("保存预处理数据失败")
+            messagebox.showerror("失败", "保存预处理数据失败：\n" + "\n".join(f"{os.path.basename(filepath)}: {e}" for filepath, e in failed))
 
     def run_biz_analysis_workflow(self):
         try:
@@ -981,6 +1299,8 @@ class BizReportApp:
             self._log(f"执行统计流程出错：\n{traceback.format_exc()}", 'error')
             self._update_status("统计流程出错")
             messagebox.showerror("错误", f"执行统计流程出错：\n{str(e)}")
+        finally:
+            self._finish_prehandled_snapshot()
 
 if __name__ == "__main__":
     root = tk.Tk() # Tk()是创建一个Tkinter应用程序的主窗口对象，所有的组件都要放到这个主窗口上，
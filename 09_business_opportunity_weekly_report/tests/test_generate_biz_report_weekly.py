@@ -0,0 +1,178 @@
+import datetime
+import os
+import sys
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pytest
+
+pytest.importorskip("tkcalendar")
+pytest.importorskip("yaml")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import generate_biz_report_weekly as gbr
+
+# ---------- user-023 源数据缓存 ----------
+
+def sample_source_frame():
+    """覆盖_open_source_table读到的各类列：整数、浮点、日期时间、以及混有数字/空值/日期的文本列"""
+    return pd.DataFrame({
+        "商机编码": ["C1", "C2", None, "C4", "C5"],
+        "所属单元": ["雁塔分局", 12, 3.5, None, "长安 "],
+        "预计签约月份": [202604, 202605, 202606, 202607, 202608],
+        "预计签约金额": [100.5, 2000.0, np.nan, 0.0, 49.99],
+        "签约时间": pd.to_datetime(["2026-04-01", "2026-04-02", None, "2026-05-01", "2026-06-30"]),
+        "备注": ["x", datetime.datetime(2026, 4, 1, 8, 30), True, "", "长文本\n第二行"],
+    })
+
+def test_source_cache_round_trip_keeps_frame_and_dtypes(tmp_path):
+    source_path = tmp_path / "源.xlsx"
+    sample_source_frame().to_excel(source_path, sheet_name="清单", index=False)
+    expected = pd.read_excel(source_path, sheet_name="清单")
+
+    first = gbr.ParsedSheetCache(str(tmp_path / "cache")).read_excel(str(source_path), ["清单"])["清单"]
+    cache = gbr.ParsedSheetCache(str(tmp_path / "cache"))
+    cached = cache.read_excel(str(source_path), ["清单"])["清单"]
+
+    assert (cache.hits, cache.misses) == (1, 0)
+    pd.testing.assert_frame_equal(first, expected)
+    pd.testing.assert_frame_equal(cached, expected)
+    assert [type(value) for value in cached["备注"]] == [type(value) for value in expected["备注"]]
+
+def test_source_cache_rejects_modified_entry(tmp_path):
+    source_path = tmp_path / "源.xlsx"
+    sample_source_frame().to_excel(source_path, sheet_name="清单", index=False)
+    cache_dir = tmp_path / "cache"
+    expected = gbr.ParsedSheetCache(str(cache_dir)).read_excel(str(source_path), ["清单"])["清单"]
+
+    entry_path, = cache_dir.glob("*" + gbr.ParsedSheetCache.ENTRY_SUFFIX)
+    with open(entry_path, "ab") as f:
+        f.write(b"x")
+    cache = gbr.ParsedSheetCache(str(cache_dir))
+    reparsed = cache.read_excel(str(source_path), ["清单"])["清单"]
+
+    assert (cache.hits, cache.misses) == (0, 1)
+    pd.testing.assert_frame_equal(reparsed, expected)
+    assert gbr.ParsedSheetCache(str(cache_dir)).read_excel(str(source_path), ["清单"])["清单"].equals(expected)
+
+# ---------- user-025 通报模板只加载一次 ----------
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TARGET_SHEET = "1.有效商机转签情况"
+TEMPLATE_MARK = "模板原值"
+
+class Var:
+    """代替tk变量，只提供get/set"""
+    def __init__(self, value=None):
+        self.value = value
+    def get(self):
+        return self.value
+    def set(self, value):
+        self.value = value
+
+class MessageBoxRecorder:
+    def __init__(self):
+        self.calls = []
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, args))
+
+def write_report_inputs(input_dir):
+    """
+    生成源数据、映射表和通报模板：
+    统计月只有5条商机（top10不足10行），大部分单元时间段内无计划（转签率为"/"），
+    部分合同无对应商机编码（只计入宽口径）；模板的数据区预先填满占位值，残留的上一口径数据会与新模板不同
+    """
+    config = gbr.yaml.safe_load(open(os.path.join(REPO_DIR, "reference", "config.yaml"), encoding="utf-8"))
+    units, industries = config["unit_order"][:4], [name.replace("事业部", "") for name in config["industry_order"][:3]]
+    with pd.ExcelWriter(input_dir / "单元_行业名称映射表.xlsx") as writer:
+        for sheet_name, names in (("单元", config["unit_order"]), ("行业", config["industry_order"])):
+            pd.DataFrame([["映射表"]]).to_excel(writer, sheet_name=sheet_name, index=False, header=False)
+            pd.DataFrame({"清单底表": [name.replace("事业部", "") for name in names], "通报模板": names}).to_excel(writer, sheet_name=sheet_name, index=False, startrow=1)
+
+    above_cols, below_cols = config["above_million"]["required_cols"], config["below_million"]["required_cols"]
+    contract_cols, code_cols = config["contract_status"]["required_cols"], config["biz_code"]["required_cols"]
+    above = pd.DataFrame([
+        ["A1", units[0], industries[0], 202604, 300.0, "是", "大项目1"],
+        ["A2", units[1], industries[1], 202604, 1200.0, "否", "大项目2"],
+        ["A3", units[0], industries[2], 202604, 150.5, "是", "大项目3"],
+        ["A4", units[2], industries[0], 202606, 800.0, "否", "大项目4"],
+    ], columns=above_cols)
+    below = pd.DataFrame([
+        ["B1", units[0], industries[0], "2026-04-03", 30.0, "小项目1"],
+        ["B2", units[1], industries[1], "2026-04-20", 75.0, "小项目2"],
+        ["B3", units[3], industries[2], "2026-05-08", 20.0, "小项目3"],
+    ], columns=below_cols)
+    contract = pd.DataFrame([
+        ["B1", units[0], industries[0], "2026-04-10", 300000],
+        ["A2", units[1], industries[1], "2026-04-15", 12000000],
+        ["X1", units[2], industries[2], "2026-04-18", 600000],
+        ["X2", units[3], industries[0], "2026-04-28", 2000000],
+    ], columns=contract_cols)
+    biz_code = pd.DataFrame([["A1", "2026-04-01"], ["A2", "2026-04-01"], ["B1", "2026-04-03"], ["B2", "2026-04-20"]], columns=code_cols)
+    files = {}
+    for key, df in (("above_million", above), ("below_million", below), ("contract_status", contract), ("biz_code", biz_code)):
+        files[key] = str(input_dir / f"{config[key]['workbook_name']}.xlsx")
+        df.to_excel(files[key], sheet_name=config[key]["sheet_name"], index=False)
+
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = TARGET_SHEET
+    for row in range(1, 71):
+        for col in range(1, 51):
+            ws.cell(row, col).value = f"{TEMPLATE_MARK}{row}-{col}"
+    wb.create_sheet("说明").append(["模板说明"])
+    wb.save(input_dir / "通报模板.xlsx")
+    return files
+
+def run_report(monkeypatch, input_dir, files, base_dir, loose, strict):
+    """按给定口径跑一次生成流程，返回 {口径: {sheet名: {(行, 列): 值}}}"""
+    monkeypatch.setattr(gbr, "messagebox", MessageBoxRecorder())
+    base_dir.mkdir()
+    app = gbr.BizReportApp.__new__(gbr.BizReportApp)
+    app.biz_above_million_filepath = Var(files["above_million"])
+    app.biz_below_million_filepath = Var(files["below_million"])
+    app.contract_status_filepath = Var(files["contract_status"])
+    app.biz_code_filepath = Var(files["biz_code"])
+    app.start_date, app.end_date = Var("2026-04-01"), Var("2026-04-30")
+    app.stat_year, app.stat_month = Var("2026"), Var("04")
+    app.loose_mode, app.strict_mode = Var(loose), Var(strict)
+    app.base_dir = str(base_dir)
+    app.config_filepath = os.path.join(REPO_DIR, "reference", "config.yaml")
+    app.unit_industry_map_filepath = str(input_dir / "单元_行业名称映射表.xlsx")
+    app._report_template_filepath = str(input_dir / "通报模板.xlsx")
+    app.logger = gbr.logging.getLogger("test_generate_biz_report_weekly")
+    app._log = lambda message, level="info": None
+    app._update_status = lambda message: None
+    app.use_source_cache = Var(False)
+    app.source_cache = gbr.ParsedSheetCache(str(base_dir / "源数据缓存"))
+    app._snapshot_writer = None
+    app._load_config()
+    app.run_biz_analysis_workflow()
+
+    reports = {}
+    for report_path in base_dir.glob("商机报告_*.xlsx"):
+        wb = openpyxl.load_workbook(report_path)
+        reports["窄口径" if "窄口径" in report_path.name else "宽口径"] = {
+            ws.title: {(cell.row, cell.column): cell.value for row in ws.iter_rows() for cell in row if cell.value is not None}
+            for ws in wb.worksheets
+        }
+    return reports
+
+def test_reports_from_shared_template_match_fresh_template(tmp_path, monkeypatch):
+    input_dir = tmp_path / "input"
+    input_dir.mkdir()
+    files = write_report_inputs(input_dir)
+
+    both = run_report(monkeypatch, input_dir, files, tmp_path / "both", loose=True, strict=True)
+    loose_only = run_report(monkeypatch, input_dir, files, tmp_path / "loose", loose=True, strict=False)
+    strict_only = run_report(monkeypatch, input_dir, files, tmp_path / "strict", loose=False, strict=True)
+
+    assert set(both) == {"宽口径", "窄口径"}
+    assert both["宽口径"] == loose_only["宽口径"]
+    assert both["窄口径"] == strict_only["窄口径"]
+    # 两个口径确有不同的单元格，且覆盖了top10不足10行、转签率为"/"的情况
+    loose_cells, strict_cells = both["宽口径"][TARGET_SHEET], both["窄口径"][TARGET_SHEET]
+    assert any(loose_cells[key] != strict_cells[key] for key in loose_cells)
+    assert strict_cells[(64, 1)] != f"{TEMPLATE_MARK}64-1" and strict_cells[(65, 1)] == f"{TEMPLATE_MARK}65-1"
+    assert "/" in strict_cells.values()